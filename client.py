@@ -1,6 +1,7 @@
 ﻿import streamlit as st
 import requests
 import json
+import html
 from datetime import datetime, timedelta
 import pandas as pd
 from io import BytesIO
@@ -11,6 +12,7 @@ from streamlit_calendar import calendar
 import streamlit.components.v1 as components
 from datetime import datetime, timezone
 import time
+from urllib.parse import urlencode
 
 # Колірна палітра з еталонного зображення
 COLORS = {
@@ -253,6 +255,17 @@ st.markdown(f"""
 
 # Константи
 API_URL = "http://localhost:5000"
+SEARCH_PAGE_SIZE = 20
+COMMENT_THREADS_PAGE_SIZE = 20
+RECURRENCE_LABELS = {
+    "": "Не повторюється",
+    "DAILY": "Щодня",
+    "WEEKLY": "Щотижня",
+    "MONTHLY": "Щомісяця"
+}
+WEEKDAY_LABELS = {
+    "MO": "Пн", "TU": "Вт", "WE": "Ср", "TH": "Чт", "FR": "Пт", "SA": "Сб", "SU": "Нд"
+}
 ROLES = {
     'specialist': 'Спеціаліст',
     'manager': 'Менеджер',
@@ -423,16 +436,21 @@ def show_register_page():
                 except Exception as e:
                     st.error(f"Помилка реєстрації: {str(e)}")
 
+def get_users_by_role(role, query=''):
+    """Користувачі ролі: пошук на сервері, якщо задано запит, інакше повний список"""
+    if query:
+        response = api_client.get("/users/search?" + urlencode({'q': query, 'role': role, 'limit': 50}))
+    else:
+        response = api_client.get(f"/users?role={role}")
+    return response.json() if response.status_code == 200 else None
+
 def show_admin_panel():
     st.title("Панель адміністратора")
     
-    response = api_client.get("/users")
-    if response.status_code == 200:
-        users = response.json()
-        
-        managers = [u for u in users if u['role'] == 'manager']
-        specialists = [u for u in users if u['role'] == 'specialist']
-        
+    query = st.text_input("🔍 Пошук за ім'ям або email", key="admin_user_search").strip()
+    managers = get_users_by_role('manager', query)
+    specialists = get_users_by_role('specialist', query)
+    if managers is not None and specialists is not None:
         tab1, tab2 = st.tabs(["Менеджери", "Спеціалісти"])
         
         with tab1:
@@ -451,7 +469,7 @@ def show_admin_panel():
                     with col2:
                         if st.button("❌ Видалити", key=f"delete_manager_{manager['id']}"):
                             response = api_client.delete(f"/users/{manager['id']}")
-                            if response.status_code == 200:
+                            if response.status_code == 202:
                                 st.success("Менеджера видалено")
                                 st.rerun()
                             else:
@@ -473,7 +491,7 @@ def show_admin_panel():
                     with col2:
                         if st.button("❌ Видалити", key=f"delete_specialist_{specialist['id']}"):
                             response = api_client.delete(f"/users/{specialist['id']}")
-                            if response.status_code == 200:
+                            if response.status_code == 202:
                                 st.success("Спеціаліста видалено")
                                 st.rerun()
                             else:
@@ -525,6 +543,12 @@ def show_project_info(project):
         </div>
     """, unsafe_allow_html=True)
     
+    if project.get('in_archive'):
+        st.info("📦 Проєкт перенесено в архів: дані доступні лише для читання")
+        if st.session_state.user['role'] in ['manager', 'admin']:
+            if st.button("Відновити з архіву", key=f"restore_{project['id']}"):
+                restore_project(project)
+    
     # Відображення статистики проекту
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -533,6 +557,9 @@ def show_project_info(project):
         st.metric("Завдань", project.get('total_tasks', 0))
     with col3:
         st.metric("Завершено", project.get('completed_tasks', 0))
+    
+    with st.expander("Статистика прогресу"):
+        show_project_statistics(project['id'])
 
 def show_performance_evaluation(project_id):
     st.header("📚 Оцінка виконання")
@@ -755,7 +782,9 @@ def show_notifications_popup():
                 st.markdown(f"""
                     <div class="notification-card {'unread' if not notification['is_read'] else ''}">
                         <h4>{notification['title']}</h4>
-                        <p>{notification['message']}</p>
+                        <p>{notification['message']}{
+                            f" <strong>та ще {notification['count'] - 1}</strong>" if notification.get('count', 1) > 1 else ''
+                        }</p>
                         <small>{notification['created_at']}</small>
                     </div>
                 """, unsafe_allow_html=True)
@@ -766,35 +795,65 @@ def show_notifications_popup():
                         st.rerun()
 
 # Покращені функції для роботи з проєктами
-def get_project_statistics(project_id):
+def get_project_statistics(project_id, date_from=None, date_to=None):
     """Отримання статистики по проєкту"""
-    response = api_client.get(f"/projects/{project_id}/statistics")
+    endpoint = f"/projects/{project_id}/statistics"
+    if date_from and date_to:
+        endpoint += f"?from={date_from.isoformat()}&to={date_to.isoformat()}"
+    response = api_client.get(endpoint)
     if response.status_code == 200:
         return response.json()
     return None
 
 def show_project_statistics(project_id):
     """Відображення статистики проєкту"""
-    stats = get_project_statistics(project_id)
+    col1, col2 = st.columns(2)
+    with col1:
+        date_from = st.date_input("З", datetime.now().date() - timedelta(days=30), key=f"stats_from_{project_id}")
+    with col2:
+        date_to = st.date_input("По", datetime.now().date(), key=f"stats_to_{project_id}")
+    
+    stats = get_project_statistics(project_id, date_from, date_to)
     if not stats:
         return
     
+    basic_info = stats['basic_info']
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Учасників", stats['members_count'])
+        st.metric("Учасників", basic_info['members_count'])
     
     with col2:
-        st.metric("Виконано завдань", f"{stats['completed_tasks']}/{stats['total_tasks']}")
+        st.metric("Виконано завдань", f"{basic_info['completed_tasks']}/{basic_info['total_tasks']}")
     
     with col3:
-        st.metric("Середня оцінка", f"{stats['average_rating']:.1f}")
+        average_rating = basic_info['average_rating']
+        st.metric("Середня оцінка", f"{average_rating:.1f}" if average_rating is not None else "—")
+    
+    # Графік прогресу за щоденними знімками
+    if stats['progress_history']:
+        progress_data = pd.DataFrame(stats['progress_history'])
+        fig = px.area(progress_data, x='date', y=['completed', 'in_progress', 'not_started'],
+                      title='Прогрес виконання проєкту')
+        st.plotly_chart(fig)
+    else:
+        st.info("Немає даних про прогрес за обраний період")
     
-    # Графік прогресу
-    progress_data = pd.DataFrame(stats['progress_history'])
-    fig = px.line(progress_data, x='date', y='completion_rate', 
-                  title='Прогрес виконання проєкту')
-    st.plotly_chart(fig)
+    # Коли команда працює: дні тижня x години за місцевим часом
+    tz_offset = int(datetime.now().astimezone().utcoffset().total_seconds() // 3600)
+    response = api_client.get(f"/projects/{project_id}/activity/heatmap?days=90&tz={tz_offset}")
+    if response.status_code == 200:
+        heatmap = response.json()
+        if heatmap['total']:
+            fig = px.imshow(
+                heatmap['weekday_hour'],
+                x=[f"{hour:02d}" for hour in range(24)],
+                y=heatmap['weekdays'],
+                labels={'x': 'Година', 'y': 'День', 'color': 'Дій'},
+                title='Активність команди за 90 днів',
+                color_continuous_scale='Purples'
+            )
+            st.plotly_chart(fig)
 
 def show_projects():
     st.title("Проєкти")
@@ -854,16 +913,70 @@ def show_projects():
         del st.session_state.error_message
 
 
+# Локальний кеш даних проєкту, що оновлюється дельтами з /changes
+SYNCED_COLLECTIONS = {
+    'task': 'tasks'
+}
+
+def load_project_collections(project_id):
+    """Повне завантаження колекцій проєкту та курсору журналу змін"""
+    cursor_response = api_client.get(f"/changes?project_id={project_id}")
+    if cursor_response.status_code != 200:
+        return None
+    cache = {'cursor': cursor_response.json()['cursor']}
+    for collection in SYNCED_COLLECTIONS.values():
+        response = api_client.get(f"/projects/{project_id}/{collection}")
+        if response.status_code != 200:
+            return None
+        cache[collection] = {item['id']: item for item in response.json()}
+    return cache
+
+def sync_project_cache(project_id):
+    """Повертає кеш проєкту, застосувавши зміни з моменту останньої синхронізації"""
+    if 'project_cache' not in st.session_state:
+        st.session_state.project_cache = {}
+    cache = st.session_state.project_cache.get(project_id)
+    
+    while cache is not None:
+        response = api_client.get(f"/changes?since={cache['cursor']}&project_id={project_id}")
+        if response.status_code != 200:
+            # Курсор застарів або сталася помилка - перезавантажуємо повністю
+            cache = None
+            break
+        feed = response.json()
+        for change in feed['changes']:
+            collection = SYNCED_COLLECTIONS.get(change['entity_type'])
+            if not collection:
+                continue
+            if change['operation'] == 'delete':
+                cache[collection].pop(change['entity_id'], None)
+            elif change['data']:
+                cache[collection][change['entity_id']] = change['data']
+        cache['cursor'] = feed['cursor']
+        if not feed['has_more']:
+            break
+    
+    if cache is None:
+        cache = load_project_collections(project_id)
+    st.session_state.project_cache[project_id] = cache
+    return cache
+
 def show_kanban_board(project_id):
     st.header("Завдання")
     
-    # Отримання всіх завдань
-    response = api_client.get(f"/projects/{project_id}/tasks")
-    if response.status_code == 200:
-        tasks = response.json()
+    # Завдання з локального кешу, синхронізованого через журнал змін
+    cache = sync_project_cache(project_id)
+    if cache:
+        tasks = sorted(cache['tasks'].values(), key=lambda t: t['created_at'] or '', reverse=True)
         
         # Додавання нового завдання (тільки для менеджера)
         if st.session_state.user['role'] == 'manager':
+            members_response = api_client.get(f"/projects/{project_id}/members")
+            if members_response.status_code == 200:
+                st.session_state.project_members = members_response.json()
+            specialist_names = {
+                m['id']: m['name'] for m in st.session_state.project_members if m['role'] == 'specialist'
+            }
             with st.expander("Додати нове завдання"):
                 with st.form("new_task_form"):
                     title = st.text_input("Назва завдання")
@@ -871,8 +984,8 @@ def show_kanban_board(project_id):
                     deadline = st.date_input("Дедлайн")
                     assigned_to = st.selectbox(
                         "Призначити спеціалісту",
-                        options=[m['id'] for m in st.session_state.project_members if m['role'] == 'specialist'],
-                        format_func=lambda x: next(m['name'] for m in st.session_state.project_members if m['id'] == x)
+                        options=list(specialist_names),
+                        format_func=specialist_names.get
                     )
                     
                     if st.form_submit_button("Створити"):
@@ -914,11 +1027,21 @@ def show_task_column(tasks, status, project_id):
                     if st.button("→ Завершено", key=f"complete_{task['id']}"):
                         update_task_status(project_id, task['id'], "completed")
 
+def calendar_window(month):
+    """Межі запиту подій для місячної сітки календаря (разом з сусідніми тижнями)"""
+    first_day = month.replace(day=1)
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    return first_day - timedelta(days=7), next_month + timedelta(days=14)
+
 def show_calendar(project_id):
     st.header("📅 Календар")
     
-    # Отримання подій
-    response = api_client.get(f"/projects/{project_id}/calendar")
+    # Завантажуємо лише події видимого місяця
+    month = st.date_input("Місяць", value=datetime.now().date(), key=f"calendar_month_{project_id}")
+    date_from, date_to = calendar_window(month)
+    response = api_client.get(
+        f"/projects/{project_id}/calendar?from={date_from.isoformat()}&to={date_to.isoformat()}"
+    )
     if response.status_code == 200:
         events = response.json()
         
@@ -945,23 +1068,57 @@ def show_calendar(project_id):
                         end_date = st.date_input("Дата завершення")
                         end_time = st.time_input("Час завершення")
                     
+                    frequency = st.selectbox(
+                        "Повторення",
+                        ["", "DAILY", "WEEKLY", "MONTHLY"],
+                        format_func=lambda x: RECURRENCE_LABELS[x]
+                    )
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        weekdays = st.multiselect(
+                            "Дні тижня (для щотижневих)",
+                            list(WEEKDAY_LABELS),
+                            format_func=lambda x: WEEKDAY_LABELS[x]
+                        )
+                    with col2:
+                        repeat_until = st.date_input("Повторювати до", value=None)
+                    
                     if st.form_submit_button("Додати"):
                         start_datetime = datetime.combine(start_date, start_time)
                         end_datetime = datetime.combine(end_date, end_time)
                         
+                        recurrence = None
+                        if frequency:
+                            recurrence = f"FREQ={frequency}"
+                            if frequency == "WEEKLY" and weekdays:
+                                recurrence += ";BYDAY=" + ",".join(weekdays)
+                            if repeat_until:
+                                recurrence += f";UNTIL={repeat_until.isoformat()}T23:59:59"
+                        
                         response = api_client.post(f"/projects/{project_id}/calendar", {
                             "title": title,
                             "description": description,
                             "event_type": event_type,
                             "start_time": start_datetime.isoformat(),
-                            "end_time": end_datetime.isoformat()
+                            "end_time": end_datetime.isoformat(),
+                            "recurrence": recurrence
                         })
                         
                         if response.status_code == 201:
                             st.session_state.show_success_message = True
                             st.session_state.success_message = "Подію успішно додано!"
+                            # Подію створено, але учасники вже зайняті в цей час
+                            for conflict in response.json().get('conflicts', []):
+                                st.warning(
+                                    f"Перетин з подією «{conflict['title']}» ({conflict['project_name']}), "
+                                    f"{conflict['start_time']} – {conflict['end_time']}: "
+                                    f"{', '.join(conflict['members'])}"
+                                )
                         else:
                             st.error("Помилка при додаванні події")
+            
+            with st.expander("Знайти вільний час"):
+                show_free_slots(project_id)
 
         try:
             # Форматування подій для календаря
@@ -991,6 +1148,7 @@ def show_calendar(project_id):
                     "right": "dayGridMonth,timeGridWeek,timeGridDay"
                 },
                 "initialView": "dayGridMonth",
+                "initialDate": month.isoformat(),
                 "selectable": True,
                 "editable": False,
                 "dayMaxEvents": True,
@@ -1005,12 +1163,15 @@ def show_calendar(project_id):
                 calendar(
                     events=calendar_events,
                     options=calendar_options,
-                    key=f"calendar_{project_id}"  # Унікальний ключ для кожного проекту
+                    key=f"calendar_{project_id}_{month:%Y%m}"  # Унікальний ключ для кожного проекту і місяця
                 )
 
         except Exception as e:
             st.error(f"Помилка при відображенні календаря: {str(e)}")
 
+        with st.expander("Підписатися на календар"):
+            show_calendar_subscription('project', project_id)
+
         # Показ списку подій
         st.subheader("Список подій")
         for event in sorted(events, key=lambda x: x['start_time']):
@@ -1029,6 +1190,109 @@ def show_calendar(project_id):
                     </div>
                 """, unsafe_allow_html=True)
 
+def show_free_slots(project_id):
+    """Спільні вільні проміжки учасників проєкту"""
+    with st.form(f"free_slots_form_{project_id}"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            date_from = st.date_input("З", value=datetime.now().date())
+        with col2:
+            date_to = st.date_input("По", value=datetime.now().date() + timedelta(days=7))
+        with col3:
+            duration = st.number_input("Тривалість, хв", min_value=15, value=60, step=15)
+        submitted = st.form_submit_button("Знайти")
+    
+    if submitted:
+        response = api_client.get(
+            f"/projects/{project_id}/calendar/free-slots?" + urlencode({
+                'from': date_from.isoformat(),
+                'to': (date_to + timedelta(days=1)).isoformat(),
+                'duration': duration
+            })
+        )
+        if response.status_code == 200:
+            slots = response.json()['slots']
+            if not slots:
+                st.info("Спільного вільного часу не знайдено")
+            for slot in slots:
+                st.write(f"🟢 {slot['start']} – {slot['end']}")
+        else:
+            st.error(response.json().get('message', "Помилка пошуку вільного часу"))
+
+def show_my_calendar():
+    st.title("📅 Мій календар")
+    
+    month = st.date_input("Місяць", value=datetime.now().date(), key="my_calendar_month")
+    date_from, date_to = calendar_window(month)
+    response = api_client.get(f"/calendar?from={date_from.isoformat()}&to={date_to.isoformat()}")
+    if response.status_code != 200:
+        st.error("Помилка при завантаженні календаря")
+        return
+    
+    events = response.json()
+    calendar(
+        events=[{
+            'id': str(event['id']),
+            'title': f"{event['project_name']}: {event['title']}",
+            'start': event['start_time'],
+            'end': event['end_time'],
+            'backgroundColor': {
+                'meeting': '#4CAF50',
+                'deadline': '#f44336',
+                'other': '#2196F3'
+            }.get(event['event_type'], '#9E9E9E')
+        } for event in events],
+        options={
+            "headerToolbar": {
+                "left": "",
+                "center": "title",
+                "right": "dayGridMonth,timeGridWeek,listMonth"
+            },
+            "initialView": "dayGridMonth",
+            "initialDate": month.isoformat(),
+            "editable": False,
+            "dayMaxEvents": True,
+            "locale": "uk"
+        },
+        key=f"my_calendar_{month:%Y%m}"
+    )
+    
+    if not events:
+        st.info("У цьому місяці подій немає")
+    
+    with st.expander("Підписатися на календар"):
+        show_calendar_subscription('user', st.session_state.user['id'])
+
+def show_calendar_subscription(scope, target_id):
+    """Посилання на фід .ics з окремим токеном, що дає лише перегляд цього календаря"""
+    st.caption("Додайте це посилання у Google Calendar, Outlook чи інший календар. "
+               "Воно дає доступ лише до перегляду цього календаря і діє, доки його не відкликано")
+    key = f"feed_url_{scope}_{target_id}"
+    if st.button("Створити посилання", key=f"create_{key}"):
+        response = api_client.post(f"/{scope}s/{target_id}/calendar/feed-tokens", {})
+        if response.status_code == 201:
+            st.session_state[key] = f"{API_URL}{response.json()['path']}"
+        else:
+            st.error(response.json().get('message', "Помилка при створенні посилання"))
+    if st.session_state.get(key):
+        st.code(st.session_state[key])
+        st.caption("Скопіюйте посилання зараз - повторно воно не показується")
+    
+    response = api_client.get("/calendar/feed-tokens")
+    if response.status_code == 200:
+        tokens = [token for token in response.json()
+                  if token['scope'] == scope and token['target_id'] == target_id]
+        for token in tokens:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.write(f"Посилання від {token['created_at']}, "
+                         f"останнє використання: {token['last_used_at'] or 'ще не використовувалось'}")
+            with col2:
+                if st.button("Відкликати", key=f"revoke_feed_{token['id']}"):
+                    api_client.delete(f"/calendar/feed-tokens/{token['id']}")
+                    st.session_state.pop(key, None)
+                    st.rerun()
+
 def create_project():
     st.title("Створення нового проєкту")
     
@@ -1089,21 +1353,57 @@ def show_comments(project_id):
                 else:
                     st.error("Помилка при додаванні коментаря")
     
-    # Відображення коментарів
-    response = api_client.get(f"/projects/{project_id}/comments")
+    # Відображення гілок обговорення посторінково
+    pages_key = f"comment_threads_{project_id}"
+    if pages_key not in st.session_state:
+        st.session_state[pages_key] = COMMENT_THREADS_PAGE_SIZE
+    
+    response = api_client.get(
+        f"/projects/{project_id}/comments?threaded=1&limit={st.session_state[pages_key]}"
+    )
     if response.status_code == 200:
-        comments = response.json()
-        for comment in comments:
-            st.markdown(f"""
-                <div class="comment-card">
-                    <strong>{comment['author_name']}</strong>
-                    <small>{comment['timestamp']}</small>
-                    <p>{comment['content']}</p>
-                </div>
-            """, unsafe_allow_html=True)
+        result = response.json()
+        for comment in result['threads']:
+            show_comment_thread(project_id, comment, 0)
+        
+        if result['has_more'] and st.button("Показати ще обговорення"):
+            st.session_state[pages_key] += COMMENT_THREADS_PAGE_SIZE
+            st.rerun()
     else:
         st.error("Помилка при завантаженні коментарів")
 
+def show_comment_thread(project_id, comment, depth):
+    """Рекурсивне відображення коментаря з відповідями"""
+    st.markdown(f"""
+        <div class="comment-card" style="margin-left: {depth * 30}px">
+            <strong>{comment['author_name']}</strong>
+            <small>{comment['timestamp']}</small>
+            <p>{comment['content']}</p>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    if st.session_state.user['role'] != 'admin':
+        with st.expander("Відповісти"):
+            with st.form(f"reply_form_{comment['id']}"):
+                reply_text = st.text_area("Відповідь")
+                if st.form_submit_button("Надіслати"):
+                    create_comment(project_id, reply_text, parent_id=comment['id'])
+    
+    replies = comment['replies']
+    loaded_key = f"comment_replies_{comment['id']}"
+    if loaded_key in st.session_state:
+        replies = st.session_state[loaded_key]
+    elif comment['has_more_replies']:
+        # Глибокі відповіді догружаються лише на запит
+        if st.button(f"Показати відповіді ({comment['reply_count']})", key=f"more_replies_{comment['id']}"):
+            response = api_client.get(f"/comments/{comment['id']}/replies")
+            if response.status_code == 200:
+                st.session_state[loaded_key] = response.json()['replies']
+                st.rerun()
+    
+    for reply in replies:
+        show_comment_thread(project_id, reply, depth + 1)
+
 def show_files(project_id):
     st.header("Файли")
     
@@ -1133,6 +1433,60 @@ def show_files(project_id):
                     download_file(file['id'])
 
 # Допоміжні функції
+def show_search():
+    st.title("🔍 Пошук")
+    
+    query = st.text_input("Пошуковий запит", key="search_query")
+    types = st.multiselect(
+        "Де шукати",
+        ["task", "comment", "project", "file"],
+        default=["task", "comment", "project", "file"],
+        format_func=lambda x: {
+            "task": "Завдання",
+            "comment": "Коментарі",
+            "project": "Проєкти",
+            "file": "Файли"
+        }[x]
+    )
+    if not query or not types:
+        return
+    
+    if 'search_offset' not in st.session_state or st.session_state.get('search_last') != (query, tuple(types)):
+        st.session_state.search_offset = 0
+        st.session_state.search_last = (query, tuple(types))
+    
+    response = api_client.get("/search?" + urlencode({
+        'q': query,
+        'type': ','.join(types),
+        'limit': SEARCH_PAGE_SIZE,
+        'offset': st.session_state.search_offset
+    }))
+    if response.status_code != 200:
+        st.error(response.json().get('message', 'Помилка пошуку'))
+        return
+    
+    result = response.json()
+    if not result['results']:
+        st.info("Нічого не знайдено")
+    for item in result['results']:
+        st.markdown(f"""
+            <div class="comment-card">
+                <strong>{html.escape(item['title'] or item['type'])}</strong>
+                <small>Проєкт #{item['project_id']}</small>
+                <p>{item['snippet']}</p>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.session_state.search_offset > 0 and st.button("← Попередні"):
+            st.session_state.search_offset = max(0, st.session_state.search_offset - SEARCH_PAGE_SIZE)
+            st.rerun()
+    with col2:
+        if result['has_more'] and st.button("Наступні →"):
+            st.session_state.search_offset += SEARCH_PAGE_SIZE
+            st.rerun()
+
 def set_current_project(project):
     st.session_state.current_project = project
     st.session_state.current_page = 'project_details'
@@ -1149,12 +1503,21 @@ def join_project(project_id):
 def delete_project(project_id):
     if st.session_state.user['role'] == 'admin':
         response = api_client.delete(f"/projects/{project_id}")
-        if response.status_code == 200:
+        if response.status_code == 202:
             st.success("Проект видалено!")
             st.rerun()
         else:
             st.error("Помилка при видаленні проекту")
 
+def restore_project(project):
+    response = api_client.post(f"/projects/{project['id']}/restore", {})
+    if response.status_code == 200:
+        st.session_state.current_project = {**project, 'in_archive': False}
+        st.success("Проєкт відновлено з архіву!")
+        st.rerun()
+    else:
+        st.error(response.json().get('message', "Помилка при відновленні проєкту"))
+
 def create_task(project_id, title, description, deadline, assigned_to):
     response = api_client.post(f"/projects/{project_id}/tasks", {
         "title": title,
@@ -1191,9 +1554,10 @@ def create_event(project_id, title, description, event_type, start_date, end_dat
     else:
         st.error("Помилка при створенні події")
 
-def create_comment(project_id, content):
+def create_comment(project_id, content, parent_id=None):
     response = api_client.post(f"/projects/{project_id}/comments", {
-        "content": content
+        "content": content,
+        "parent_id": parent_id
     })
     if response.status_code == 201:
         st.success("Коментар додано!")
@@ -1244,6 +1608,8 @@ def main():
             """, unsafe_allow_html=True)
             
             st.button("Проєкти", on_click=lambda: setattr(st.session_state, 'current_page', 'projects'))
+            st.button("Пошук", on_click=lambda: setattr(st.session_state, 'current_page', 'search'))
+            st.button("Мій календар", on_click=lambda: setattr(st.session_state, 'current_page', 'my_calendar'))
             
             if st.session_state.user['role'] == 'admin':
                 st.button("Користувачі", on_click=lambda: setattr(st.session_state, 'current_page', 'admin_panel'))
@@ -1262,6 +1628,10 @@ def main():
             show_project_details()
         elif st.session_state.current_page == 'admin_panel':
             show_admin_panel()
+        elif st.session_state.current_page == 'search':
+            show_search()
+        elif st.session_state.current_page == 'my_calendar':
+            show_my_calendar()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
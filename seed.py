@@ -19,6 +19,7 @@ fake = Faker('uk_UA')  # Використовуємо українську ло
 
 # Шлях до бази даних
 DB_PATH = 'project_management.db'
+ARCHIVE_DB_PATH = 'project_archive.db'  # архівна БД проєктів, яку підключає сервер
 
 # Створення директорії для файлів
 UPLOAD_DIR = 'files'
@@ -64,6 +65,31 @@ def clear_database():
         except sqlite3.Error:
             pass
     
+    # Місячні партиції активності, їхні підсумки та службові таблиці (створюються сервером)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'user_activity_[0-9]*'")
+    for (partition,) in cursor.fetchall():
+        cursor.execute(f'DROP TABLE {partition}')
+        cursor.execute('DELETE FROM sqlite_sequence WHERE name = ?', (partition,))
+    for table in ('activity_partitions', 'activity_daily', 'activity_hourly', 'archived_projects', 'purge_jobs',
+                  'calendar_feed_tokens', 'project_progress_snapshots',
+                  'change_log'):
+        try:
+            cursor.execute(f'DELETE FROM {table}')
+        except sqlite3.Error:
+            pass
+    
+    # Архівні рядки інакше приєдналися б до нових проєктів з тими самими id
+    if os.path.exists(ARCHIVE_DB_PATH):
+        archive = sqlite3.connect(ARCHIVE_DB_PATH)
+        archive_tables = archive.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        for (table,) in archive_tables:
+            archive.execute(f'DELETE FROM {table}')
+        archive.commit()
+        archive.close()
+        logger.info("Очищено архівну БД проєктів")
+    
     # Включення перевірки зовнішніх ключів
     cursor.execute('PRAGMA foreign_keys = ON')
     
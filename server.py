@@ -1,13 +1,36 @@
-﻿from flask import Flask, request, jsonify, send_file
+﻿from flask import Flask, request, jsonify, send_file, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import jwt
 from datetime import datetime, timedelta, timezone
-from functools import wraps
+from functools import lru_cache, wraps
+from contextlib import contextmanager
 import os
+import glob
+import json
+import html
+import re
 from werkzeug.utils import secure_filename
 import logging
+import logging.handlers
+import threading
+import time
+import uuid
+import heapq
+import hashlib
+import secrets
+import bisect
+import sys
+import cProfile
+import pstats
+from collections import Counter, OrderedDict, defaultdict, deque, namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy теплові карти рахуються звичайним циклом
+    np = None
 
 
 
@@ -21,14 +44,145 @@ app = Flask(__name__)
 CORS(app)
 app.config['SECRET_KEY'] = 'your-secret-key'  # В продакшені використовувати безпечний ключ
 app.config['UPLOAD_FOLDER'] = 'files'
+app.config['CACHE_ENABLED'] = True
+app.config['CACHE_BACKEND'] = 'memory'  # 'memory' або 'sqlite' для спільного кешу між воркерами
+app.config['CACHE_DB_PATH'] = 'cache.db'
+app.config['CACHE_MAX_ENTRIES'] = 1024
+app.config['CACHE_TTL_SECONDS'] = 60
+app.config['BACKGROUND_JOBS'] = True
+app.config['INVALIDATION_POLL_INTERVAL'] = 0.5  # максимальна затримка поширення змін між воркерами, с
+app.config['CHANGE_LOG_RETENTION_DAYS'] = 7
+app.config['NOTIFICATION_SWEEP_INTERVAL'] = 600  # с
+app.config['NOTIFICATION_SWEEP_BATCH'] = 500
+app.config['NOTIFICATION_ARCHIVE'] = True  # переносити видалені сповіщення в notifications_archive
+# Скільки днів зберігати прочитані сповіщення за типом
+app.config['NOTIFICATION_RETENTION_DAYS'] = {
+    'deadline_reminder': 7,
+    'task_updated': 14
+}
+app.config['NOTIFICATION_DEFAULT_RETENTION_DAYS'] = 30
+app.config['NOTIFICATION_DIGEST_WINDOW'] = 3600  # с; однотипні сповіщення у вікні зливаються в один запис
+app.config['ACTIVITY_RETENTION_MONTHS'] = 12  # скільки місячних партицій активності тримати в основній БД
+app.config['ACTIVITY_ARCHIVE_PATH'] = 'activity_archive.db'  # None - старі партиції просто видаляються
+app.config['PROJECT_ARCHIVE_PATH'] = 'project_archive.db'  # холодне сховище даних архівних і завершених проєктів
+app.config['PROJECT_ARCHIVE_IDLE_DAYS'] = 30  # скільки днів без активності проєкт лишається в основній БД
+app.config['SQLITE_STATEMENT_CACHE'] = 256  # підготовлених виразів на з'єднання: реєстр і вбудовані запити маршрутів
+app.config['QUERY_STATS_SAMPLES'] = 1024  # останніх вимірів на запит для перцентилів
+app.config['QUERY_STATS_MAX_STATEMENTS'] = 2000  # решта різних текстів SQL рахується як '<other>'
+app.config['SLOW_QUERY_MS'] = 100  # запити, довші за поріг (виконання + вибірка), пишуться в журнал; None - вимкнено
+app.config['SLOW_QUERY_LOG'] = 'slow_queries.log'  # кожен воркер пише свій файл: slow_queries.<pid>.log
+app.config['SLOW_QUERY_LOG_MAX_BYTES'] = 5 * 1024 * 1024
+app.config['SLOW_QUERY_LOG_BACKUPS'] = 3
+app.config['METRICS_ENABLED'] = True
+# Якщо задано, /metrics вимагає заголовок Authorization: Bearer <токен>; без токена /metrics віддається
+# лише запитам з localhost (за зворотним проксі на тому ж хості токен обов'язковий)
+app.config['METRICS_TOKEN'] = None
+app.config['METRICS_LATENCY_BUCKETS'] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # с
+app.config['METRICS_SIZE_BUCKETS'] = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)  # байти
+app.config['TRACING_ENABLED'] = True
+app.config['TRACE_EXPORT_MIN_MS'] = 250  # у файл пишуться лише запити, довші за поріг; 0 - усі
+app.config['TRACE_MAX_SPANS'] = 2000  # на запит; решта лише рахується в атрибуті trace.dropped_spans
+app.config['TRACE_LOG'] = 'traces.jsonl'  # OTLP JSON, по одному запиту на рядок; файл на воркер: traces.<pid>.jsonl
+app.config['TRACE_LOG_MAX_BYTES'] = 20 * 1024 * 1024
+app.config['TRACE_LOG_BACKUPS'] = 3
+app.config['PROFILER_OUTPUT_DIR'] = 'profiles'
+app.config['PROFILER_INTERVAL'] = 0.005  # с між знімками стеків у режимі sample
+app.config['PROFILER_MAX_SECONDS'] = 300  # профайлер вимикається сам не пізніше цього часу
+app.config['PROFILER_MAX_REQUESTS'] = 1000  # межа для режиму cprofile
+app.config['PURGE_INTERVAL'] = 5  # с між перевірками черги видалення
+app.config['PURGE_BATCH'] = 500  # рядків за транзакцію; між пакетами блокування запису звільняється
+app.config['PURGE_STALE_SECONDS'] = 60  # завдання без прогресу стільки секунд вважається покинутим і відновлюється
 
 # Константи
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx', 'xls', 'xlsx'}
 TOKEN_EXPIRE_HOURS = 24
+PROGRESS_HISTORY_DAYS = 30
+# Таблиці, рядки яких переносяться в архівну БД разом із проєктом.
+# Сповіщення лишаються в основній БД: скринька користувача не прив'язана до проєкту й архів не читає
+PROJECT_ARCHIVE_TABLES = ('tasks', 'comments', 'files')
+PROJECT_ARCHIVE_STATUSES = ('archived', 'completed')
+# Маршрути, що лишаються доступними для запису проєкту в архіві
+PROJECT_ARCHIVE_WRITABLE = {'update_project', 'delete_project', 'restore_project'}
+# Кроки фонового очищення видалених сутностей:
+# (таблиця, колонка зв'язку, тип сутності для журналу змін, колонка id сутності).
+# Рядки проєкту в архівній БД прибирає discard_project_archive, а рядки користувача - кроки archive.*
+PURGE_STEPS = {
+    'project': (
+        ('project_members', 'project_id', None, None),
+        ('tasks', 'project_id', None, None),
+        ('calendar_events', 'project_id', None, None),
+        ('comments', 'project_id', None, None),
+        ('files', 'project_id', None, None),
+        ('notifications', 'project_id', None, None),
+        ('ratings', 'project_id', None, None),
+        ('project_progress_snapshots', 'project_id', None, None),
+        ('calendar_spans', 'project_id', None, None),
+        ('activity_daily', 'project_id', None, None),
+        ('activity_hourly', 'project_id', None, None),
+    ),
+    'user': (
+        ('project_members', 'user_id', 'member', 'user_id'),
+        ('tasks', 'assigned_to', 'task', 'id'),
+        ('comments', 'user_id', 'comment', 'id'),
+        ('archive.tasks', 'assigned_to', 'task', 'id'),
+        ('archive.comments', 'user_id', 'comment', 'id'),
+        ('archive.user_activity', 'user_id', None, None),
+        ('notifications', 'user_id', None, None),
+        ('calendar_feed_tokens', 'user_id', None, None),
+    ),
+}
+# Таблиці WITHOUT ROWID кластеризовані за project_id і видаляються одним діапазоном ключа
+PURGE_RANGE_TABLES = ('project_progress_snapshots', 'calendar_spans', 'activity_daily', 'activity_hourly')
+# Типи сутностей, зміни яких віддаються клієнтам через /changes
+FEED_ENTITY_TYPES = ('project', 'member', 'task', 'comment', 'calendar_event', 'file')
+# Таблиці та колонки, що індексуються для повнотекстового пошуку
+FTS_INDEXES = {
+    'tasks': ('title', 'description'),
+    'comments': ('content',),
+    'projects': ('name', 'description'),
+    'files': ('filename',),
+    'users': ('name', 'email')
+}
+FTS_DEFAULT_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+# Користувачів шукаємо за триграмами, щоб знаходити збіги в середині імені чи email
+FTS_OPTIONS = {
+    'users': "tokenize='trigram'"
+}
+USER_SEARCH_LIMIT = 10
+SEARCH_PAGE_SIZE = 20
+COMMENT_THREADS_PAGE_SIZE = 20
+COMMENT_THREAD_DEPTH = 3
+COMMENT_THREAD_MAX_DEPTH = 10
+# Правила повторення подій календаря у стилі RRULE
+RECURRENCE_FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+RECURRENCE_WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+RECURRENCE_MAX_OCCURRENCES = 500  # максимум повторень однієї події в одному вікні
+RECURRENCE_CACHE_TTL = 3600
+CONFLICT_CHECK_DAYS = 90  # горизонт перевірки конфліктів для повторюваних подій
+FREE_SLOTS_MAX_DAYS = 31
+FREE_SLOT_MINUTES = 30
+WORKDAY_START = '09:00'
+WORKDAY_END = '18:00'
+ICS_HISTORY_DAYS = 90  # минулі події, що ще потрапляють у фід .ics
+ICS_CACHE_TTL = 300
+DEADLINE_REMINDER_DAYS = (3, 1, 0)  # за скільки днів до дедлайну надсилати нагадування
+DEADLINE_REMINDER_HOUR = 9
+DEADLINE_SCHEDULER_MAX_SLEEP = 60
+# Типи масових сповіщень, що зливаються в дайджест для одержувача та проєкту
+NOTIFICATION_DIGEST_TYPES = ('new_file', 'new_task', 'new_event', 'new_member', 'project_update', 'task_updated')
+# Теплові карти активності: період за замовчуванням і підписи днів тижня (від понеділка)
+HEATMAP_DAYS = 90
+HEATMAP_WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Нд')
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def ensure_column(c, table, column, definition):
+    # Додає колонку до таблиці, створеної попередньою версією схеми
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in c.fetchall()}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 def init_db():
     conn = sqlite3.connect('project_management.db')
     c = conn.cursor()
@@ -90,9 +244,23 @@ def init_db():
                   end_time DATETIME NOT NULL,
                   created_by INTEGER,
                   recurrence TEXT,
+                  recurrence_end DATETIME,
                   FOREIGN KEY (project_id) REFERENCES projects (id),
                   FOREIGN KEY (created_by) REFERENCES users (id))''')
     
+    # Токени підписки на фіди .ics: лише читання одного календаря, діють до відкликання
+    c.execute('''CREATE TABLE IF NOT EXISTS calendar_feed_tokens
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL,
+                  scope TEXT NOT NULL CHECK(scope IN ('project', 'user')),
+                  target_id INTEGER NOT NULL,
+                  token_hash TEXT UNIQUE NOT NULL,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  last_used_at DATETIME,
+                  revoked_at DATETIME,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_calendar_feed_tokens_user ON calendar_feed_tokens (user_id)')
+    
     # Таблиця сповіщень
     c.execute('''CREATE TABLE IF NOT EXISTS notifications
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -104,6 +272,8 @@ def init_db():
                   is_read BOOLEAN DEFAULT 0,
                   priority TEXT DEFAULT 'normal' CHECK(priority IN ('low', 'normal', 'high')),
                   expiry_date DATETIME,
+                  count INTEGER NOT NULL DEFAULT 1,
+                  digest_bucket TEXT,
                   FOREIGN KEY (user_id) REFERENCES users (id),
                   FOREIGN KEY (project_id) REFERENCES projects (id))''')
     
@@ -157,99 +327,2624 @@ def init_db():
                   FOREIGN KEY (user_id) REFERENCES users (id),
                   FOREIGN KEY (project_id) REFERENCES projects (id))''')
     
+    # Щоденні знімки прогресу проєктів (кількість завдань за статусами)
+    c.execute('''CREATE TABLE IF NOT EXISTS project_progress_snapshots
+                 (project_id INTEGER NOT NULL,
+                  snapshot_date DATE NOT NULL,
+                  not_started INTEGER DEFAULT 0,
+                  in_progress INTEGER DEFAULT 0,
+                  completed INTEGER DEFAULT 0,
+                  PRIMARY KEY (project_id, snapshot_date),
+                  FOREIGN KEY (project_id) REFERENCES projects (id)) WITHOUT ROWID''')
+    
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_project_status ON tasks (project_id, status)')
+
+    # Попередньо агреговані показники користувачів, підтримуються тригерами
+    c.execute('''CREATE TABLE IF NOT EXISTS user_stats
+                 (user_id INTEGER PRIMARY KEY,
+                  projects_count INTEGER DEFAULT 0,
+                  total_tasks INTEGER DEFAULT 0,
+                  completed_tasks INTEGER DEFAULT 0,
+                  ratings_count INTEGER DEFAULT 0,
+                  ratings_sum REAL DEFAULT 0,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_project_members_user ON project_members (user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_assigned_status ON tasks (assigned_to, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ratings_specialist ON ratings (specialist_id, project_id)')
+
+    c.executescript('''
+        CREATE TRIGGER IF NOT EXISTS user_stats_user_insert AFTER INSERT ON users
+        BEGIN
+            INSERT OR IGNORE INTO user_stats (user_id) VALUES (NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_user_delete AFTER DELETE ON users
+        BEGIN
+            DELETE FROM user_stats WHERE user_id = OLD.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_member_insert AFTER INSERT ON project_members
+        BEGIN
+            INSERT INTO user_stats (user_id, projects_count) VALUES (NEW.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET projects_count = projects_count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_member_delete AFTER DELETE ON project_members
+        BEGIN
+            UPDATE user_stats SET projects_count = projects_count - 1 WHERE user_id = OLD.user_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_task_insert AFTER INSERT ON tasks
+        WHEN NEW.assigned_to IS NOT NULL
+        BEGIN
+            INSERT INTO user_stats (user_id, total_tasks, completed_tasks)
+            VALUES (NEW.assigned_to, 1, NEW.status = 'completed')
+            ON CONFLICT(user_id) DO UPDATE SET
+                total_tasks = total_tasks + 1,
+                completed_tasks = completed_tasks + (NEW.status = 'completed');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_task_delete AFTER DELETE ON tasks
+        WHEN OLD.assigned_to IS NOT NULL
+        BEGIN
+            UPDATE user_stats SET
+                total_tasks = total_tasks - 1,
+                completed_tasks = completed_tasks - (OLD.status = 'completed')
+            WHERE user_id = OLD.assigned_to;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_task_update AFTER UPDATE OF assigned_to, status ON tasks
+        BEGIN
+            UPDATE user_stats SET
+                total_tasks = total_tasks - 1,
+                completed_tasks = completed_tasks - (OLD.status = 'completed')
+            WHERE user_id = OLD.assigned_to;
+            INSERT INTO user_stats (user_id, total_tasks, completed_tasks)
+            SELECT NEW.assigned_to, 1, NEW.status = 'completed'
+            WHERE NEW.assigned_to IS NOT NULL
+            ON CONFLICT(user_id) DO UPDATE SET
+                total_tasks = total_tasks + 1,
+                completed_tasks = completed_tasks + (NEW.status = 'completed');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_rating_insert AFTER INSERT ON ratings
+        WHEN NEW.rating IS NOT NULL
+        BEGIN
+            INSERT INTO user_stats (user_id, ratings_count, ratings_sum) VALUES (NEW.specialist_id, 1, NEW.rating)
+            ON CONFLICT(user_id) DO UPDATE SET
+                ratings_count = ratings_count + 1,
+                ratings_sum = ratings_sum + NEW.rating;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_rating_delete AFTER DELETE ON ratings
+        WHEN OLD.rating IS NOT NULL
+        BEGIN
+            UPDATE user_stats SET
+                ratings_count = ratings_count - 1,
+                ratings_sum = ratings_sum - OLD.rating
+            WHERE user_id = OLD.specialist_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_rating_update AFTER UPDATE OF specialist_id, rating ON ratings
+        BEGIN
+            UPDATE user_stats SET
+                ratings_count = ratings_count - 1,
+                ratings_sum = ratings_sum - OLD.rating
+            WHERE user_id = OLD.specialist_id AND OLD.rating IS NOT NULL;
+            INSERT INTO user_stats (user_id, ratings_count, ratings_sum)
+            SELECT NEW.specialist_id, 1, NEW.rating
+            WHERE NEW.rating IS NOT NULL
+            ON CONFLICT(user_id) DO UPDATE SET
+                ratings_count = ratings_count + 1,
+                ratings_sum = ratings_sum + NEW.rating;
+        END;
+    ''')
+
+    # Журнал змін, який читають усі процеси-воркери для інвалідації кешів
+    c.execute('''CREATE TABLE IF NOT EXISTS change_log
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  entity_type TEXT NOT NULL,
+                  entity_id INTEGER,
+                  project_id INTEGER,
+                  operation TEXT NOT NULL DEFAULT 'update' CHECK(operation IN ('insert', 'update', 'delete')),
+                  data TEXT,
+                  tags TEXT,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log (created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_project ON change_log (project_id, id)')
+    
+    # Повнотекстові індекси FTS5 з зовнішнім вмістом, синхронізовані тригерами
+    for table, columns in FTS_INDEXES.items():
+        fts = f'{table}_fts'
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        is_new = c.fetchone() is None
+        cols = ', '.join(columns)
+        new_values = ', '.join(f'new.{col}' for col in columns)
+        old_values = ', '.join(f'old.{col}' for col in columns)
+        c.executescript(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                {FTS_OPTIONS.get(table, FTS_DEFAULT_OPTIONS)}
+            );
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_values});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_values});
+            END;
+        ''')
+        if is_new:
+            c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    
+    c.execute('CREATE INDEX IF NOT EXISTS idx_comments_project_parent ON comments (project_id, parent_id, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_comments_parent ON comments (parent_id, timestamp)')
+    
+    # Префіксний пошук коротких запитів та фільтр за роллю
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_name_nocase ON users (name COLLATE NOCASE)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users (email COLLATE NOCASE)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)')
+    
+    # Майбутні дедлайни завантажуються планувальником нагадувань один раз під час старту
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_open_deadline ON tasks (deadline) WHERE status != 'completed'")
+    
+    # Індекси для пакетного прибирання прострочених і старих прочитаних сповіщень
+    c.execute('CREATE INDEX IF NOT EXISTS idx_notifications_expiry ON notifications (expiry_date) WHERE expiry_date IS NOT NULL')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_notifications_read_type ON notifications (type, created_at) WHERE is_read = 1')
+    c.execute('''CREATE TABLE IF NOT EXISTS notifications_archive
+                 (id INTEGER PRIMARY KEY,
+                  user_id INTEGER,
+                  project_id INTEGER,
+                  type TEXT NOT NULL,
+                  message TEXT NOT NULL,
+                  created_at DATETIME,
+                  is_read BOOLEAN,
+                  priority TEXT,
+                  expiry_date DATETIME,
+                  count INTEGER NOT NULL DEFAULT 1,
+                  archived_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # Дайджести: одне непрочитане сповіщення на одержувача, проєкт, тип і часове вікно
+    ensure_column(c, 'notifications', 'count', 'INTEGER NOT NULL DEFAULT 1')
+    ensure_column(c, 'notifications', 'digest_bucket', 'TEXT')
+    ensure_column(c, 'notifications_archive', 'count', 'INTEGER NOT NULL DEFAULT 1')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_digest
+                 ON notifications (user_id, project_id, type, digest_bucket)
+                 WHERE digest_bucket IS NOT NULL AND is_read = 0''')
+    c.execute('''CREATE TABLE IF NOT EXISTS deadline_reminders_sent
+                 (entity_type TEXT NOT NULL,
+                  entity_id INTEGER NOT NULL,
+                  deadline DATE NOT NULL,
+                  days_before INTEGER NOT NULL,
+                  sent_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  PRIMARY KEY (entity_type, entity_id, deadline, days_before)) WITHOUT ROWID''')
+    
+    # Час подій зберігається як 'YYYY-MM-DD HH:MM:SS', щоб діапазони порівнювались як рядки
+    c.execute("""
+        UPDATE calendar_events SET start_time = datetime(start_time), end_time = datetime(end_time)
+        WHERE (start_time != datetime(start_time) OR end_time != datetime(end_time))
+          AND datetime(start_time) IS NOT NULL AND datetime(end_time) IS NOT NULL
+    """)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_calendar_events_range ON calendar_events (project_id, start_time, end_time)')
+    
+    # Повторювані події шукаються окремо: серія триває до recurrence_end (NULL - без кінця)
+    ensure_column(c, 'calendar_events', 'recurrence_end', 'DATETIME')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_calendar_events_recurring
+                 ON calendar_events (project_id, start_time) WHERE recurrence IS NOT NULL''')
+    
+    # Найдовша подія проєкту обмежує нижню межу діапазону по start_time
+    c.execute('''CREATE TABLE IF NOT EXISTS calendar_spans
+                 (project_id INTEGER PRIMARY KEY,
+                  max_span INTEGER NOT NULL DEFAULT 0,
+                  FOREIGN KEY (project_id) REFERENCES projects (id)) WITHOUT ROWID''')
+    
+    c.executescript('''
+        CREATE TRIGGER IF NOT EXISTS calendar_spans_insert AFTER INSERT ON calendar_events
+        BEGIN
+            INSERT INTO calendar_spans (project_id, max_span)
+            VALUES (NEW.project_id, MAX(0, strftime('%s', NEW.end_time) - strftime('%s', NEW.start_time)))
+            ON CONFLICT(project_id) DO UPDATE SET max_span = MAX(max_span, excluded.max_span);
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS calendar_spans_update AFTER UPDATE OF project_id, start_time, end_time ON calendar_events
+        BEGIN
+            INSERT INTO calendar_spans (project_id, max_span)
+            VALUES (NEW.project_id, MAX(0, strftime('%s', NEW.end_time) - strftime('%s', NEW.start_time)))
+            ON CONFLICT(project_id) DO UPDATE SET max_span = MAX(max_span, excluded.max_span);
+        END;
+    ''')
+    
+    # Видалення подій не зменшує межу, тому точне значення перераховується під час старту
+    c.execute("""
+        INSERT OR REPLACE INTO calendar_spans (project_id, max_span)
+        SELECT project_id, MAX(0, MAX(strftime('%s', end_time) - strftime('%s', start_time)))
+        FROM calendar_events
+        WHERE project_id IS NOT NULL
+        GROUP BY project_id
+    """)
+    
+    # Заповнюємо агрегати для бази, створеної до появи тригерів
+    c.execute("SELECT COUNT(*) FROM user_stats")
+    if c.fetchone()[0] == 0:
+        rebuild_user_stats(c)
+    
+    # Активність зберігається в місячних партиціях user_activity_YYYYMM, перелічених у реєстрі
+    c.execute('''CREATE TABLE IF NOT EXISTS activity_partitions
+                 (month TEXT PRIMARY KEY,
+                  table_name TEXT NOT NULL,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  archived_at DATETIME) WITHOUT ROWID''')
+    # Щоденні підсумки за типом дії переживають архівування партицій; project_id = 0 - без проєкту
+    c.execute('''CREATE TABLE IF NOT EXISTS activity_daily
+                 (day DATE NOT NULL,
+                  project_id INTEGER NOT NULL,
+                  action_type TEXT NOT NULL,
+                  count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (project_id, day, action_type)) WITHOUT ROWID''')
+    # Погодинні підсумки за користувачем, проєктом і типом дії для теплових карт
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_hourly'")
+    hourly_is_new = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS activity_hourly
+                 (project_id INTEGER NOT NULL,
+                  hour TEXT NOT NULL,
+                  user_id INTEGER NOT NULL,
+                  action_type TEXT NOT NULL,
+                  count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (project_id, hour, user_id, action_type)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_activity_hourly_user ON activity_hourly (user_id, hour)')
+    
+    # Повторне створення наявних партицій додає тригери, що з'явилися в новіших версіях
+    c.execute("SELECT month, table_name FROM activity_partitions WHERE archived_at IS NULL")
+    for month, table in c.fetchall():
+        create_activity_partition(c, month)
+        if hourly_is_new:
+            c.execute(f"""
+                INSERT INTO activity_hourly (project_id, hour, user_id, action_type, count)
+                SELECT COALESCE(project_id, 0), strftime('%Y-%m-%d %H:00', timestamp), COALESCE(user_id, 0),
+                       action_type, COUNT(*)
+                FROM {table}
+                WHERE timestamp IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT(project_id, hour, user_id, action_type) DO UPDATE SET count = count + excluded.count
+            """)
+    
+    # Старі записи та рядки, вставлені напряму (наприклад, seed.py), переносяться в партиції
+    migrate_legacy_activity(c)
+    
+    # Видалення: сутність одразу позначається deleted_at, пов'язані рядки прибирає фонова черга
+    ensure_column(c, 'projects', 'deleted_at', 'DATETIME')
+    ensure_column(c, 'users', 'deleted_at', 'DATETIME')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_projects_deleted ON projects (id) WHERE deleted_at IS NOT NULL')
+    c.execute('''CREATE TABLE IF NOT EXISTS purge_jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  entity_type TEXT NOT NULL CHECK(entity_type IN ('project', 'user')),
+                  entity_id INTEGER NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'running', 'done')),
+                  step TEXT,
+                  rows_deleted INTEGER NOT NULL DEFAULT 0,
+                  files_deleted INTEGER NOT NULL DEFAULT 0,
+                  error TEXT,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  finished_at DATETIME)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_purge_jobs_status ON purge_jobs (status, updated_at)')
+    
+    # Проєкти, дані яких перенесено в архівну БД
+    c.execute('''CREATE TABLE IF NOT EXISTS archived_projects
+                 (project_id INTEGER PRIMARY KEY,
+                  archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  rows_moved INTEGER NOT NULL DEFAULT 0,
+                  FOREIGN KEY (project_id) REFERENCES projects (id))''')
+
+    conn.commit()
+    
+    # ATTACH неможливий усередині транзакції, тому схема архіву синхронізується після commit
+    attach_project_archive(conn)
+    init_project_archive(c)
     conn.commit()
     conn.close()
 
-def get_db():
-    conn = sqlite3.connect('project_management.db')
+# Реєстр іменованих запитів: незмінний текст SQL готується один раз на з'єднання
+# (кеш підготовлених виразів sqlite3), а статистика групується за назвою
+QUERIES = {
+    'user_by_id': "SELECT * FROM users WHERE id = ? AND deleted_at IS NULL",
+    'user_by_email': "SELECT * FROM users WHERE email = ? AND deleted_at IS NULL",
+    'project_state': """
+        SELECT deleted_at IS NOT NULL AS deleted,
+               EXISTS (SELECT 1 FROM archived_projects a WHERE a.project_id = p.id) AS archived
+        FROM projects p WHERE p.id = ?
+    """,
+    'project_manager': "SELECT manager_id FROM projects WHERE id = ?",
+    'project_member_ids': "SELECT user_id FROM project_members WHERE project_id = ?",
+    'activity_partitions_live': "SELECT table_name FROM activity_partitions WHERE archived_at IS NULL ORDER BY month DESC",
+    'notification_upsert': """
+        INSERT INTO notifications (user_id, project_id, type, message, priority, expiry_date, digest_bucket)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, project_id, type, digest_bucket) WHERE digest_bucket IS NOT NULL AND is_read = 0
+        DO UPDATE SET
+            count = count + 1,
+            message = excluded.message,
+            created_at = CURRENT_TIMESTAMP,
+            expiry_date = excluded.expiry_date,
+            priority = CASE WHEN excluded.priority = 'high' THEN 'high' ELSE priority END
+    """,
+    # Оновлення з фіксованим текстом: незмінні поля передаються з прапорцем set_* = 0
+    'project_update': """
+        UPDATE projects SET
+            name = CASE WHEN :set_name THEN :name ELSE name END,
+            description = CASE WHEN :set_description THEN :description ELSE description END,
+            deadline = CASE WHEN :set_deadline THEN :deadline ELSE deadline END,
+            status = CASE WHEN :set_status THEN :status ELSE status END
+        WHERE id = :id
+    """,
+    'project_tasks': """
+        SELECT t.*, u.name as assigned_user_name
+        FROM tasks t
+        LEFT JOIN users u ON t.assigned_to = u.id
+        WHERE t.project_id = ?
+        ORDER BY t.created_at DESC
+    """,
+    'task_for_update': """
+        SELECT t.*, p.manager_id
+        FROM tasks t
+        JOIN projects p ON t.project_id = p.id
+        WHERE t.id = ? AND t.project_id = ?
+    """,
+    'task_update': """
+        UPDATE tasks SET
+            title = CASE WHEN :set_title THEN :title ELSE title END,
+            description = CASE WHEN :set_description THEN :description ELSE description END,
+            status = CASE WHEN :set_status THEN :status ELSE status END,
+            assigned_to = CASE WHEN :set_assigned_to THEN :assigned_to ELSE assigned_to END,
+            priority = CASE WHEN :set_priority THEN :priority ELSE priority END,
+            deadline = CASE WHEN :set_deadline THEN :deadline ELSE deadline END
+        WHERE id = :id AND project_id = :project_id
+    """
+}
+QUERY_NAMES = {sql: name for name, sql in QUERIES.items()}
+
+def run_query(c, name, params=()):
+    return c.execute(QUERIES[name], params)
+
+def update_params(name, data, fields, **keys):
+    # Параметри фіксованого UPDATE з реєстру: змінюються лише поля з fields, решта передається з set_* = 0
+    params = dict(keys)
+    for field in re.findall(r':set_(\w+)', QUERIES[name]):
+        params[f'set_{field}'] = field in fields
+        params[field] = data.get(field) if field in fields else None
+    return params
+
+QUERY_NORMALIZATION = (
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'user_activity_\d{6}'), 'user_activity_{month}'),
+    (re.compile(r'\?(?:\s*,\s*\?)+'), '?, ...'),
+    (re.compile(r'\bsp\d+\b'), 'sp{n}')
+)
+
+@lru_cache(maxsize=4096)
+def statement_key(sql):
+    # Назва з реєстру або нормалізований текст: партиції та списки IN (?, ?, ...) не плодять окремих записів
+    name = QUERY_NAMES.get(sql)
+    if name:
+        return name
+    for pattern, replacement in QUERY_NORMALIZATION:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+class QueryStats:
+    """Кількість викликів, час (виконання та вибірка) і рядки для кожного запиту"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+
+    def record(self, sql, elapsed, rows):
+        key = statement_key(sql)
+        with self.lock:
+            entry = self.statements.get(key)
+            if entry is None:
+                if len(self.statements) >= app.config['QUERY_STATS_MAX_STATEMENTS']:
+                    key = '<other>'
+                entry = self.statements.setdefault(key, {
+                    'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0,
+                    'samples': deque(maxlen=app.config['QUERY_STATS_SAMPLES'])
+                })
+            entry['calls'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['rows'] += rows
+            entry['samples'].append(elapsed)
+
+    def stats(self, sort='total_ms', limit=50):
+        with self.lock:
+            entries = [(key, dict(entry, samples=sorted(entry['samples']))) for key, entry in self.statements.items()]
+        result = []
+        for key, entry in entries:
+            samples = entry['samples']
+            percentile = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+            result.append({
+                'name': key if key in QUERIES else None,
+                'sql': QUERIES.get(key, key),
+                'calls': entry['calls'],
+                'rows': entry['rows'],
+                'total_ms': entry['total'] * 1000,
+                'mean_ms': entry['total'] / entry['calls'] * 1000,
+                'p50_ms': percentile(0.5),
+                'p95_ms': percentile(0.95),
+                'p99_ms': percentile(0.99),
+                'max_ms': entry['max'] * 1000
+            })
+        result.sort(key=lambda item: item[sort], reverse=True)
+        return result[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+
+query_stats = QueryStats()
+
+def param_shapes(params):
+    # Типи та довжини параметрів без самих значень
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f'{type(value).__name__}({len(value)})'
+        return type(value).__name__
+    if isinstance(params, dict):
+        return {name: shape(value) for name, value in params.items()}
+    return [shape(value) for value in params]
+
+class JsonLinesLog:
+    """Локальний журнал JSON lines з ротацією; шлях і розміри беруться з app.config[<key>], <key>_MAX_BYTES, <key>_BACKUPS.
+    
+    RotatingFileHandler не можна ділити між процесами, тому кожен воркер пише власний файл
+    з pid у назві, а tail зводить поточні файли всіх воркерів за часом запису.
+    """
+
+    def __init__(self, config_key, time_key):
+        self.config_key = config_key
+        self.time_key = time_key  # entry -> значення для впорядкування записів різних воркерів
+        self.lock = threading.Lock()
+        self.handler = None
+        self.pid = None
+
+    def path(self, pid):
+        root, ext = os.path.splitext(app.config[self.config_key])
+        return f'{root}.{pid}{ext}'
+
+    def paths(self):
+        # Поточні файли всіх воркерів; ротовані копії (.1, .2, ...) не читаються
+        root, ext = os.path.splitext(app.config[self.config_key])
+        return glob.glob(f'{glob.escape(root)}.*{glob.escape(ext)}')
+
+    def write(self, entry):
+        # Обробник використовується напряму, без логера, щоб рівні й logging.disable не впливали на запис
+        with self.lock:
+            # Файл створюється при першому записі, а не при імпорті модуля; після fork - новий файл дочірнього процесу
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.handler = logging.handlers.RotatingFileHandler(
+                    self.path(self.pid), maxBytes=app.config[f'{self.config_key}_MAX_BYTES'],
+                    backupCount=app.config[f'{self.config_key}_BACKUPS'], encoding='utf-8')
+            handler = self.handler
+        handler.handle(logging.makeLogRecord({'msg': json.dumps(entry, ensure_ascii=False, default=str)}))
+
+    def read(self, path, match):
+        # Обірваний або пошкоджений рядок (збій посеред запису) пропускається, а не ламає весь перегляд
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if match is None or match(entry):
+                            yield self.time_key(entry), entry
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        continue
+        except FileNotFoundError:
+            return
+
+    def tail(self, limit, match=None):
+        # Останні записи поточних файлів усіх воркерів, новіші першими
+        entries = []
+        for path in self.paths():
+            entries.extend(deque(self.read(path, match), maxlen=limit))
+        return [entry for _, entry in heapq.nlargest(limit, entries, key=lambda item: item[0])]
+
+class SlowQueryLog:
+    """Журнал повільних запитів з планом виконання, знятим у момент запиту"""
+
+    def __init__(self):
+        self.log = JsonLinesLog('SLOW_QUERY_LOG', lambda entry: entry['time'])
+
+    def explain(self, conn, sql, params):
+        # Окремий звичайний курсор, щоб EXPLAIN не потрапляв у статистику й журнал
+        try:
+            rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error:
+            return None
+        depth = {0: -1}
+        plan = []
+        for row in rows:
+            depth[row[0]] = depth.get(row[1], -1) + 1
+            plan.append('  ' * depth[row[0]] + row[3])
+        return plan
+
+    def capture(self, conn, sql, params, elapsed, rows):
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'duration_ms': round(elapsed * 1000, 3),
+            'route': request.endpoint if has_request_context() else threading.current_thread().name,
+            'sql': ' '.join(sql.split()),
+            'params': param_shapes(params),
+            'rows': rows,
+            'plan': self.explain(conn, sql, params)
+        }
+        self.log.write(entry)
+
+    def recent(self, limit, route=None):
+        return self.log.tail(limit, (lambda entry: entry['route'] == route) if route else None)
+
+slow_query_log = SlowQueryLog()
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, що вимірює виконання запиту разом із вибіркою його рядків"""
+    pending = None
+
+    def execute(self, sql, params=()):
+        self.finish()
+        started = time.time_ns()
+        start = time.perf_counter()
+        result = super().execute(sql, params)
+        self.begin(sql, params, started, time.perf_counter() - start)
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        self.finish()
+        # Для плану й форми параметрів достатньо першого набору
+        seq_of_params = list(seq_of_params)
+        started = time.time_ns()
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_params)
+        self.begin(sql, seq_of_params[0] if seq_of_params else (), started, time.perf_counter() - start)
+        return result
+
+    def begin(self, sql, params, started, elapsed):
+        self.pending = [sql, elapsed, 0, params, started]
+        if self.description is None:
+            # Запит без рядків для вибірки (INSERT, UPDATE, DDL) завершено одразу
+            self.pending[2] = max(self.rowcount, 0)
+            self.finish()
+
+    def fetched(self, start, rows, done):
+        if self.pending:
+            self.pending[1] += time.perf_counter() - start
+            self.pending[2] += rows
+            if done:
+                self.finish()
+
+    def finish(self):
+        if self.pending:
+            sql, elapsed, rows, params, started = self.pending
+            self.pending = None
+            query_stats.record(sql, elapsed, rows)
+            if has_request_context():
+                g.db_time = g.get('db_time', 0.0) + elapsed
+                trace = g.get('trace')
+                if trace is not None:
+                    trace.add_statement(sql, started, elapsed, rows)
+            threshold = app.config['SLOW_QUERY_MS']
+            if threshold is not None and elapsed * 1000 >= threshold:
+                try:
+                    slow_query_log.capture(self.connection, sql, params, elapsed, rows)
+                except Exception as e:
+                    logger.error(f"Помилка запису повільного запиту: {str(e)}")
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(start, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.fetched(start, 0, True)
+            raise
+        self.fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        # Курсор, з якого прочитали не всі рядки (перевірка існування тощо)
+        self.finish()
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute у C не викликає перевизначений cursor(), тому execute теж перевизначено
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def connect_db():
+    conn = sqlite3.connect('project_management.db', factory=InstrumentedConnection,
+                           cached_statements=app.config['SQLITE_STATEMENT_CACHE'])
     conn.row_factory = sqlite3.Row
     return conn
 
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'message': 'Token is missing'}), 401
+class UnitOfWork:
+    """З'єднання запиту: маршрут і всі допоміжні функції працюють в одній транзакції.
+    close() нічого не робить; незафіксоване фіксується або відкочується в кінці запиту"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0
+        self.commits = 0
+        self.savepoints = 0
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def commit(self):
+        # Усередині savepoint фіксацію виконує зовнішній рівень
+        if self.depth == 0 and self.conn.in_transaction:
+            self.conn.commit()
+            self.commits += 1
+
+    def rollback(self):
+        self.conn.rollback()
+        # Партиції, створені у відкоченій транзакції, треба буде створити знову
+        known_activity_partitions.clear()
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def savepoint(self):
+        # BEGIN перед першим savepoint, інакше його RELEASE зафіксував би транзакцію
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        name = f'sp{self.depth}'
+        self.conn.execute(f"SAVEPOINT {name}")
+        self.depth += 1
+        self.savepoints += 1
+        try:
+            yield self
+        except BaseException:
+            self.conn.execute(f"ROLLBACK TO {name}")
+            known_activity_partitions.clear()
+            raise
+        finally:
+            self.depth -= 1
+            self.conn.execute(f"RELEASE {name}")
+
+@contextmanager
+def nested_transaction(conn):
+    # Вкладена операція допоміжної функції: savepoint у транзакції запиту,
+    # поза запитом (фонові задачі) - окрема транзакція з фіксацією
+    if isinstance(conn, UnitOfWork):
+        with conn.savepoint():
+            yield conn
+        return
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        known_activity_partitions.clear()
+        raise
+
+def get_db():
+    # У межах запиту всі виклики повертають одне з'єднання, поза запитом - нове
+    if not has_request_context():
+        return connect_db()
+    if 'db' not in g:
+        conn = g.db = UnitOfWork(connect_db())
+        if request.method == 'GET':
+            state = request_project_state(conn)
+            if state and state['archived']:
+                use_project_archive(conn)
+    return g.db
+
+class RequestMetrics:
+    """Лічильники й гістограми запитів за маршрутом для /metrics (формат Prometheus)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.routes = {}
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def record(self, route, method, status, elapsed, db_time, size):
+        latency_buckets = app.config['METRICS_LATENCY_BUCKETS']
+        size_buckets = app.config['METRICS_SIZE_BUCKETS']
+        with self.lock:
+            self.in_flight -= 1
+            entry = self.routes.get((route, method))
+            if entry is None:
+                entry = self.routes[(route, method)] = {
+                    'statuses': defaultdict(int),
+                    'latency': [0] * (len(latency_buckets) + 1), 'latency_sum': 0.0,
+                    'db_seconds': 0.0, 'python_seconds': 0.0,
+                    'size': [0] * (len(size_buckets) + 1), 'size_sum': 0
+                }
+            entry['statuses'][status] += 1
+            entry['latency'][bisect.bisect_left(latency_buckets, elapsed)] += 1
+            entry['latency_sum'] += elapsed
+            entry['db_seconds'] += db_time
+            entry['python_seconds'] += max(elapsed - db_time, 0.0)
+            if size is not None:
+                entry['size'][bisect.bisect_left(size_buckets, size)] += 1
+                entry['size_sum'] += size
+
+    def render(self):
+        with self.lock:
+            in_flight = self.in_flight
+            routes = sorted((key, {**entry, 'statuses': dict(entry['statuses']),
+                                   'latency': list(entry['latency']), 'size': list(entry['size'])})
+                            for key, entry in self.routes.items())
+        # Кожен воркер рахує окремо; мітка worker дозволяє підсумувати їх у Prometheus
+        worker = os.getpid()
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
 
+        def histogram(name, labels, buckets, counts, total):
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {total}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+        labels = {key: f'worker="{worker}",route="{key[0]}",method="{key[1]}"' for key, _ in routes}
+        metric('http_requests_total', 'counter', 'Requests by route, method and status code.')
+        for key, entry in routes:
+            for status, count in sorted(entry['statuses'].items()):
+                lines.append(f'http_requests_total{{{labels[key]},status="{status}"}} {count}')
+        metric('http_request_duration_seconds', 'histogram', 'Request latency from the first before_request hook to teardown.')
+        for key, entry in routes:
+            histogram('http_request_duration_seconds', labels[key], app.config['METRICS_LATENCY_BUCKETS'],
+                      entry['latency'], entry['latency_sum'])
+        metric('http_request_db_seconds_total', 'counter', 'Time spent executing SQL statements and fetching their rows.')
+        for key, entry in routes:
+            lines.append(f'http_request_db_seconds_total{{{labels[key]}}} {entry["db_seconds"]}')
+        metric('http_request_python_seconds_total', 'counter', 'Request time outside SQL statements.')
+        for key, entry in routes:
+            lines.append(f'http_request_python_seconds_total{{{labels[key]}}} {entry["python_seconds"]}')
+        metric('http_response_size_bytes', 'histogram', 'Response body size.')
+        for key, entry in routes:
+            histogram('http_response_size_bytes', labels[key], app.config['METRICS_SIZE_BUCKETS'],
+                      entry['size'], entry['size_sum'])
+        metric('http_requests_in_flight', 'gauge', 'Requests currently being handled.')
+        lines.append(f'http_requests_in_flight{{worker="{worker}"}} {in_flight}')
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+# Хуки метрик реєструються першими: before_request виконується до решти,
+# а after_request і teardown - після решти, тож у час запиту входять і фіксація, і закриття з'єднання
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.metrics_start = time.perf_counter()
+        request_metrics.started()
+
+@app.after_request
+def collect_response_metrics(response):
+    if 'metrics_start' in g:
+        g.metrics_response = (response.status_code, response.content_length)
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        status, size = g.pop('metrics_response', (500, None))
+        request_metrics.record(request.endpoint or '<unmatched>', request.method, status,
+                               time.perf_counter() - start, g.get('db_time', 0.0), size)
+
+# Трасування запитів: спани у форматі OpenTelemetry (OTLP JSON)
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_STATUS_ERROR = 2
+REQUEST_ID_PATTERN = re.compile(r'^[\w.:-]{1,128}$')
+TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+class RequestTrace:
+    """Спани одного запиту; кореневий спан - сам запит, решта вкладаються за стеком відкритих спанів"""
+
+    def __init__(self, request_id, trace_id, parent_span_id=None):
+        self.request_id = request_id
+        self.trace_id = trace_id
+        self.parent_span_id = parent_span_id
+        self.spans = []
+        self.stack = []
+        self.dropped = 0
+
+    def start(self, name, attributes=None, kind=SPAN_KIND_INTERNAL):
+        span = self.add(name, time.time_ns(), None, attributes, kind)
+        self.stack.append(span)
+        return span
+
+    def end(self, span, error=None):
+        span['end'] = time.time_ns()
+        if error is not None:
+            span['status'] = {'code': SPAN_STATUS_ERROR, 'message': f'{type(error).__name__}: {error}'}
+        if self.stack and self.stack[-1] is span:
+            self.stack.pop()
+
+    def add(self, name, start, end, attributes=None, kind=SPAN_KIND_INTERNAL):
+        span = {
+            'spanId': os.urandom(8).hex(),
+            'parentSpanId': self.stack[-1]['spanId'] if self.stack else self.parent_span_id,
+            'name': name, 'kind': kind, 'start': start, 'end': end,
+            'attributes': attributes or {}
+        }
+        # Кореневий спан зберігається завжди, решта - до ліміту
+        if len(self.spans) < app.config['TRACE_MAX_SPANS'] or not self.spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        return span
+
+    def add_statement(self, sql, started, elapsed, rows):
+        # Тривалість - виконання разом із вибіркою рядків, без пауз між fetch
+        key = statement_key(sql)
+        self.add(key if key in QUERIES else key.split(None, 1)[0].upper(), started, started + int(elapsed * 1e9), {
+            'db.system': 'sqlite',
+            'db.statement': QUERIES.get(key, key)[:1000],
+            'db.rows': rows
+        })
+
+    def otlp(self):
+        def value(v):
+            if isinstance(v, bool):
+                return {'boolValue': v}
+            if isinstance(v, int):
+                return {'intValue': str(v)}
+            if isinstance(v, float):
+                return {'doubleValue': v}
+            return {'stringValue': str(v)}
+
+        spans = []
+        for span in self.spans:
+            item = {
+                'traceId': self.trace_id,
+                'spanId': span['spanId'],
+                'name': span['name'],
+                'kind': span['kind'],
+                'startTimeUnixNano': str(span['start']),
+                'endTimeUnixNano': str(span['end'] or span['start']),
+                'attributes': [{'key': k, 'value': value(v)} for k, v in span['attributes'].items() if v is not None]
+            }
+            if span['parentSpanId']:
+                item['parentSpanId'] = span['parentSpanId']
+            if 'status' in span:
+                item['status'] = span['status']
+            spans.append(item)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': 'project-management'}},
+                {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}}
+            ]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}]
+        }]}
+
+trace_log = JsonLinesLog(
+    'TRACE_LOG', lambda entry: int(entry['resourceSpans'][0]['scopeSpans'][0]['spans'][0]['startTimeUnixNano']))
+
+@contextmanager
+def trace_span(name, attributes=None):
+    # Поза запитом або з вимкненим трасуванням нічого не записує й повертає None
+    trace = g.get('trace') if has_request_context() else None
+    if trace is None:
+        yield None
+        return
+    span = trace.start(name, attributes)
+    try:
+        yield span
+    except BaseException as e:
+        trace.end(span, e)
+        raise
+    trace.end(span)
+
+class TracedJSONProvider(DefaultJSONProvider):
+    # jsonify проходить через response(), тож серіалізація кожної відповіді стає окремим спаном
+    def response(self, *args, **kwargs):
+        with trace_span('json.serialize') as span:
+            response = super().response(*args, **kwargs)
+            if span is not None:
+                span['attributes']['http.response.body.size'] = response.content_length
+        return response
+
+app.json = TracedJSONProvider(app)
+
+@app.before_request
+def start_request_trace():
+    if not app.config['TRACING_ENABLED']:
+        return
+    # Ідентифікатор запиту приходить від клієнта чи проксі або генерується тут
+    request_id = request.headers.get('X-Request-ID', '')
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    parent = TRACEPARENT_PATTERN.match(request.headers.get('traceparent', ''))
+    if parent:
+        trace_id, parent_span_id = parent.groups()
+    else:
+        trace_id = request_id if re.fullmatch(r'[0-9a-f]{32}', request_id) else uuid.uuid4().hex
+        parent_span_id = None
+    g.trace = RequestTrace(request_id, trace_id, parent_span_id)
+    g.trace.start(f'{request.method} {request.url_rule.rule if request.url_rule else request.path}', {
+        'http.request.method': request.method,
+        'http.route': request.url_rule.rule if request.url_rule else None,
+        'url.path': request.path,
+        'http.request_id': request_id
+    }, SPAN_KIND_SERVER)
+
+@app.after_request
+def set_request_id_header(response):
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        trace.spans[0]['attributes']['http.response.status_code'] = response.status_code
+        trace.spans[0]['attributes']['http.response.body.size'] = response.content_length
+        if response.status_code >= 500:
+            trace.spans[0]['status'] = {'code': SPAN_STATUS_ERROR}
+    return response
+
+@app.teardown_request
+def export_request_trace(exc):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return
+    root = trace.spans[0]
+    trace.end(root, exc)
+    if trace.dropped:
+        root['attributes']['trace.dropped_spans'] = trace.dropped
+    if (root['end'] - root['start']) / 1e6 >= app.config['TRACE_EXPORT_MIN_MS']:
+        try:
+            trace_log.write(trace.otlp())
+        except Exception as e:
+            logger.error(f"Помилка експорту траси: {str(e)}")
+
+class RequestProfiler:
+    """Профайлер на вимогу для живого воркера.
+    sample - знімки стеків потоків запитів через sys._current_frames() у форматі collapsed stacks (flamegraph.pl, speedscope);
+    cprofile - cProfile для перших N запитів, результат у форматі pstats (snakeviz, flameprof)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = None
+        self.last = None
+
+    def start(self, mode, endpoint, duration, max_requests, interval):
+        with self.lock:
+            if self.session is not None:
+                return None
+            now = time.time()
+            self.session = session = {
+                'id': uuid.uuid4().hex, 'mode': mode, 'endpoint': endpoint,
+                'started_at': now, 'ends_at': now + duration, 'max_requests': max_requests,
+                'interval': interval, 'requests': 0, 'samples': 0,
+                'threads': {}, 'stacks': Counter(), 'stats': None,
+                'stop': threading.Event()
+            }
+        threading.Thread(target=self.run, args=(session,), name='request_profiler', daemon=True).start()
+        return self.status()
+
+    def stop(self):
+        with self.lock:
+            session = self.session
+        if session is not None:
+            session['stop'].set()
+
+    def run(self, session):
+        # Вимикається за часом, після N запитів (cprofile), вручну або разом із фоновими задачами
+        while not session['stop'].is_set() and not background_stop.is_set():
+            remaining = session['ends_at'] - time.time()
+            if remaining <= 0:
+                break
+            if session['mode'] == 'sample':
+                session['stop'].wait(min(session['interval'], remaining))
+                self.sample(session)
+            else:
+                session['stop'].wait(remaining)
+        self.finish(session)
+
+    def sample(self, session):
+        frames = sys._current_frames()
+        with self.lock:
+            threads = list(session['threads'].items())
+        for thread_id, endpoint in threads:
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            if stack:
+                stack.append(endpoint)
+                session['stacks'][';'.join(reversed(stack))] += 1
+                session['samples'] += 1
+
+    def request_started(self):
+        session = self.session
+        if session is None or (session['endpoint'] and request.endpoint != session['endpoint']):
+            return
+        if session['mode'] == 'sample':
+            with self.lock:
+                session['threads'][threading.get_ident()] = request.endpoint or '<unmatched>'
+            return
+        profile = cProfile.Profile()
         try:
-            if 'Bearer ' in token:
-                token = token.split('Bearer ')[1]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            profile.enable()
+        except ValueError:
+            # Інший профайлер уже активний (Python 3.12+ дозволяє лише один) - запит пропускається
+            return
+        g.profile = (session, profile)
+
+    def request_finished(self):
+        session = self.session
+        if session is not None and session['mode'] == 'sample':
+            with self.lock:
+                if session['threads'].pop(threading.get_ident(), None) is not None:
+                    session['requests'] += 1
+        profiled = g.pop('profile', None)
+        if profiled is None:
+            return
+        session, profile = profiled
+        profile.disable()
+        with self.lock:
+            if session is not self.session:
+                return
+            if session['stats'] is None:
+                session['stats'] = pstats.Stats(profile)
+            else:
+                session['stats'].add(profile)
+            session['requests'] += 1
+            if session['requests'] >= session['max_requests']:
+                session['stop'].set()
+
+    def finish(self, session):
+        with self.lock:
+            self.session = None
+        os.makedirs(app.config['PROFILER_OUTPUT_DIR'], exist_ok=True)
+        name = f"profile-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{session['mode']}"
+        path = None
+        if session['mode'] == 'sample' and session['stacks']:
+            path = os.path.join(app.config['PROFILER_OUTPUT_DIR'], f'{name}.folded')
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in session['stacks'].most_common():
+                    f.write(f'{stack} {count}\n')
+        elif session['mode'] == 'cprofile' and session['stats'] is not None:
+            path = os.path.join(app.config['PROFILER_OUTPUT_DIR'], f'{name}.prof')
+            session['stats'].dump_stats(path)
+        self.last = {
+            'id': session['id'], 'mode': session['mode'], 'endpoint': session['endpoint'],
+            'started_at': datetime.fromtimestamp(session['started_at'], timezone.utc).isoformat(),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'requests': session['requests'], 'samples': session['samples'],
+            'output': os.path.abspath(path) if path else None
+        }
+        logger.info(f"Профілювання {session['mode']} завершено: {path or 'без даних'}")
+
+    def status(self):
+        with self.lock:
+            session = self.session
+            active = None
+            if session is not None:
+                active = {
+                    'id': session['id'], 'mode': session['mode'], 'endpoint': session['endpoint'],
+                    'started_at': datetime.fromtimestamp(session['started_at'], timezone.utc).isoformat(),
+                    'ends_at': datetime.fromtimestamp(session['ends_at'], timezone.utc).isoformat(),
+                    'requests': session['requests'], 'max_requests': session['max_requests'],
+                    'samples': session['samples']
+                }
+        # Профайлер діє лише у воркері, що обробив запит на увімкнення
+        return {'worker': os.getpid(), 'active': active, 'last': self.last}
+
+request_profiler = RequestProfiler()
+
+@app.before_request
+def start_request_profile():
+    if request_profiler.session is not None:
+        request_profiler.request_started()
+
+@app.teardown_request
+def finish_request_profile(exc):
+    request_profiler.request_finished()
+
+# Фонові задачі: функція та callable, що повертає затримку до наступного запуску
+background_jobs = []
+background_stop = threading.Event()
+
+def background_job(next_delay):
+    def decorator(f):
+        background_jobs.append((f, next_delay))
+        return f
+    return decorator
+
+def start_background_jobs():
+    def run(job, next_delay):
+        while not background_stop.wait(next_delay()):
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Помилка фонової задачі {job.__name__}: {str(e)}")
+
+    for job, next_delay in background_jobs:
+        threading.Thread(target=run, args=(job, next_delay), name=job.__name__, daemon=True).start()
+
+background_started = False
+background_lock = threading.Lock()
+
+@app.before_request
+def ensure_background_jobs():
+    # Запускаємо задачі в кожному воркері під час першого запиту, незалежно від WSGI-сервера
+    global background_started
+    if background_started or not app.config['BACKGROUND_JOBS']:
+        return
+    with background_lock:
+        if not background_started:
+            background_started = True
+            start_background_jobs()
+
+def seconds_until_midnight():
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+def take_progress_snapshots(c, snapshot_date=None, project_id=None):
+    # Без project_id знімаються всі активні проєкти, інакше лише вказаний
+    snapshot_date = snapshot_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    c.execute("""
+        INSERT OR REPLACE INTO project_progress_snapshots (
+            project_id, snapshot_date, not_started, in_progress, completed
+        )
+        SELECT p.id, ?,
+               COUNT(CASE WHEN t.status = 'not_started' THEN 1 END),
+               COUNT(CASE WHEN t.status = 'in_progress' THEN 1 END),
+               COUNT(CASE WHEN t.status = 'completed' THEN 1 END)
+        FROM projects p
+        LEFT JOIN tasks t ON t.project_id = p.id
+        WHERE (? IS NULL AND p.status = 'active') OR p.id = ?
+        GROUP BY p.id
+    """, (snapshot_date, project_id, project_id))
+    return c.rowcount
+
+def rebuild_user_stats(c):
+    # Кожен агрегат рахується окремим підзапитом, тому рядки не множаться між собою
+    c.execute("DELETE FROM user_stats")
+    c.execute("""
+        INSERT INTO user_stats (
+            user_id, projects_count, total_tasks, completed_tasks, ratings_count, ratings_sum
+        )
+        SELECT u.id,
+               COALESCE(pm.projects_count, 0),
+               COALESCE(t.total_tasks, 0),
+               COALESCE(t.completed_tasks, 0),
+               COALESCE(r.ratings_count, 0),
+               COALESCE(r.ratings_sum, 0)
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) as projects_count
+            FROM project_members GROUP BY user_id
+        ) pm ON pm.user_id = u.id
+        LEFT JOIN (
+            SELECT assigned_to, COUNT(*) as total_tasks,
+                   COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_tasks
+            FROM tasks GROUP BY assigned_to
+        ) t ON t.assigned_to = u.id
+        LEFT JOIN (
+            SELECT specialist_id, COUNT(rating) as ratings_count, SUM(rating) as ratings_sum
+            FROM ratings GROUP BY specialist_id
+        ) r ON r.specialist_id = u.id
+    """)
+
+@background_job(seconds_until_midnight)
+def nightly_progress_snapshot():
+    conn = get_db()
+    try:
+        # Знімок фіксує стан на кінець доби, що щойно завершилась
+        snapshot_date = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+        count = take_progress_snapshots(conn.cursor(), snapshot_date)
+        conn.commit()
+        logger.info(f"Збережено знімки прогресу для {count} проєктів за {snapshot_date}")
+    finally:
+        conn.close()
+
+def authenticate_request():
+    # Повертає (користувач, None) або (None, відповідь з помилкою)
+    token = request.headers.get('Authorization')
+    if not token:
+        return None, (jsonify({'message': 'Token is missing'}), 401)
+
+    try:
+        if 'Bearer ' in token:
+            token = token.split('Bearer ')[1]
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        current_user = principal_cache.get(f"user:{data['user_id']}")
+        if current_user is None:
             current_user = get_user_by_id(data['user_id'])
-            if not current_user:
-                return jsonify({'message': 'Invalid token'}), 401
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Invalid token'}), 401
+            if current_user:
+                principal_cache.set(f"user:{data['user_id']}", current_user,
+                                    [f"user:{data['user_id']}"], PRINCIPAL_CACHE_TTL)
+        if not current_user:
+            return None, (jsonify({'message': 'Invalid token'}), 401)
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'message': 'Token expired'}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'message': 'Invalid token'}), 401)
+    return current_user, None
 
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with trace_span('auth.token_required') as span:
+            current_user, error = authenticate_request()
+            if span is not None:
+                span['attributes']['enduser.id'] = current_user['id'] if current_user else None
+        if error:
+            return error
         return f(current_user, *args, **kwargs)
     return decorated
 
 
-def log_activity(user_id, project_id, action_type, action_details=None):
+# Партиціювання user_activity за місяцями
+known_activity_partitions = set()
+
+def create_activity_partition(c, month):
+    table = f'user_activity_{month}'
+    c.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   user_id INTEGER,
+                   project_id INTEGER,
+                   action_type TEXT NOT NULL,
+                   action_details TEXT,
+                   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_project ON {table} (project_id, timestamp)')
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table} (user_id, timestamp)')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_rollup AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO activity_daily (day, project_id, action_type, count)
+            VALUES (date(NEW.timestamp), COALESCE(NEW.project_id, 0), NEW.action_type, 1)
+            ON CONFLICT(project_id, day, action_type) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_hourly AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO activity_hourly (project_id, hour, user_id, action_type, count)
+            VALUES (COALESCE(NEW.project_id, 0), strftime('%Y-%m-%d %H:00', NEW.timestamp),
+                    COALESCE(NEW.user_id, 0), NEW.action_type, 1)
+            ON CONFLICT(project_id, hour, user_id, action_type) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    c.execute("INSERT OR IGNORE INTO activity_partitions (month, table_name) VALUES (?, ?)", (month, table))
+    if c.rowcount:
+        # id продовжують загальну послідовність, щоб лишатися унікальними між партиціями
+        c.execute("""
+            INSERT OR REPLACE INTO sqlite_sequence (name, seq)
+            SELECT ?, COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name LIKE 'user\\_activity%' ESCAPE '\\'
+        """, (table,))
+    return table
+
+def activity_partition(c, when):
+    # Маршрутизація вставки: партиція місяця, до якого належить момент when
+    month = when.strftime('%Y%m')
+    table = f'user_activity_{month}'
+    if table not in known_activity_partitions:
+        create_activity_partition(c, month)
+        known_activity_partitions.add(table)
+    return table
+
+def activity_tables(c):
+    # Активні партиції від найновішої до найстарішої
+    run_query(c, 'activity_partitions_live')
+    return [row[0] for row in c.fetchall()]
+
+def query_activity(c, sql, params, limit):
+    # sql має містити {table}, ORDER BY timestamp DESC і завершуватися LIMIT ?;
+    # партиції обходяться від найновішої, доки не набереться limit рядків
+    rows = []
+    tables = activity_tables(c)
+    if any(row[1] == 'archive' for row in c.execute("PRAGMA database_list").fetchall()):
+        # Найстаріші рядки: активність проєкту, перенесеного в архівну БД
+        tables.append('archive.user_activity')
+    for table in tables:
+        c.execute(sql.format(table=table), (*params, limit - len(rows)))
+        rows.extend(c.fetchall())
+        if len(rows) >= limit:
+            break
+    return rows
+
+def delete_activity(c, column, value):
+    for table in activity_tables(c):
+        c.execute(f"DELETE FROM {table} WHERE {column} = ?", (value,))
+
+def migrate_legacy_activity(c):
+    c.execute("""
+        SELECT DISTINCT strftime('%Y%m', COALESCE(timestamp, CURRENT_TIMESTAMP)) FROM user_activity
+    """)
+    for (month,) in c.fetchall():
+        table = create_activity_partition(c, month)
+        c.execute(f"""
+            INSERT INTO {table} (id, user_id, project_id, action_type, action_details, timestamp)
+            SELECT id, user_id, project_id, action_type, action_details, COALESCE(timestamp, CURRENT_TIMESTAMP)
+            FROM user_activity
+            WHERE strftime('%Y%m', COALESCE(timestamp, CURRENT_TIMESTAMP)) = ?
+        """, (month,))
+        c.execute("DELETE FROM user_activity WHERE strftime('%Y%m', COALESCE(timestamp, CURRENT_TIMESTAMP)) = ?",
+                  (month,))
+        logger.info(f"Перенесено {c.rowcount} записів активності в {table}")
+
+def archive_activity_partitions():
+    # Партиції, старші за ACTIVITY_RETENTION_MONTHS, копіюються в архівну БД і видаляються;
+    # кожна партиція - окрема транзакція, тож блокування тримається лише на час однієї копії
+    today = datetime.now(timezone.utc)
+    months = today.year * 12 + today.month - 1 - app.config['ACTIVITY_RETENTION_MONTHS']
+    cutoff = f"{months // 12:04d}{months % 12 + 1:02d}"
+    archive_path = app.config['ACTIVITY_ARCHIVE_PATH']
+    
+    conn = get_db()
     try:
-        conn = get_db()
         c = conn.cursor()
-        c.execute("""
-            INSERT INTO user_activity (user_id, project_id, action_type, action_details)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, project_id, action_type, action_details))
-        conn.commit()
-    except Exception as e:
-        logger.error(f"Error logging activity: {str(e)}")
+        if archive_path:
+            c.execute("ATTACH DATABASE ? AS activity_archive", (archive_path,))
+        c.execute("SELECT month, table_name FROM activity_partitions WHERE archived_at IS NULL AND month <= ?",
+                  (cutoff,))
+        archived = []
+        for month, table in c.fetchall():
+            if archive_path:
+                c.execute(f"CREATE TABLE IF NOT EXISTS activity_archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+                c.execute(f"INSERT INTO activity_archive.{table} SELECT * FROM main.{table}")
+            c.execute(f"DROP TABLE IF EXISTS main.{table}")
+            c.execute("UPDATE activity_partitions SET archived_at = CURRENT_TIMESTAMP WHERE month = ?", (month,))
+            conn.commit()
+            known_activity_partitions.discard(table)
+            archived.append(month)
+        if archived:
+            logger.info(f"Заархівовано партиції активності: {', '.join(archived)}")
+        return archived
     finally:
         conn.close()
 
-def create_notification(user_id, project_id, notification_type, message, priority='normal', expiry_days=30):
-    conn = None
+@background_job(seconds_until_midnight)
+def nightly_activity_archive():
+    archive_activity_partitions()
+
+# Архівний рівень: дані архівних і завершених проєктів живуть в окремій БД
+def attach_project_archive(conn):
+    if not any(row[1] == 'archive' for row in conn.execute("PRAGMA database_list")):
+        conn.execute("ATTACH DATABASE ? AS archive", (app.config['PROJECT_ARCHIVE_PATH'],))
+
+def table_columns(c, schema, table):
+    c.execute(f"PRAGMA {schema}.table_info({table})")
+    return [(row[1], row[2]) for row in c.fetchall()]
+
+def init_project_archive(c):
+    # Архівні таблиці повторюють колонки основних; колонки з новіших версій схеми додаються при старті.
+    # user_activity - спільна таблиця для рядків з усіх місячних партицій
+    for table in (*PROJECT_ARCHIVE_TABLES, 'user_activity'):
+        c.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+        archived = {name for name, _ in table_columns(c, 'archive', table)}
+        for name, column_type in table_columns(c, 'main', table):
+            if name not in archived:
+                c.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}")
+        c.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_project ON {table} (project_id)")
+    
+    # Раніше в архів переносилися й сповіщення - повертаємо їх у скриньки користувачів
+    c.execute("SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = 'notifications'")
+    if c.fetchone():
+        archived = {name for name, _ in table_columns(c, 'archive', 'notifications')}
+        columns = ', '.join(name for name, _ in table_columns(c, 'main', 'notifications') if name in archived)
+        c.execute(f"INSERT OR IGNORE INTO main.notifications ({columns}) SELECT {columns} FROM archive.notifications")
+        c.execute("DROP TABLE archive.notifications")
+
+def use_project_archive(conn):
+    # Тимчасові view затіняють основні таблиці в межах з'єднання, тож ті самі запити маршрутів
+    # читають архівні рядки, а спроба запису завершується помилкою
+    attach_project_archive(conn)
+    for table in PROJECT_ARCHIVE_TABLES:
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {table} AS SELECT * FROM archive.{table}")
+
+def is_project_archived(c, project_id):
+    c.execute("SELECT 1 FROM archived_projects WHERE project_id = ?", (project_id,))
+    return c.fetchone() is not None
+
+def request_project_state(conn):
+    # Стан проєкту зі шляху запиту (видаляється, в архіві); None - проєкту немає. Кешується на g
+    project_id = (request.view_args or {}).get('project_id')
+    if project_id is None:
+        return None
+    if 'project_state' not in g:
+        g.project_state = run_query(conn, 'project_state', (project_id,)).fetchone()
+    return g.project_state
+
+def keep_archived_task_totals(c, project_id, sign):
+    # Тригери user_stats сприймають перенесення як видалення або вставку завдань;
+    # компенсуємо, щоб статистика користувачів і далі враховувала архівні завдання
+    c.execute("""
+        UPDATE user_stats SET
+            total_tasks = total_tasks + ? * s.total,
+            completed_tasks = completed_tasks + ? * s.completed
+        FROM (
+            SELECT assigned_to, COUNT(*) AS total, SUM(status = 'completed') AS completed
+            FROM archive.tasks
+            WHERE project_id = ? AND assigned_to IS NOT NULL
+            GROUP BY assigned_to
+        ) s
+        WHERE user_stats.user_id = s.assigned_to
+    """, (sign, sign, project_id))
+
+def move_project_rows(c, project_id, source, target):
+    moved = 0
+    for table in PROJECT_ARCHIVE_TABLES:
+        columns = ', '.join(name for name, _ in table_columns(c, 'main', table))
+        c.execute(f"INSERT INTO {target}.{table} ({columns}) SELECT {columns} FROM {source}.{table} WHERE project_id = ?",
+                  (project_id,))
+        moved += c.rowcount
+        c.execute(f"DELETE FROM {source}.{table} WHERE project_id = ?", (project_id,))
+    return moved
+
+def project_archive_tags(c, project_id):
+    run_query(c, 'project_member_ids', (project_id,))
+    return [f'project:{project_id}', 'users', *[f'user:{row[0]}' for row in c.fetchall()]]
+
+def archive_project_data(project_id):
+    # Переносить завдання, коментарі, метадані файлів та активність проєкту в архівну БД
+    # однією транзакцією (у запиті - в його транзакції); повертає кількість рядків або None, якщо проєкт уже в архіві
+    conn = get_db()
     try:
-        conn = get_db()
+        attach_project_archive(conn)
         c = conn.cursor()
-        expiry_date = datetime.now(timezone.utc) + timedelta(days=expiry_days)
-        
-        # Встановлюємо таймаут для операцій з базою даних
-        conn.execute("PRAGMA busy_timeout = 5000")  # таймаут 5 секунд
-        
-        c.execute("""
-            INSERT INTO notifications (user_id, project_id, type, message, priority, expiry_date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, project_id, notification_type, message, priority, expiry_date))
-        
-        conn.commit()
-    except Exception as e:
-        logger.error(f"Помилка створення сповіщення: {str(e)}")
-        if conn:
-            conn.rollback()
+        if is_project_archived(c, project_id):
+            return None
+        with nested_transaction(conn):
+            moved = move_project_rows(c, project_id, 'main', 'archive')
+            keep_archived_task_totals(c, project_id, 1)
+            for table in activity_tables(c):
+                c.execute(f"""
+                    INSERT INTO archive.user_activity (id, user_id, project_id, action_type, action_details, timestamp)
+                    SELECT id, user_id, project_id, action_type, action_details, timestamp
+                    FROM main.{table} WHERE project_id = ?
+                """, (project_id,))
+                moved += c.rowcount
+            # Денні та погодинні підсумки лишаються в основній БД, тож статистика й теплові карти не змінюються
+            delete_activity(c, 'project_id', project_id)
+            c.execute("INSERT INTO archived_projects (project_id, rows_moved) VALUES (?, ?)", (project_id, moved))
+            record_change(c, 'project', project_id, project_id, 'update', tags=project_archive_tags(c, project_id))
+        logger.info(f"Проєкт {project_id} перенесено в архів: {moved} рядків")
+        return moved
     finally:
-        if conn:
-            conn.close()
-# Допоміжні функції для роботи з користувачами
-def get_user_by_id(user_id):
+        conn.close()
+
+def restore_project_data(project_id):
+    # Повертає дані проєкту з архівної БД; активність місяців, чиї партиції вже заархівовані,
+    # лишається в архіві. У запиті перенесення фіксується лише разом з рештою його змін.
+    # Повертає кількість рядків або None, якщо проєкт не в архіві
     conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE id=?", (user_id,))
-    user = c.fetchone()
-    conn.close()
-    
-    if user:
-        return {
-            'id': user['id'],
-            'name': user['name'],
-            'email': user['email'],
-            'role': user['role']
+    try:
+        attach_project_archive(conn)
+        c = conn.cursor()
+        if not is_project_archived(c, project_id):
+            return None
+        with nested_transaction(conn):
+            keep_archived_task_totals(c, project_id, -1)
+            moved = move_project_rows(c, project_id, 'archive', 'main')
+            c.execute("""
+                SELECT DISTINCT strftime('%Y%m', a.timestamp)
+                FROM archive.user_activity a
+                WHERE a.project_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM activity_partitions p
+                    WHERE p.month = strftime('%Y%m', a.timestamp) AND p.archived_at IS NOT NULL
+                )
+            """, (project_id,))
+            for (month,) in c.fetchall():
+                table = create_activity_partition(c, month)
+                known_activity_partitions.add(table)
+                c.execute(f"""
+                    INSERT INTO {table} (id, user_id, project_id, action_type, action_details, timestamp)
+                    SELECT id, user_id, project_id, action_type, action_details, timestamp
+                    FROM archive.user_activity WHERE project_id = ? AND strftime('%Y%m', timestamp) = ?
+                """, (project_id, month))
+                moved += c.rowcount
+                # Тригери партиції вдруге додали рядки до підсумків, які пережили архівування
+                c.execute("""
+                    UPDATE activity_daily SET count = count - r.n
+                    FROM (
+                        SELECT date(timestamp) AS day, action_type, COUNT(*) AS n
+                        FROM archive.user_activity
+                        WHERE project_id = ? AND strftime('%Y%m', timestamp) = ?
+                        GROUP BY 1, 2
+                    ) r
+                    WHERE activity_daily.project_id = ? AND activity_daily.day = r.day
+                      AND activity_daily.action_type = r.action_type
+                """, (project_id, month, project_id))
+                c.execute("""
+                    UPDATE activity_hourly SET count = count - r.n
+                    FROM (
+                        SELECT strftime('%Y-%m-%d %H:00', timestamp) AS hour, COALESCE(user_id, 0) AS user_id,
+                               action_type, COUNT(*) AS n
+                        FROM archive.user_activity
+                        WHERE project_id = ? AND strftime('%Y%m', timestamp) = ?
+                        GROUP BY 1, 2, 3
+                    ) r
+                    WHERE activity_hourly.project_id = ? AND activity_hourly.hour = r.hour
+                      AND activity_hourly.user_id = r.user_id AND activity_hourly.action_type = r.action_type
+                """, (project_id, month, project_id))
+                c.execute("DELETE FROM archive.user_activity WHERE project_id = ? AND strftime('%Y%m', timestamp) = ?",
+                          (project_id, month))
+            c.execute("DELETE FROM archived_projects WHERE project_id = ?", (project_id,))
+            record_change(c, 'project', project_id, project_id, 'update', tags=project_archive_tags(c, project_id))
+        logger.info(f"Проєкт {project_id} відновлено з архіву: {moved} рядків")
+        return moved
+    finally:
+        conn.close()
+
+def discard_project_archive(c, project_id):
+    # Видалення проєкту в архіві; з'єднання має бути з підключеною архівною БД
+    keep_archived_task_totals(c, project_id, -1)
+    for table in (*PROJECT_ARCHIVE_TABLES, 'user_activity'):
+        c.execute(f"DELETE FROM archive.{table} WHERE project_id = ?", (project_id,))
+    c.execute("DELETE FROM archived_projects WHERE project_id = ?", (project_id,))
+
+def archive_idle_projects():
+    # Архівні та завершені проєкти без активності за PROJECT_ARCHIVE_IDLE_DAYS
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT p.id FROM projects p
+            WHERE p.status IN ({', '.join('?' * len(PROJECT_ARCHIVE_STATUSES))})
+              AND NOT EXISTS (SELECT 1 FROM archived_projects a WHERE a.project_id = p.id)
+              AND NOT EXISTS (SELECT 1 FROM activity_daily d WHERE d.project_id = p.id AND d.day >= date('now', ?))
+        """, (*PROJECT_ARCHIVE_STATUSES, f"-{app.config['PROJECT_ARCHIVE_IDLE_DAYS']} days"))
+        project_ids = [row[0] for row in c.fetchall()]
+    finally:
+        conn.close()
+    
+    # Кожен проєкт - окрема транзакція
+    return [project_id for project_id in project_ids if archive_project_data(project_id) is not None]
+
+@background_job(seconds_until_midnight)
+def nightly_project_archive():
+    archive_idle_projects()
+
+# Видалення проєктів і користувачів: позначка deleted_at одразу, пов'язані рядки - фоновою чергою
+def tombstone(c, entity_type, entity_id):
+    c.execute(f"UPDATE {entity_type}s SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?", (entity_id,))
+    c.execute("INSERT INTO purge_jobs (entity_type, entity_id) VALUES (?, ?)", (entity_type, entity_id))
+    return c.lastrowid
+
+def purge_steps(c, entity_type):
+    # Партиції активності перелічуються під час запуску, тож крок запам'ятовується за назвою таблиці
+    column = 'project_id' if entity_type == 'project' else 'user_id'
+    return [*PURGE_STEPS[entity_type], *[(table, column, None, None) for table in activity_tables(c)]]
+
+def purge_batch(c, table, column, entity_id, entity_type, id_column):
+    # Видаляє до PURGE_BATCH рядків; повертає (рядків, файлів). Файл, видалений з диска до падіння
+    # процесу, при повторі просто пропускається, тож крок можна безпечно повторювати
+    if table in PURGE_RANGE_TABLES:
+        c.execute(f"DELETE FROM {table} WHERE {column} = ?", (entity_id,))
+        return c.rowcount, 0
+    c.execute(f"SELECT rowid AS purge_rowid, * FROM {table} WHERE {column} = ? LIMIT ?",
+              (entity_id, app.config['PURGE_BATCH']))
+    rows = c.fetchall()
+    files = 0
+    for row in rows:
+        if table == 'files':
+            try:
+                os.remove(row['file_path'])
+                files += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Не вдалося видалити файл {row['file_path']}: {str(e)}")
+        if entity_type:
+            record_change(c, entity_type, row[id_column], row['project_id'], 'delete',
+                          tags=[f"project:{row['project_id']}"])
+    c.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(row['purge_rowid'],) for row in rows])
+    return len(rows), files
+
+def run_purge_job(conn, job):
+    # Повертає False, якщо роботу перервано зупинкою сервера; прогрес фіксується разом з кожним пакетом
+    c = conn.cursor()
+    steps = purge_steps(c, job['entity_type'])
+    if any(step[0].startswith('archive.') for step in steps):
+        # Поза транзакцією: ATTACH усередині неї не виконується
+        attach_project_archive(conn)
+    names = [step[0] for step in steps]
+    start = names.index(job['step']) if job['step'] in names else 0
+    for table, column, entity_type, id_column in steps[start:]:
+        while True:
+            if background_stop.is_set():
+                return False
+            deleted, files = purge_batch(c, table, column, job['entity_id'], entity_type, id_column)
+            c.execute("""
+                UPDATE purge_jobs SET step = ?, rows_deleted = rows_deleted + ?, files_deleted = files_deleted + ?,
+                                      updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (table, deleted, files, job['id']))
+            conn.commit()
+            if deleted < app.config['PURGE_BATCH']:
+                break
+    
+    if job['entity_type'] == 'project' and is_project_archived(c, job['entity_id']):
+        attach_project_archive(conn)
+        discard_project_archive(c, job['entity_id'])
+    c.execute(f"DELETE FROM {job['entity_type']}s WHERE id = ?", (job['entity_id'],))
+    c.execute("""
+        UPDATE purge_jobs SET status = 'done', step = NULL, error = NULL,
+                              updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, (job['id'],))
+    conn.commit()
+    logger.info(f"Очищено {job['entity_type']} {job['entity_id']}: завдання {job['id']}")
+    return True
+
+def purge_tombstones():
+    # Обробляє чергу, доки є нові завдання або покинуті воркером, що впав
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        while not background_stop.is_set():
+            c.execute("""
+                UPDATE purge_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM purge_jobs
+                    WHERE status = 'pending' OR (status = 'running' AND updated_at < datetime('now', ?))
+                    ORDER BY id LIMIT 1
+                )
+                RETURNING *
+            """, (f"-{app.config['PURGE_STALE_SECONDS']} seconds",))
+            job = c.fetchone()
+            conn.commit()
+            if job is None:
+                return
+            try:
+                if not run_purge_job(conn, job):
+                    c.execute("UPDATE purge_jobs SET status = 'pending' WHERE id = ?", (job['id'],))
+                    conn.commit()
+            except Exception as e:
+                # Завдання лишається running і буде підхоплене знову через PURGE_STALE_SECONDS
+                conn.rollback()
+                logger.error(f"Помилка очищення {job['entity_type']} {job['entity_id']}: {str(e)}")
+                c.execute("UPDATE purge_jobs SET error = ? WHERE id = ?", (str(e), job['id']))
+                conn.commit()
+                return
+    finally:
+        conn.close()
+
+@background_job(lambda: app.config['PURGE_INTERVAL'])
+def purge_deleted_entities():
+    purge_tombstones()
+
+@app.before_request
+def check_project_state():
+    # Видалений проєкт зникає одразу; дані проєкту в архіві доступні лише для читання, доки його не відновлено
+    if (request.view_args or {}).get('project_id') is None:
+        return
+    conn = get_db()
+    try:
+        state = request_project_state(conn)
+    finally:
+        conn.close()
+    if state is None:
+        return
+    if state['deleted']:
+        return jsonify({'message': 'Проєкт не знайдено'}), 404
+    if state['archived'] and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            and request.endpoint not in PROJECT_ARCHIVE_WRITABLE:
+        return jsonify({'message': 'Проєкт в архіві і доступний лише для читання'}), 409
+
+def log_activity(user_id, project_id, action_type, action_details=None):
+    conn = get_db()
+    try:
+        with nested_transaction(conn):
+            c = conn.cursor()
+            table = activity_partition(c, datetime.now(timezone.utc))
+            c.execute(f"""
+                INSERT INTO {table} (user_id, project_id, action_type, action_details)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, project_id, action_type, action_details))
+            record_change(c, 'activity', c.lastrowid, project_id, 'insert', tags=[f'user:{user_id}'])
+    except Exception as e:
+        logger.error(f"Error logging activity: {str(e)}")
+    finally:
+        conn.close()
+
+def create_notification(user_id, project_id, notification_type, message, priority='normal', expiry_days=30):
+    conn = get_db()
+    expiry_date = datetime.now(timezone.utc) + timedelta(days=expiry_days)
+    
+    # Масові сповіщення в межах вікна збільшують лічильник уже наявного непрочитаного запису
+    digest_bucket = None
+    if notification_type in NOTIFICATION_DIGEST_TYPES:
+        digest_bucket = str(int(time.time() // app.config['NOTIFICATION_DIGEST_WINDOW']))
+    
+    try:
+        with nested_transaction(conn):
+            run_query(conn, 'notification_upsert',
+                      (user_id, project_id, notification_type, message, priority, expiry_date, digest_bucket))
+    except Exception as e:
+        logger.error(f"Помилка створення сповіщення: {str(e)}")
+    finally:
+        conn.close()
+
+def notify_users(user_ids, project_id, notification_type, message):
+    # Розсилка однакового сповіщення кільком користувачам
+    with trace_span('notification.fanout', {'notification.type': notification_type,
+                                            'notification.recipients': len(user_ids)}):
+        for user_id in user_ids:
+            create_notification(user_id, project_id, notification_type, message)
+# Допоміжні функції для роботи з користувачами
+def get_user_by_id(user_id):
+    conn = get_db()
+    c = conn.cursor()
+    run_query(c, 'user_by_id', (user_id,))
+    user = c.fetchone()
+    conn.close()
+    
+    if user:
+        return {
+            'id': user['id'],
+            'name': user['name'],
+            'email': user['email'],
+            'role': user['role']
         }
     return None
 
 def get_user_by_email(email):
     conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE email=?", (email,))
+    run_query(c, 'user_by_email', (email,))
     user = c.fetchone()
     conn.close()
     return user if user else None
 
+# Серіалізація записів: спільна для списків і для журналу змін
+def task_to_dict(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'status': row['status'],
+        'priority': row['priority'],
+        'created_at': row['created_at'],
+        'deadline': row['deadline'],
+        'assigned_to': row['assigned_to'],
+        'assigned_user_name': row['assigned_user_name']
+    }
+
+def comment_to_dict(row):
+    return {
+        'id': row['id'],
+        'content': row['content'],
+        'timestamp': row['timestamp'],
+        'parent_id': row['parent_id'],
+        'author_name': row['author_name']
+    }
+
+def file_to_dict(row):
+    return {
+        'id': row['id'],
+        'filename': row['filename'],
+        'file_size': row['file_size'],
+        'file_type': row['file_type'],
+        'upload_date': row['upload_date'],
+        'user_name': row['user_name']
+    }
+
+def event_to_dict(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'event_type': row['event_type'],
+        'start_time': row['start_time'],
+        'end_time': row['end_time'],
+        'recurrence': row['recurrence'],
+        'project_id': row['project_id'],
+        'created_by': row['creator_name']
+    }
+
+def member_to_dict(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'email': row['email'],
+        'role': row['role']
+    }
+
+def project_to_dict(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'],
+        'manager_id': row['manager_id'],
+        'deadline': row['deadline'],
+        'status': row['status'],
+        'max_specialists': row['max_specialists']
+    }
+
+def load_comment_threads(c, roots_sql, roots_params, depth):
+    # Один рекурсивний запит повертає корені та нащадків до глибини depth,
+    # упорядкованих за рівнем, тож батьківський вузол завжди з'являється раніше за дочірній
+    c.execute(f"""
+        WITH RECURSIVE
+        roots(id) AS ({roots_sql}),
+        thread(id, depth) AS (
+            SELECT id, 0 FROM roots
+            UNION ALL
+            SELECT cm.id, thread.depth + 1
+            FROM comments cm
+            JOIN thread ON cm.parent_id = thread.id
+            WHERE thread.depth < ?
+        )
+        SELECT cm.id, cm.content, cm.timestamp, cm.parent_id, u.name as author_name, thread.depth,
+               (SELECT COUNT(*) FROM comments r WHERE r.parent_id = cm.id) as reply_count
+        FROM thread
+        JOIN comments cm ON cm.id = thread.id
+        LEFT JOIN users u ON cm.user_id = u.id
+        ORDER BY thread.depth, cm.timestamp, cm.id
+    """, (*roots_params, depth))
+    
+    roots = []
+    nodes = {}
+    for row in c.fetchall():
+        node = comment_to_dict(row)
+        node['reply_count'] = row['reply_count']
+        node['replies'] = []
+        nodes[row['id']] = node
+        if row['depth'] == 0:
+            roots.append(node)
+        else:
+            nodes[row['parent_id']]['replies'].append(node)
+    
+    # Вузли на межі глибини мають відповіді, що догружаються окремо
+    for node in nodes.values():
+        node['has_more_replies'] = node['reply_count'] > len(node['replies'])
+    return roots
+
+def fetch_task(c, task_id):
+    c.execute("""
+        SELECT t.*, u.name as assigned_user_name
+        FROM tasks t
+        LEFT JOIN users u ON t.assigned_to = u.id
+        WHERE t.id = ?
+    """, (task_id,))
+    row = c.fetchone()
+    return task_to_dict(row) if row else None
+
+def fetch_comment(c, comment_id):
+    c.execute("""
+        SELECT c.id, c.content, c.timestamp, c.parent_id, u.name as author_name
+        FROM comments c
+        JOIN users u ON c.user_id = u.id
+        WHERE c.id = ?
+    """, (comment_id,))
+    row = c.fetchone()
+    return comment_to_dict(row) if row else None
+
+def fetch_file(c, file_id):
+    c.execute("""
+        SELECT f.*, u.name as user_name
+        FROM files f
+        JOIN users u ON f.user_id = u.id
+        WHERE f.id = ?
+    """, (file_id,))
+    row = c.fetchone()
+    return file_to_dict(row) if row else None
+
+def fetch_event(c, event_id):
+    c.execute("""
+        SELECT e.*, u.name as creator_name
+        FROM calendar_events e
+        LEFT JOIN users u ON e.created_by = u.id
+        WHERE e.id = ?
+    """, (event_id,))
+    row = c.fetchone()
+    return event_to_dict(row) if row else None
+
+def fetch_member(c, project_id, user_id):
+    c.execute("""
+        SELECT u.id, u.name, u.email, pm.role
+        FROM project_members pm
+        JOIN users u ON pm.user_id = u.id
+        WHERE pm.project_id = ? AND pm.user_id = ?
+    """, (project_id, user_id))
+    row = c.fetchone()
+    return member_to_dict(row) if row else None
+
+def fetch_project(c, project_id):
+    c.execute("SELECT * FROM projects WHERE id = ?", (project_id,))
+    row = c.fetchone()
+    return project_to_dict(row) if row else None
+
+# Кеш результатів для дорогих маршрутів читання
+CachedResponse = namedtuple('CachedResponse', ['status', 'mimetype', 'body'])
+
+class MemoryCacheBackend:
+    """LRU-кеш у пам'яті процесу з обмеженням розміру та TTL"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.tag_index = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            expires_at, tags, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags, ttl):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, tags, value)
+            for tag in tags:
+                self.tag_index[tag].add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, tags):
+        with self.lock:
+            keys = set()
+            for tag in tags:
+                keys |= self.tag_index.pop(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tag_index.clear()
+
+    def size(self):
+        return len(self.entries)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            for tag in entry[1]:
+                keys = self.tag_index.get(tag)
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self.tag_index[tag]
+
+
+class SQLiteCacheBackend:
+    """Кеш у локальному файлі SQLite, спільний для всіх процесів-воркерів"""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cache_entries
+                (key TEXT PRIMARY KEY,
+                 status INTEGER NOT NULL,
+                 mimetype TEXT,
+                 body BLOB,
+                 expires_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS cache_tags
+                (tag TEXT NOT NULL,
+                 key TEXT NOT NULL,
+                 PRIMARY KEY (tag, key)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at);
+        ''')
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA synchronous = OFF")
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT status, mimetype, body FROM cache_entries WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            return CachedResponse(*row) if row else None
+        finally:
+            conn.close()
+
+    def set(self, key, value, tags, ttl):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+                conn.execute("""
+                    INSERT OR REPLACE INTO cache_entries (key, status, mimetype, body, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, value.status, value.mimetype, value.body, time.time() + ttl))
+                conn.executemany("INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+                                 [(tag, key) for tag in tags])
+                # Видаляємо прострочені записи та найстаріші понад ліміт
+                conn.execute("""
+                    DELETE FROM cache_entries WHERE key IN (
+                        SELECT key FROM cache_entries
+                        ORDER BY expires_at DESC
+                        LIMIT -1 OFFSET ?
+                    ) OR expires_at <= ?
+                """, (self.max_entries, time.time()))
+        finally:
+            conn.close()
+
+    def invalidate(self, tags):
+        conn = self._connect()
+        try:
+            with conn:
+                placeholders = ', '.join('?' * len(tags))
+                c = conn.execute(f"""
+                    DELETE FROM cache_entries WHERE key IN (
+                        SELECT key FROM cache_tags WHERE tag IN ({placeholders})
+                    )
+                """, list(tags))
+                conn.execute(f"DELETE FROM cache_tags WHERE tag IN ({placeholders})", list(tags))
+                return c.rowcount
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM cache_entries")
+                conn.execute("DELETE FROM cache_tags")
+        finally:
+            conn.close()
+
+    def size(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        finally:
+            conn.close()
+
+class ResultCache:
+    def __init__(self):
+        self._backend = None
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            if app.config['CACHE_BACKEND'] == 'sqlite':
+                self._backend = SQLiteCacheBackend(app.config['CACHE_DB_PATH'], app.config['CACHE_MAX_ENTRIES'])
+            else:
+                self._backend = MemoryCacheBackend(app.config['CACHE_MAX_ENTRIES'])
+        return self._backend
+
+    def cached(self, *tags, scope='role', ttl=None):
+        # scope='role' - спільний результат для ролі, scope='user' - окремий для кожного користувача
+        def decorator(f):
+            @wraps(f)
+            def decorated(current_user, *args, **kwargs):
+                if not app.config['CACHE_ENABLED']:
+                    return f(current_user, *args, **kwargs)
+
+                principal = f"{current_user['role']}:{current_user['id']}" if scope == 'user' else current_user['role']
+                key = f"{f.__name__}|{principal}|{request.full_path}"
+
+                cached = self.backend.get(key)
+                if cached:
+                    self.hits[f.__name__] += 1
+                    response = app.response_class(cached.body, status=cached.status, mimetype=cached.mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self.misses[f.__name__] += 1
+                response = app.make_response(f(current_user, *args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(
+                        key,
+                        CachedResponse(response.status_code, response.mimetype, response.get_data()),
+                        [tag.format(**kwargs) for tag in tags],
+                        ttl or app.config['CACHE_TTL_SECONDS']
+                    )
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated
+        return decorator
+
+    def invalidate(self, *tags):
+        tags = [str(tag) for tag in tags if tag]
+        if tags:
+            self.invalidations += 1
+            self.backend.invalidate(tags)
+
+    def stats(self):
+        routes = {}
+        for route in set(self.hits) | set(self.misses):
+            total = self.hits[route] + self.misses[route]
+            routes[route] = {
+                'hits': self.hits[route],
+                'misses': self.misses[route],
+                'hit_ratio': self.hits[route] / total if total else None
+            }
+        hits = sum(self.hits.values())
+        total = hits + sum(self.misses.values())
+        return {
+            'backend': app.config['CACHE_BACKEND'],
+            'entries': self.backend.size(),
+            'hits': hits,
+            'misses': total - hits,
+            'hit_ratio': hits / total if total else None,
+            'invalidations': self.invalidations,
+            'routes': routes
+        }
+
+result_cache = ResultCache()
+
+# Кеш користувачів для token_required, щоб не читати users на кожен запит
+principal_cache = MemoryCacheBackend(4096)
+PRINCIPAL_CACHE_TTL = 300
+
+def invalidate_local_caches(tags):
+    result_cache.invalidate(*tags)
+    principal_cache.invalidate([tag for tag in tags if tag.startswith('user:')])
+    recurrence_cache.invalidate([tag for tag in tags if tag.startswith('calendar_event:')])
+
+def record_change(c, entity_type, entity_id, project_id=None, operation='update', data=None, tags=()):
+    # Запис іде в ту саму транзакцію, що й зміна; інвалідація - після успішної відповіді
+    tags = list(dict.fromkeys([f'{entity_type}:{entity_id}', *[str(tag) for tag in tags]]))
+    c.execute("""
+        INSERT INTO change_log (entity_type, entity_id, project_id, operation, data, tags)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (entity_type, entity_id, project_id, operation,
+          json.dumps(data, ensure_ascii=False, default=str) if data is not None else None,
+          ' '.join(tags)))
+    if has_request_context():
+        g.setdefault('pending_invalidations', []).extend(tags)
+    return c.lastrowid
+
+@app.after_request
+def apply_pending_invalidations(response):
+    tags = g.pop('pending_invalidations', None)
+    if tags and response.status_code < 400:
+        invalidate_local_caches(tags)
+    return response
+
+class TransactionStats:
+    """Фіксації та savepoint'и на запит для з'єднань UnitOfWork"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(lambda: {'requests': 0, 'commits': 0, 'savepoints': 0, 'rollbacks': 0})
+
+    def record(self, endpoint, uow, rolled_back):
+        with self.lock:
+            entry = self.endpoints[endpoint or 'unknown']
+            entry['requests'] += 1
+            entry['commits'] += uow.commits
+            entry['savepoints'] += uow.savepoints
+            entry['rollbacks'] += rolled_back
+
+    def stats(self):
+        with self.lock:
+            endpoints = {name: {**entry, 'commits_per_request': entry['commits'] / entry['requests']}
+                         for name, entry in self.endpoints.items()}
+        requests = sum(entry['requests'] for entry in endpoints.values())
+        commits = sum(entry['commits'] for entry in endpoints.values())
+        return {
+            'requests': requests,
+            'commits': commits,
+            'commits_per_request': commits / requests if requests else None,
+            'endpoints': endpoints
+        }
+
+transaction_stats = TransactionStats()
+
+# Реєструється після apply_pending_invalidations, тож виконується раніше за неї:
+# кеші скидаються лише після фіксації транзакції запиту
+@app.after_request
+def finish_unit_of_work(response):
+    uow = g.get('db')
+    if uow is not None:
+        if response.status_code < 400:
+            uow.commit()
+        elif uow.conn.in_transaction:
+            uow.rollback()
+            g.db_rolled_back = True
+    return response
+
+@app.teardown_request
+def close_unit_of_work(exc):
+    # Після необробленого винятку незафіксовані зміни відкочуються разом із закриттям з'єднання
+    uow = g.pop('db', None)
+    if uow is not None:
+        rolled_back = g.pop('db_rolled_back', False)
+        if uow.conn.in_transaction:
+            uow.rollback()
+            rolled_back = True
+        uow.conn.close()
+        transaction_stats.record(request.endpoint, uow, rolled_back)
+
+class InvalidationBus:
+    """Читає change_log і застосовує зміни інших воркерів до локальних кешів"""
+
+    def __init__(self):
+        self.last_id = None
+        self.subscribers = []
+        self.applied = threading.Condition()
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def poll(self):
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            if self.last_id is None:
+                # Історію до старту воркера не відтворюємо
+                c.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+                last_id = c.fetchone()[0]
+                events = []
+            else:
+                c.execute("""
+                    SELECT id, entity_type, entity_id, project_id, tags
+                    FROM change_log
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT 1000
+                """, (self.last_id,))
+                events = [dict(row) for row in c.fetchall()]
+                last_id = events[-1]['id'] if events else self.last_id
+        finally:
+            conn.close()
+
+        # Власні події теж застосовуються: паралельний запит цього воркера міг закешувати
+        # стан до фіксації вже після локальної інвалідації
+        tags = [tag for event in events for tag in (event['tags'] or '').split()]
+        if tags:
+            invalidate_local_caches(list(dict.fromkeys(tags)))
+        for event in events:
+            for callback in self.subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error(f"Помилка обробника змін {callback.__name__}: {str(e)}")
+
+        with self.applied:
+            self.last_id = last_id
+            self.applied.notify_all()
+        return len(events)
+
+    def wait_for(self, change_id, timeout=None):
+        # Чекає, доки подія з change_id буде застосована в цьому процесі
+        with self.applied:
+            return self.applied.wait_for(
+                lambda: self.last_id is not None and self.last_id >= change_id, timeout
+            )
+
+invalidation_bus = InvalidationBus()
+
+@background_job(lambda: app.config['INVALIDATION_POLL_INTERVAL'])
+def poll_invalidation_bus():
+    invalidation_bus.poll()
+
+@background_job(lambda: 3600)
+def prune_change_log():
+    conn = get_db()
+    try:
+        conn.execute("DELETE FROM change_log WHERE created_at < datetime('now', ?)",
+                     (f"-{app.config['CHANGE_LOG_RETENTION_DAYS']} days",))
+        conn.commit()
+    finally:
+        conn.close()
+
+class DeadlineScheduler:
+    """Купа нагадувань про дедлайни, упорядкована за часом спрацювання.
+    
+    Дедлайни читаються з БД один раз, далі купа оновлюється подіями з change_log.
+    Застарілі записи купи не видаляються, а пропускаються під час спрацювання.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}  # (entity_type, entity_id) -> актуальна дата дедлайну
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def schedule(self, entity_type, entity_id, deadline):
+        key = (entity_type, entity_id)
+        with self.lock:
+            if deadline is None:
+                self.deadlines.pop(key, None)
+                return
+            if self.deadlines.get(key) == deadline:
+                return
+            self.deadlines[key] = deadline
+            for days in DEADLINE_REMINDER_DAYS:
+                remind_at = datetime.combine(deadline - timedelta(days=days), datetime.min.time()) \
+                    + timedelta(hours=DEADLINE_REMINDER_HOUR)
+                heapq.heappush(self.heap, (remind_at, entity_type, entity_id, deadline, days))
+
+    @staticmethod
+    def parse_deadline(value):
+        try:
+            return datetime.fromisoformat(str(value)[:10]).date() if value else None
+        except ValueError:
+            return None
+
+    def load(self):
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            c.execute("""
+                SELECT 'task' as entity_type, t.id, t.deadline FROM tasks t
+                JOIN projects p ON p.id = t.project_id AND p.deleted_at IS NULL
+                WHERE t.status != 'completed' AND t.deadline >= date('now', 'localtime')
+                UNION ALL
+                SELECT 'project', id, deadline FROM projects
+                WHERE status = 'active' AND deleted_at IS NULL AND deadline >= date('now', 'localtime')
+            """)
+            rows = c.fetchall()
+        finally:
+            conn.close()
+        for row in rows:
+            self.schedule(row['entity_type'], row['id'], self.parse_deadline(row['deadline']))
+        self.loaded = True
+        logger.info(f"Планувальник дедлайнів завантажив {len(rows)} дедлайнів")
+
+    def refresh(self, entity_type, entity_id):
+        # Перечитує один рядок після зміни; видалений чи завершений запис скасовує нагадування
+        conn = get_db()
+        try:
+            if entity_type == 'task':
+                row = conn.execute("""
+                    SELECT t.deadline FROM tasks t
+                    JOIN projects p ON p.id = t.project_id AND p.deleted_at IS NULL
+                    WHERE t.id = ? AND t.status != 'completed'
+                """, (entity_id,)).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT deadline FROM projects WHERE id = ? AND status = 'active' AND deleted_at IS NULL",
+                    (entity_id,)).fetchone()
+        finally:
+            conn.close()
+        self.schedule(entity_type, entity_id, self.parse_deadline(row['deadline']) if row else None)
+
+    def next_delay(self):
+        if not self.loaded:
+            return 0
+        with self.lock:
+            if not self.heap:
+                return DEADLINE_SCHEDULER_MAX_SLEEP
+            delay = (self.heap[0][0] - datetime.now()).total_seconds()
+        return min(max(delay, 0), DEADLINE_SCHEDULER_MAX_SLEEP)
+
+    def pop_due(self):
+        now = datetime.now()
+        due = {}
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                remind_at, entity_type, entity_id, deadline, days = heapq.heappop(self.heap)
+                key = (entity_type, entity_id)
+                if self.deadlines.get(key) != deadline or deadline < now.date():
+                    continue
+                # Після простою надсилаємо лише найближче до дедлайну з пропущених нагадувань
+                if key not in due or days < due[key][1]:
+                    due[key] = (deadline, days)
+                if days == min(DEADLINE_REMINDER_DAYS):
+                    self.deadlines.pop(key, None)
+        return due
+
+    def send(self, due):
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            messages = defaultdict(list)  # (user_id, project_id) -> тексти нагадувань
+            for (entity_type, entity_id), (deadline, days) in due.items():
+                # Кожен воркер має свою купу, тож нагадування надсилає той, хто першим його зафіксував
+                c.execute("""
+                    INSERT OR IGNORE INTO deadline_reminders_sent (entity_type, entity_id, deadline, days_before)
+                    VALUES (?, ?, ?, ?)
+                """, (entity_type, entity_id, deadline.isoformat(), days))
+                if c.rowcount == 0:
+                    continue
+                
+                if entity_type == 'task':
+                    c.execute("""
+                        SELECT t.title, t.project_id, COALESCE(t.assigned_to, p.manager_id) as user_id
+                        FROM tasks t
+                        JOIN projects p ON p.id = t.project_id AND p.deleted_at IS NULL
+                        WHERE t.id = ?
+                    """, (entity_id,))
+                    task = c.fetchone()
+                    if not task:
+                        continue
+                    project_id, label, recipients = task['project_id'], f"завдання «{task['title']}»", [task['user_id']]
+                else:
+                    c.execute("SELECT name FROM projects WHERE id = ? AND deleted_at IS NULL", (entity_id,))
+                    project = c.fetchone()
+                    if not project:
+                        continue
+                    c.execute("SELECT user_id FROM project_members WHERE project_id = ?", (entity_id,))
+                    project_id, label = entity_id, f"проєкт «{project['name']}»"
+                    recipients = [row['user_id'] for row in c.fetchall()]
+                
+                days_left = (deadline - datetime.now().date()).days
+                when = 'сьогодні' if days_left == 0 else f"через {days_left} дн."
+                for user_id in recipients:
+                    messages[(user_id, project_id)].append(f"{label} - {when} ({deadline.isoformat()})")
+            
+            # Усі нагадування одного користувача по проєкту об'єднуються в одне сповіщення
+            expiry_date = datetime.now(timezone.utc) + timedelta(days=30)
+            c.executemany("""
+                INSERT INTO notifications (user_id, project_id, type, message, priority, expiry_date)
+                VALUES (?, ?, 'deadline_reminder', ?, 'high', ?)
+            """, [
+                (user_id, project_id,
+                 f"Нагадування про дедлайн: {items[0]}" if len(items) == 1
+                 else "Наближаються дедлайни: " + '; '.join(items),
+                 expiry_date)
+                for (user_id, project_id), items in messages.items() if user_id
+            ])
+            conn.commit()
+            return len(messages)
+        finally:
+            conn.close()
+
+deadline_scheduler = DeadlineScheduler()
+
+@invalidation_bus.subscribe
+def reschedule_deadline(event):
+    if deadline_scheduler.loaded and event['entity_type'] in ('task', 'project'):
+        deadline_scheduler.refresh(event['entity_type'], event['entity_id'])
+
+@background_job(deadline_scheduler.next_delay)
+def send_deadline_reminders():
+    if not deadline_scheduler.loaded:
+        deadline_scheduler.load()
+    due = deadline_scheduler.pop_due()
+    if due:
+        count = deadline_scheduler.send(due)
+        logger.info(f"Надіслано {count} сповіщень про {len(due)} дедлайнів")
+
+class NotificationSweeper:
+    """Пакетне видалення (або архівування) прострочених і старих прочитаних сповіщень"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.totals = defaultdict(int)
+        self.last_run = None
+
+    def _sweep(self, c, where, params):
+        # Кожен пакет - окрема коротка транзакція, щоб не тримати блокування запису
+        batch = app.config['NOTIFICATION_SWEEP_BATCH']
+        removed = 0
+        while not background_stop.is_set():
+            c.execute(f"SELECT id FROM notifications WHERE {where} LIMIT ?", (*params, batch))
+            ids = [row['id'] for row in c.fetchall()]
+            if not ids:
+                break
+            placeholders = ', '.join('?' * len(ids))
+            if app.config['NOTIFICATION_ARCHIVE']:
+                c.execute(f"""
+                    INSERT OR REPLACE INTO notifications_archive (
+                        id, user_id, project_id, type, message, created_at, is_read, priority, expiry_date, count
+                    )
+                    SELECT id, user_id, project_id, type, message, created_at, is_read, priority, expiry_date, count
+                    FROM notifications WHERE id IN ({placeholders})
+                """, ids)
+            c.execute(f"DELETE FROM notifications WHERE id IN ({placeholders})", ids)
+            c.connection.commit()
+            removed += len(ids)
+            if len(ids) < batch:
+                break
+        return removed
+
+    def run(self):
+        # Один прохід за раз у межах процесу; кілька воркерів лише ділять між собою пакети
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.monotonic()
+            conn = get_db()
+            try:
+                c = conn.cursor()
+                report = {
+                    'expired': self._sweep(c, "expiry_date IS NOT NULL AND expiry_date <= datetime('now')", ()),
+                    'compacted': {}
+                }
+                
+                retention = app.config['NOTIFICATION_RETENTION_DAYS']
+                for notification_type, days in retention.items():
+                    report['compacted'][notification_type] = self._sweep(
+                        c, "is_read = 1 AND type = ? AND created_at < datetime('now', ?)",
+                        (notification_type, f'-{days} days')
+                    )
+                placeholders = ', '.join('?' * len(retention)) or "''"
+                report['compacted']['default'] = self._sweep(
+                    c, f"is_read = 1 AND type NOT IN ({placeholders}) AND created_at < datetime('now', ?)",
+                    (*retention, f"-{app.config['NOTIFICATION_DEFAULT_RETENTION_DAYS']} days")
+                )
+                
+                c.execute("PRAGMA freelist_count")
+                report['free_pages'] = c.fetchone()[0]
+            finally:
+                conn.close()
+            
+            report['reclaimed'] = report['expired'] + sum(report['compacted'].values())
+            report['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+            report['finished_at'] = datetime.now(timezone.utc).isoformat()
+            self.runs += 1
+            self.totals['expired'] += report['expired']
+            self.totals['compacted'] += report['reclaimed'] - report['expired']
+            self.last_run = report
+            if report['reclaimed']:
+                logger.info(f"Прибрано {report['reclaimed']} сповіщень")
+            return report
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'archive': app.config['NOTIFICATION_ARCHIVE'],
+            'retention_days': dict(app.config['NOTIFICATION_RETENTION_DAYS'],
+                                   default=app.config['NOTIFICATION_DEFAULT_RETENTION_DAYS']),
+            'totals': {'expired': self.totals['expired'], 'compacted': self.totals['compacted']},
+            'last_run': self.last_run
+        }
+
+notification_sweeper = NotificationSweeper()
+
+@background_job(lambda: app.config['NOTIFICATION_SWEEP_INTERVAL'])
+def sweep_notifications():
+    notification_sweeper.run()
+
 # Аутентифікація та реєстрація
 @app.route('/register', methods=['POST'])
 def register():
@@ -271,6 +2966,7 @@ def register():
             VALUES (?, ?, ?, ?, ?)
         """, (data['name'], data['email'], hashed_password, data['role'], 
               datetime.now(timezone.utc)))
+        record_change(c, 'user', c.lastrowid, operation='insert', tags=['users'])
         
         conn.commit()
         return jsonify({'message': 'Реєстрація успішна'}), 201
@@ -338,11 +3034,12 @@ def get_projects(current_user):
                 SELECT 
                     p.*,
                     u.name as manager_name,
-                    COUNT(DISTINCT pm.user_id) as members_count
+                    COUNT(DISTINCT pm.user_id) as members_count,
+                    EXISTS (SELECT 1 FROM archived_projects a WHERE a.project_id = p.id) as in_archive
                 FROM projects p
                 LEFT JOIN users u ON p.manager_id = u.id
                 LEFT JOIN project_members pm ON p.id = pm.project_id
-                WHERE p.status != 'archived'
+                WHERE p.status != 'archived' AND p.deleted_at IS NULL
                 GROUP BY p.id
             """)
             
@@ -352,11 +3049,12 @@ def get_projects(current_user):
                 SELECT 
                     p.*,
                     u.name as manager_name,
-                    COUNT(DISTINCT pm.user_id) as members_count
+                    COUNT(DISTINCT pm.user_id) as members_count,
+                    EXISTS (SELECT 1 FROM archived_projects a WHERE a.project_id = p.id) as in_archive
                 FROM projects p
                 LEFT JOIN users u ON p.manager_id = u.id
                 LEFT JOIN project_members pm ON p.id = pm.project_id
-                WHERE p.manager_id = ? AND p.status != 'archived'
+                WHERE p.manager_id = ? AND p.status != 'archived' AND p.deleted_at IS NULL
                 GROUP BY p.id
             """, (current_user['id'],))
             
@@ -367,6 +3065,7 @@ def get_projects(current_user):
                     p.*,
                     u.name as manager_name,
                     COUNT(DISTINCT pm.user_id) as members_count,
+                    EXISTS (SELECT 1 FROM archived_projects a WHERE a.project_id = p.id) as in_archive,
                     CASE WHEN EXISTS (
                         SELECT 1 FROM project_members 
                         WHERE project_id = p.id AND user_id = ?
@@ -374,7 +3073,7 @@ def get_projects(current_user):
                 FROM projects p
                 LEFT JOIN users u ON p.manager_id = u.id
                 LEFT JOIN project_members pm ON p.id = pm.project_id
-                WHERE p.status = 'active'
+                WHERE p.status = 'active' AND p.deleted_at IS NULL
                 GROUP BY p.id
             """, (current_user['id'],))
         
@@ -405,7 +3104,8 @@ def get_projects(current_user):
                 'deadline': row['deadline'],
                 'status': row['status'],
                 'members_count': row['members_count'],
-                'unread_notifications': unread_count
+                'unread_notifications': unread_count,
+                'in_archive': bool(row['in_archive'])
             }
             
             if current_user['role'] == 'specialist':
@@ -427,19 +3127,28 @@ def get_comments(current_user, project_id):
     try:
         conn = get_db()
         c = conn.cursor()
+        
+        # Деревоподібний режим: сторінка кореневих гілок разом з відповідями до заданої глибини
+        if request.args.get('threaded'):
+            limit = max(1, min(request.args.get('limit', COMMENT_THREADS_PAGE_SIZE, type=int), 100))
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            depth = max(0, min(request.args.get('depth', COMMENT_THREAD_DEPTH, type=int), COMMENT_THREAD_MAX_DEPTH))
+            threads = load_comment_threads(c, """
+                SELECT id FROM comments
+                WHERE project_id = ? AND parent_id IS NULL
+                ORDER BY timestamp, id
+                LIMIT ? OFFSET ?
+            """, (project_id, limit + 1, offset), depth)
+            return jsonify({'threads': threads[:limit], 'has_more': len(threads) > limit}), 200
+        
         c.execute("""
-            SELECT c.id, c.content, c.timestamp, u.name as author_name
+            SELECT c.id, c.content, c.timestamp, c.parent_id, u.name as author_name
             FROM comments c
             JOIN users u ON c.user_id = u.id
             WHERE c.project_id = ?
             ORDER BY c.timestamp ASC
         """, (project_id,))
-        comments = [{
-            'id': row['id'],
-            'content': row['content'],
-            'timestamp': row['timestamp'],
-            'author_name': row['author_name']
-        } for row in c.fetchall()]
+        comments = [comment_to_dict(row) for row in c.fetchall()]
         return jsonify(comments), 200
     except Exception as e:
         logger.error(f"Error fetching comments: {str(e)}")
@@ -447,6 +3156,45 @@ def get_comments(current_user, project_id):
     finally:
         conn.close()
 
+@app.route('/comments/<int:comment_id>/replies', methods=['GET'])
+@token_required
+def get_comment_replies(current_user, comment_id):
+    # Догрузка глибоких відповідей, які не увійшли у відповідь деревоподібного списку
+    limit = max(1, min(request.args.get('limit', COMMENT_THREADS_PAGE_SIZE, type=int), 100))
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    depth = max(0, min(request.args.get('depth', COMMENT_THREAD_DEPTH, type=int), COMMENT_THREAD_MAX_DEPTH))
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Коментарі видаленого проєкту недоступні, поки їх не прибрала фонова черга
+        query = """
+            SELECT 1 FROM comments cm
+            JOIN projects p ON p.id = cm.project_id AND p.deleted_at IS NULL
+            WHERE cm.id = ?
+        """
+        c.execute(query, (comment_id,))
+        if not c.fetchone():
+            # Коментар може належати проєкту, перенесеному в архівну БД
+            use_project_archive(conn)
+            c.execute(query, (comment_id,))
+            if not c.fetchone():
+                return jsonify({'message': 'Comment not found'}), 404
+        
+        replies = load_comment_threads(c, """
+            SELECT id FROM comments
+            WHERE parent_id = ?
+            ORDER BY timestamp, id
+            LIMIT ? OFFSET ?
+        """, (comment_id, limit + 1, offset), depth)
+        return jsonify({'replies': replies[:limit], 'has_more': len(replies) > limit}), 200
+    except Exception as e:
+        logger.error(f"Error fetching comment replies: {str(e)}")
+        return jsonify({'message': 'Error fetching comment replies'}), 500
+    finally:
+        conn.close()
+
 @app.route('/projects/<int:project_id>/comments', methods=['POST'])
 @token_required
 def add_comment(current_user, project_id):
@@ -456,10 +3204,19 @@ def add_comment(current_user, project_id):
     try:
         conn = get_db()
         c = conn.cursor()
+        
+        # Відповідь можлива лише на коментар цього ж проєкту
+        if data.get('parent_id') is not None:
+            c.execute("SELECT 1 FROM comments WHERE id = ? AND project_id = ?", (data['parent_id'], project_id))
+            if not c.fetchone():
+                return jsonify({'message': 'Parent comment not found'}), 400
+        
         c.execute("""
-            INSERT INTO comments (project_id, user_id, content)
-            VALUES (?, ?, ?)
-        """, (project_id, current_user['id'], data['content']))
+            INSERT INTO comments (project_id, user_id, content, parent_id)
+            VALUES (?, ?, ?, ?)
+        """, (project_id, current_user['id'], data['content'], data.get('parent_id')))
+        comment_id = c.lastrowid
+        record_change(c, 'comment', comment_id, project_id, 'insert', fetch_comment(c, comment_id))
         conn.commit()
         return jsonify({'message': 'Comment added successfully'}), 201
     except Exception as e:
@@ -518,6 +3275,11 @@ def create_project(current_user):
             f"Створено проєкт: {data['name']}"
         )
         
+        record_change(c, 'project', project_id, project_id, 'insert', fetch_project(c, project_id),
+                      tags=['users', f"user:{current_user['id']}"])
+        record_change(c, 'member', current_user['id'], project_id, 'insert',
+                      fetch_member(c, project_id, current_user['id']))
+        
         conn.commit()
         return jsonify({
             'message': 'Проєкт успішно створено',
@@ -547,7 +3309,7 @@ def update_project(current_user, project_id):
         c = conn.cursor()
         
         # Перевіряємо права на проєкт
-        c.execute("SELECT manager_id FROM projects WHERE id = ?", (project_id,))
+        run_query(c, 'project_manager', (project_id,))
         project = c.fetchone()
         
         if not project:
@@ -557,45 +3319,33 @@ def update_project(current_user, project_id):
             return jsonify({'message': 'Недостатньо прав'}), 403
         
         # Оновлюємо проєкт
-        update_fields = []
-        params = []
-        
-        if 'name' in data:
-            update_fields.append('name = ?')
-            params.append(data['name'])
-        
-        if 'description' in data:
-            update_fields.append('description = ?')
-            params.append(data['description'])
-        
-        if 'deadline' in data:
-            update_fields.append('deadline = ?')
-            params.append(data['deadline'])
+        fields = ['name', 'description', 'deadline']
+        if current_user['role'] == 'admin':
+            fields.append('status')
+        update_fields = [field for field in fields if field in data]
         
-        if 'status' in data and current_user['role'] == 'admin':
-            update_fields.append('status = ?')
-            params.append(data['status'])
+        # Повторно відкритий проєкт повертається з архіву в основну БД
+        if 'status' in update_fields and data['status'] == 'active':
+            restore_project_data(project_id)
         
         if update_fields:
-            params.append(project_id)
-            query = f"UPDATE projects SET {', '.join(update_fields)} WHERE id = ?"
-            c.execute(query, params)
+            run_query(c, 'project_update', update_params('project_update', data, update_fields, id=project_id))
             
             # Логуємо зміни
             log_activity(current_user['id'], project_id, 'project_updated', 
                         f"Оновлено поля проєкту: {', '.join(update_fields)}")
             
             # Сповіщаємо учасників
-            c.execute("SELECT user_id FROM project_members WHERE project_id = ?", (project_id,))
-            members = c.fetchall()
+            run_query(c, 'project_member_ids', (project_id,))
+            notify_users(
+                [member['user_id'] for member in c.fetchall()],
+                project_id,
+                'project_update',
+                f"Проєкт '{data.get('name', 'Невідомий')}' був оновлений"
+            )
             
-            for member in members:
-                create_notification(
-                    member['user_id'],
-                    project_id,
-                    'project_update',
-                    f"Проєкт '{data.get('name', 'Невідомий')}' був оновлений"
-                )
+            record_change(c, 'project', project_id, project_id, 'update', fetch_project(c, project_id),
+                          tags=[f'project:{project_id}'])
         
         conn.commit()
         return jsonify({'message': 'Проєкт успішно оновлено'})
@@ -621,25 +3371,21 @@ def delete_project(current_user, project_id):
         if not c.fetchone():
             return jsonify({'message': 'Project not found'}), 404
         
-        # Удаляем все связанные данные
-        tables = [
-            'project_members', 'tasks', 'calendar_events',
-            'notifications', 'comments', 'grades',
-            'user_activity', 'files'
-        ]
-        
-        for table in tables:
-            c.execute(f"DELETE FROM {table} WHERE project_id = ?", (project_id,))
+        run_query(c, 'project_member_ids', (project_id,))
+        member_ids = [row['user_id'] for row in c.fetchall()]
         
-        # Удаляем сам проект
-        c.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        # Проект скрывается сразу, связанные данные и файлы удаляет фоновая очередь
+        job_id = tombstone(c, 'project', project_id)
         
         # Логируем удаление
         log_activity(current_user['id'], None, 'project_deleted', 
                     f"Deleted project ID: {project_id}")
         
+        record_change(c, 'project', project_id, project_id, 'delete',
+                      tags=[f'project:{project_id}', 'users', *[f'user:{user_id}' for user_id in member_ids]])
+        
         conn.commit()
-        return jsonify({'message': 'Project deleted successfully'})
+        return jsonify({'message': 'Project deleted successfully', 'purge_job_id': job_id}), 202
     
     except Exception as e:
         logger.error(f"Error deleting project: {str(e)}")
@@ -708,6 +3454,10 @@ def join_project(current_user, project_id):
             f"Приєднався до проєкту: {project_info['name']}"
         )
         
+        record_change(c, 'member', current_user['id'], project_id, 'insert',
+                      fetch_member(c, project_id, current_user['id']),
+                      tags=[f'project:{project_id}', 'users', f"user:{current_user['id']}"])
+        
         conn.commit()
         return jsonify({'message': 'Успішно приєднано до проєкту'})
         
@@ -718,30 +3468,357 @@ def join_project(current_user, project_id):
     finally:
         conn.close()
 
-@app.route('/projects/<int:project_id>/calendar', methods=['GET'])
-@token_required
-def get_calendar_events(current_user, project_id):
-    try:
-        conn = get_db()
+def normalize_datetime(value):
+    # Приймає ISO-рядок (з 'T', секундами чи без) і повертає формат зберігання подій
+    return datetime.fromisoformat(value).replace(tzinfo=None).strftime('%Y-%m-%d %H:%M:%S')
+
+def calendar_range_args():
+    # Межі вікна календаря з ?from=&to=; без них вікно необмежене
+    date_from = normalize_datetime(request.args['from']) if request.args.get('from') else '0001-01-01 00:00:00'
+    date_to = normalize_datetime(request.args['to']) if request.args.get('to') else '9999-12-31 23:59:59'
+    return date_from, date_to
+
+# Подія перетинає вікно [from, to), якщо починається до його кінця і закінчується після початку.
+# Нижня межа по start_time зсунута на найдовшу подію проєкту, тож обидві межі йдуть по індексу.
+CALENDAR_RANGE_CONDITION = """
+    e.recurrence IS NULL
+    AND e.start_time < ?
+    AND e.start_time >= datetime(?, printf('-%d seconds', s.max_span))
+    AND (e.end_time > ? OR e.start_time >= ?)
+"""
+# Серії, що почалися до кінця вікна і ще не завершились до його початку
+CALENDAR_RECURRING_CONDITION = """
+    e.recurrence IS NOT NULL
+    AND e.start_time < ?
+    AND (e.recurrence_end IS NULL OR e.recurrence_end > ?)
+"""
+
+Recurrence = namedtuple('Recurrence', ['freq', 'interval', 'byday', 'until', 'count', 'exdates'])
+
+def parse_recurrence(text):
+    # FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=2030-06-01;COUNT=10;EXDATE=2030-01-06,2030-01-13
+    parts = {}
+    for item in text.split(';'):
+        if item.strip():
+            key, _, value = item.partition('=')
+            parts[key.strip().upper()] = value.strip()
+    
+    freq = parts.get('FREQ', '').upper()
+    if freq not in RECURRENCE_FREQUENCIES:
+        raise ValueError(f"Unsupported FREQ: {freq}")
+    interval = int(parts.get('INTERVAL', 1))
+    count = int(parts['COUNT']) if parts.get('COUNT') else None
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("INTERVAL and COUNT must be positive")
+    if count is not None and count > RECURRENCE_MAX_OCCURRENCES:
+        raise ValueError(f"COUNT must not exceed {RECURRENCE_MAX_OCCURRENCES}")
+    
+    byday = ()
+    if parts.get('BYDAY'):
+        byday = tuple(sorted({RECURRENCE_WEEKDAYS.index(day.strip().upper()) for day in parts['BYDAY'].split(',')}))
+    until = datetime.fromisoformat(parts['UNTIL']).replace(tzinfo=None) if parts.get('UNTIL') else None
+    exdates = frozenset(
+        datetime.fromisoformat(day.strip()).date()
+        for day in parts.get('EXDATE', '').split(',') if day.strip()
+    )
+    return Recurrence(freq, interval, byday, until, count, exdates)
+
+def format_recurrence(rule):
+    # Нормалізований рядок правила, що зберігається в calendar_events.recurrence
+    parts = [f'FREQ={rule.freq}']
+    if rule.interval != 1:
+        parts.append(f'INTERVAL={rule.interval}')
+    if rule.byday:
+        parts.append('BYDAY=' + ','.join(RECURRENCE_WEEKDAYS[day] for day in rule.byday))
+    if rule.until:
+        parts.append(f"UNTIL={rule.until:%Y-%m-%d %H:%M:%S}")
+    if rule.count:
+        parts.append(f'COUNT={rule.count}')
+    if rule.exdates:
+        parts.append('EXDATE=' + ','.join(day.isoformat() for day in sorted(rule.exdates)))
+    return ';'.join(parts)
+
+def recurrence_starts(start, rule, skip_to=None):
+    # Лінивий генератор початків повторень; skip_to дозволяє одразу перейти до потрібного періоду
+    k = 0
+    if rule.freq == 'MONTHLY':
+        if skip_to and skip_to > start:
+            months = (skip_to.year - start.year) * 12 + skip_to.month - start.month
+            k = max(0, months // rule.interval - 1)
+        while True:
+            total = start.month - 1 + k * rule.interval
+            year = start.year + total // 12
+            if year > 9999:
+                return
+            try:
+                yield start.replace(year=year, month=total % 12 + 1)
+            except ValueError:
+                pass  # у місяці немає такого дня - повторення пропускається
+            k += 1
+    
+    if rule.freq == 'WEEKLY':
+        origin = start - timedelta(days=start.weekday())
+        offsets = [timedelta(days=day) for day in (rule.byday or (start.weekday(),))]
+        step = timedelta(weeks=rule.interval)
+    else:
+        origin = start
+        offsets = [timedelta(0)]
+        step = timedelta(days=rule.interval)
+    
+    if skip_to and skip_to > origin:
+        k = max(0, (skip_to - origin) // step - 1)
+    try:
+        while True:
+            period = origin + k * step
+            for offset in offsets:
+                occurrence = period + offset
+                if occurrence >= start:
+                    yield occurrence
+            k += 1
+    except OverflowError:
+        return
+
+def last_recurrence(start, rule, until=None):
+    # Початок останнього з COUNT повторень (не пізніше until); без BYDAY і пропущених днів
+    # місяця - арифметикою, інакше обходом, обмеженим RECURRENCE_MAX_OCCURRENCES
+    n = rule.count - 1
+    last = None
+    if rule.freq == 'DAILY':
+        last = start + timedelta(days=n * rule.interval)
+    elif rule.freq == 'WEEKLY' and not rule.byday:
+        last = start + timedelta(weeks=n * rule.interval)
+    elif rule.freq == 'MONTHLY' and start.day <= 28:
+        total = start.month - 1 + n * rule.interval
+        last = start.replace(year=start.year + total // 12, month=total % 12 + 1)
+    if last is not None and (until is None or last <= until):
+        return last
+    last = None
+    for n, occurrence in enumerate(recurrence_starts(start, rule), 1):
+        if n > rule.count or (until and occurrence > until):
+            break
+        last = occurrence
+    return last
+
+def recurrence_end(start, end, rule):
+    # Кінець останнього повторення серії або None для нескінченної серії
+    duration = end - start
+    try:
+        if rule.count:
+            last = last_recurrence(start, rule, rule.until)
+            return last + duration if last else end
+        if rule.until:
+            return max(rule.until, start) + duration
+    except (OverflowError, ValueError):
+        pass  # серія виходить за межі datetime - вважається нескінченною
+    return None
+
+def expand_recurrence(start, end, rule, window_from, window_to):
+    # Повторення, що перетинають вікно; серія ніколи не розгортається за межами вікна
+    duration = end - start
+    # COUNT перетворюється на дату останнього повторення, тож і такі серії перескакують до вікна
+    last = None
+    if rule.count:
+        try:
+            last = last_recurrence(start, rule)
+        except (OverflowError, ValueError):
+            pass
+    skip_to = window_from - duration if window_from - datetime.min > duration else None
+    occurrences = []
+    for occurrence in recurrence_starts(start, rule, skip_to):
+        if occurrence >= window_to or (rule.until and occurrence > rule.until) \
+                or (last and occurrence > last):
+            break
+        occurrence_end = occurrence + duration
+        if (occurrence_end > window_from or occurrence >= window_from) \
+                and occurrence.date() not in rule.exdates:
+            occurrences.append((occurrence, occurrence_end))
+            if len(occurrences) >= RECURRENCE_MAX_OCCURRENCES:
+                break
+    return occurrences
+
+# Розгортання серій кешується за подією та вікном; ключ містить правило, тож зміна події дає новий ключ
+recurrence_cache = MemoryCacheBackend(4096)
+
+def expand_calendar_events(events, date_from, date_to):
+    # Замінює повторювані події їхніми повтореннями у вікні та сортує результат за часом
+    window_from = datetime.strptime(date_from, '%Y-%m-%d %H:%M:%S')
+    window_to = datetime.strptime(date_to, '%Y-%m-%d %H:%M:%S')
+    result = []
+    for event in events:
+        if not event['recurrence']:
+            result.append(event)
+            continue
+        
+        key = f"{event['id']}|{event['start_time']}|{event['end_time']}|{event['recurrence']}|{date_from}|{date_to}"
+        occurrences = recurrence_cache.get(key)
+        if occurrences is None:
+            start = datetime.strptime(event['start_time'], '%Y-%m-%d %H:%M:%S')
+            end = datetime.strptime(event['end_time'], '%Y-%m-%d %H:%M:%S')
+            try:
+                rule = parse_recurrence(event['recurrence'])
+                occurrences = [
+                    (f"{s:%Y-%m-%d %H:%M:%S}", f"{e:%Y-%m-%d %H:%M:%S}")
+                    for s, e in expand_recurrence(start, end, rule, window_from, window_to)
+                ]
+            except ValueError as e:
+                logger.error(f"Невірне правило повторення події {event['id']}: {str(e)}")
+                occurrences = [(event['start_time'], event['end_time'])] \
+                    if start < window_to and (end > window_from or start >= window_from) else []
+            recurrence_cache.set(key, occurrences, [f"calendar_event:{event['id']}"], RECURRENCE_CACHE_TTL)
+        
+        for occurrence_start, occurrence_end in occurrences:
+            result.append(dict(event, start_time=occurrence_start, end_time=occurrence_end))
+    
+    result.sort(key=lambda event: event['start_time'])
+    return result
+
+def load_member_events(c, user_ids, date_from, date_to):
+    # Події всіх проєктів, де беруть участь користувачі, разом зі списком зайнятих учасників
+    if not user_ids:
+        return []
+    placeholders = ', '.join('?' * len(user_ids))
+    c.execute(f"""
+        SELECT e.*, u.name as creator_name, p.name as project_name, group_concat(pm.user_id) as member_ids
+        FROM project_members pm
+        JOIN calendar_spans s ON s.project_id = pm.project_id
+        JOIN calendar_events e ON e.project_id = s.project_id AND {CALENDAR_RANGE_CONDITION}
+        JOIN projects p ON p.id = e.project_id AND p.deleted_at IS NULL
+        LEFT JOIN users u ON e.created_by = u.id
+        WHERE pm.user_id IN ({placeholders})
+        GROUP BY e.id
+        UNION ALL
+        SELECT e.*, u.name as creator_name, p.name as project_name, group_concat(pm.user_id) as member_ids
+        FROM project_members pm
+        JOIN calendar_events e ON e.project_id = pm.project_id AND {CALENDAR_RECURRING_CONDITION}
+        JOIN projects p ON p.id = e.project_id AND p.deleted_at IS NULL
+        LEFT JOIN users u ON e.created_by = u.id
+        WHERE pm.user_id IN ({placeholders})
+        GROUP BY e.id
+    """, (date_to, date_from, date_from, date_from, *user_ids, date_to, date_from, *user_ids))
+    
+    events = []
+    for row in c.fetchall():
+        event = event_to_dict(row)
+        event['project_name'] = row['project_name']
+        event['member_ids'] = [int(user_id) for user_id in row['member_ids'].split(',')]
+        events.append(event)
+    return expand_calendar_events(events, date_from, date_to)
+
+class IntervalTree:
+    """Статичне центроване дерево напіввідкритих інтервалів [start, end) для пошуку перетинів"""
+    
+    Node = namedtuple('Node', ['center', 'by_start', 'by_end', 'left', 'right'])
+    
+    def __init__(self, intervals):
+        # intervals - кортежі (start, end, value); інтервали нульової довжини ні з чим не перетинаються
+        self.root = self._build(sorted((i for i in intervals if i[0] < i[1]), key=lambda i: i[0]))
+    
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        center = intervals[len(intervals) // 2][0]
+        left, here, right = [], [], []
+        for interval in intervals:
+            if interval[1] <= center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        return self.Node(center, here, sorted(here, key=lambda i: i[1], reverse=True),
+                         self._build(left), self._build(right))
+    
+    def overlapping(self, start, end):
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            # Усі інтервали вузла містять center
+            if end <= node.center:
+                for interval in node.by_start:
+                    if interval[0] >= end:
+                        break
+                    result.append(interval)
+                stack.append(node.left)
+            elif start > node.center:
+                for interval in node.by_end:
+                    if interval[1] <= start:
+                        break
+                    result.append(interval)
+                stack.append(node.right)
+            else:
+                result.extend(node.by_start)
+                stack.extend((node.left, node.right))
+        return result
+
+def find_calendar_conflicts(c, project_id, occurrences):
+    # Події учасників проєкту, що перетинаються з будь-яким із повторень нової події
+    c.execute("SELECT pm.user_id, u.name FROM project_members pm JOIN users u ON u.id = pm.user_id WHERE pm.project_id = ?",
+              (project_id,))
+    members = {row['user_id']: row['name'] for row in c.fetchall()}
+    if not occurrences or not members:
+        return []
+    
+    date_from = min(start for start, _ in occurrences).strftime('%Y-%m-%d %H:%M:%S')
+    date_to = max(end for _, end in occurrences).strftime('%Y-%m-%d %H:%M:%S')
+    events = load_member_events(c, list(members), date_from, date_to)
+    tree = IntervalTree([
+        (datetime.fromisoformat(event['start_time']), datetime.fromisoformat(event['end_time']), event)
+        for event in events
+    ])
+    
+    conflicts = {}
+    for start, end in occurrences:
+        for _, _, event in tree.overlapping(start, end):
+            conflicts[(event['id'], event['start_time'])] = {
+                'event_id': event['id'],
+                'title': event['title'],
+                'project_id': event['project_id'],
+                'project_name': event['project_name'],
+                'start_time': event['start_time'],
+                'end_time': event['end_time'],
+                'members': [members[user_id] for user_id in event['member_ids'] if user_id in members]
+            }
+    return sorted(conflicts.values(), key=lambda conflict: conflict['start_time'])
+
+def merge_intervals(intervals):
+    # Сортування та злиття зайнятих інтервалів за O(n log n)
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+@app.route('/projects/<int:project_id>/calendar', methods=['GET'])
+@token_required
+def get_calendar_events(current_user, project_id):
+    try:
+        date_from, date_to = calendar_range_args()
+    except ValueError:
+        return jsonify({'message': 'Невірний формат дати'}), 400
+    
+    try:
+        conn = get_db()
         c = conn.cursor()
         
-        c.execute("""
+        c.execute(f"""
+            SELECT e.*, u.name as creator_name
+            FROM calendar_spans s
+            JOIN calendar_events e ON e.project_id = s.project_id AND {CALENDAR_RANGE_CONDITION}
+            LEFT JOIN users u ON e.created_by = u.id
+            WHERE s.project_id = ?
+            UNION ALL
             SELECT e.*, u.name as creator_name
             FROM calendar_events e
             LEFT JOIN users u ON e.created_by = u.id
-            WHERE e.project_id = ?
-            ORDER BY e.start_time
-        """, (project_id,))
+            WHERE e.project_id = ? AND {CALENDAR_RECURRING_CONDITION}
+        """, (date_to, date_from, date_from, date_from, project_id, project_id, date_to, date_from))
         
-        events = [{
-            'id': row['id'],
-            'title': row['title'],
-            'description': row['description'],
-            'event_type': row['event_type'],
-            'start_time': row['start_time'],
-            'end_time': row['end_time'],
-            'created_by': row['creator_name']
-        } for row in c.fetchall()]
+        events = expand_calendar_events([event_to_dict(row) for row in c.fetchall()], date_from, date_to)
         
         return jsonify(events)
     except Exception as e:
@@ -750,6 +3827,108 @@ def get_calendar_events(current_user, project_id):
     finally:
         conn.close()
 
+@app.route('/calendar', methods=['GET'])
+@token_required
+def get_my_calendar(current_user):
+    # Події всіх проєктів, учасником яких є користувач
+    try:
+        date_from, date_to = calendar_range_args()
+    except ValueError:
+        return jsonify({'message': 'Невірний формат дати'}), 400
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        events = load_member_events(c, [current_user['id']], date_from, date_to)
+        for event in events:
+            del event['member_ids']
+        
+        return jsonify(events)
+    except Exception as e:
+        logger.error(f"Помилка отримання календаря користувача: {str(e)}")
+        return jsonify({'message': 'Помилка отримання календаря'}), 500
+    finally:
+        conn.close()
+
+@app.route('/projects/<int:project_id>/calendar/free-slots', methods=['GET'])
+@token_required
+def get_free_slots(current_user, project_id):
+    # Спільні вільні проміжки команди в робочі години
+    try:
+        now = datetime.now().replace(second=0, microsecond=0)
+        window_from = datetime.fromisoformat(normalize_datetime(request.args['from'])) if request.args.get('from') else now
+        window_to = datetime.fromisoformat(normalize_datetime(request.args['to'])) if request.args.get('to') \
+            else window_from + timedelta(days=7)
+        duration = timedelta(minutes=int(request.args.get('duration', FREE_SLOT_MINUTES)))
+        day_start = datetime.strptime(request.args.get('day_start', WORKDAY_START), '%H:%M').time()
+        day_end = datetime.strptime(request.args.get('day_end', WORKDAY_END), '%H:%M').time()
+    except (ValueError, OverflowError):
+        return jsonify({'message': 'Невірні параметри'}), 400
+    
+    if window_to <= window_from or duration <= timedelta(0) or day_end <= day_start:
+        return jsonify({'message': 'Невірні параметри'}), 400
+    if window_to - window_from > timedelta(days=FREE_SLOTS_MAX_DAYS):
+        return jsonify({'message': f'Діапазон не може перевищувати {FREE_SLOTS_MAX_DAYS} днів'}), 400
+    # Проміжок має вміщатися і в діапазон пошуку, і в робочий день
+    workday = datetime.combine(window_from.date(), day_end) - datetime.combine(window_from.date(), day_start)
+    if duration > min(window_to - window_from, workday):
+        return jsonify({'message': 'Тривалість перевищує діапазон пошуку або робочий день'}), 400
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        run_query(c, 'project_member_ids', (project_id,))
+        member_ids = [row['user_id'] for row in c.fetchall()]
+        if current_user['id'] not in member_ids and current_user['role'] != 'admin':
+            return jsonify({'message': 'У вас немає доступу до цього проєкту'}), 403
+        
+        events = load_member_events(c, member_ids,
+                                    window_from.strftime('%Y-%m-%d %H:%M:%S'),
+                                    window_to.strftime('%Y-%m-%d %H:%M:%S'))
+        busy = merge_intervals(
+            (datetime.fromisoformat(event['start_time']), datetime.fromisoformat(event['end_time']))
+            for event in events
+        )
+        
+        # Один прохід по злитих інтервалах: дні йдуть по порядку, тож індекс лише зростає
+        slots = []
+        i = 0
+        day = window_from.date()
+        while day <= window_to.date():
+            slot_start = max(datetime.combine(day, day_start), window_from)
+            slot_end = min(datetime.combine(day, day_end), window_to)
+            day += timedelta(days=1)
+            if slot_end - slot_start < duration:
+                continue
+            while i < len(busy) and busy[i][1] <= slot_start:
+                i += 1
+            cursor = slot_start
+            j = i
+            while j < len(busy) and busy[j][0] < slot_end:
+                if busy[j][0] - cursor >= duration:
+                    slots.append((cursor, busy[j][0]))
+                cursor = max(cursor, busy[j][1])
+                j += 1
+            if slot_end - cursor >= duration:
+                slots.append((cursor, slot_end))
+        
+        return jsonify({
+            'from': window_from.strftime('%Y-%m-%d %H:%M:%S'),
+            'to': window_to.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': int(duration.total_seconds() // 60),
+            'slots': [
+                {'start': start.strftime('%Y-%m-%d %H:%M:%S'), 'end': end.strftime('%Y-%m-%d %H:%M:%S')}
+                for start, end in slots
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Помилка пошуку вільного часу: {str(e)}")
+        return jsonify({'message': 'Помилка пошуку вільного часу'}), 500
+    finally:
+        conn.close()
+
 @app.route('/projects/<int:project_id>/calendar', methods=['POST'])
 @token_required
 def create_calendar_event(current_user, project_id):
@@ -758,6 +3937,25 @@ def create_calendar_event(current_user, project_id):
     if not all(k in data for k in ['title', 'event_type', 'start_time', 'end_time']):
         return jsonify({'message': 'Відсутні обов\'язкові поля'}), 400
     
+    try:
+        start_time = normalize_datetime(data['start_time'])
+        end_time = normalize_datetime(data['end_time'])
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Невірний формат дати'}), 400
+    
+    if end_time < start_time:
+        return jsonify({'message': 'Подія не може закінчуватися раніше, ніж починається'}), 400
+    
+    rule = recurrence = series_end = None
+    if data.get('recurrence'):
+        try:
+            rule = parse_recurrence(data['recurrence'])
+        except (AttributeError, ValueError):
+            return jsonify({'message': 'Невірне правило повторення'}), 400
+        recurrence = format_recurrence(rule)
+        series_end = recurrence_end(datetime.fromisoformat(start_time), datetime.fromisoformat(end_time), rule)
+        series_end = series_end.strftime('%Y-%m-%d %H:%M:%S') if series_end else None
+    
     try:
         conn = get_db()
         c = conn.cursor()
@@ -771,21 +3969,30 @@ def create_calendar_event(current_user, project_id):
         if not c.fetchone() and current_user['role'] != 'admin':
             return jsonify({'message': 'У вас немає доступу до цього проєкту'}), 403
         
+        # Перевіряємо зайнятість учасників до вставки, щоб подія не конфліктувала сама з собою
+        start, end = datetime.fromisoformat(start_time), datetime.fromisoformat(end_time)
+        occurrences = [(start, end)]
+        if rule:
+            occurrences = expand_recurrence(start, end, rule, start, start + timedelta(days=CONFLICT_CHECK_DAYS))
+        conflicts = find_calendar_conflicts(c, project_id, occurrences)
+        
         # Створюємо подію
         c.execute("""
             INSERT INTO calendar_events (
                 project_id, title, description, event_type,
-                start_time, end_time, created_by
+                start_time, end_time, created_by, recurrence, recurrence_end
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             project_id,
             data['title'],
             data.get('description', ''),
             data['event_type'],
-            data['start_time'],
-            data['end_time'],
-            current_user['id']
+            start_time,
+            end_time,
+            current_user['id'],
+            recurrence,
+            series_end
         ))
         
         event_id = c.lastrowid
@@ -796,13 +4003,12 @@ def create_calendar_event(current_user, project_id):
             WHERE project_id = ? AND user_id != ?
         """, (project_id, current_user['id']))
         
-        for member in c.fetchall():
-            create_notification(
-                member['user_id'],
-                project_id,
-                'new_event',
-                f"Додано нову подію до календаря: {data['title']}"
-            )
+        notify_users(
+            [member['user_id'] for member in c.fetchall()],
+            project_id,
+            'new_event',
+            f"Додано нову подію до календаря: {data['title']}"
+        )
         
         # Логуємо дію
         log_activity(
@@ -812,10 +4018,13 @@ def create_calendar_event(current_user, project_id):
             f"Створено подію календаря: {data['title']}"
         )
         
+        record_change(c, 'calendar_event', event_id, project_id, 'insert', fetch_event(c, event_id))
+        
         conn.commit()
         return jsonify({
             'message': 'Подію успішно додано',
-            'event_id': event_id
+            'event_id': event_id,
+            'conflicts': conflicts
         }), 201
         
     except Exception as e:
@@ -824,6 +4033,321 @@ def create_calendar_event(current_user, project_id):
     finally:
         conn.close()
 
+# Експорт календаря у форматі iCalendar (RFC 5545)
+ics_cache = MemoryCacheBackend(256)
+
+def ics_escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+def ics_line(line):
+    # Рядки довші за 75 октетів переносяться з пробілом на початку продовження
+    data = line.encode('utf-8')
+    chunks = []
+    while len(data) > 75:
+        cut = 75 if not chunks else 74
+        while cut and (data[cut] & 0xC0) == 0x80:
+            cut -= 1  # не розриваємо багатобайтовий символ UTF-8
+        chunks.append(data[:cut])
+        data = data[cut:]
+    chunks.append(data)
+    return b'\r\n '.join(chunks) + b'\r\n'
+
+def ics_datetime(value):
+    return datetime.fromisoformat(str(value)).strftime('%Y%m%dT%H%M%S')
+
+def ics_event(row, stamp):
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:event-{row['id']}@project-management",
+        f'DTSTAMP:{stamp}',
+        f"DTSTART:{ics_datetime(row['start_time'])}",
+        f"DTEND:{ics_datetime(row['end_time'])}",
+        f"SUMMARY:{ics_escape(row['title'])}",
+        f"DESCRIPTION:{ics_escape(row['description'])}",
+        f"CATEGORIES:{ics_escape(row['event_type'])},{ics_escape(row['project_name'])}"
+    ]
+    if row['recurrence']:
+        # Серія експортується правилом RRULE, а не розгорнутими повтореннями
+        try:
+            rule = parse_recurrence(row['recurrence'])
+        except ValueError:
+            rule = None
+        if rule:
+            rrule = [f'FREQ={rule.freq}', f'INTERVAL={rule.interval}']
+            if rule.byday:
+                rrule.append('BYDAY=' + ','.join(RECURRENCE_WEEKDAYS[day] for day in rule.byday))
+            if rule.count and rule.until:
+                # RFC 5545 не дозволяє UNTIL разом з COUNT - лишаємо межу, що настає раніше
+                duration = datetime.fromisoformat(row['end_time']) - datetime.fromisoformat(row['start_time'])
+                rrule.append(f"UNTIL={ics_datetime(datetime.fromisoformat(row['recurrence_end']) - duration)}")
+            elif rule.count:
+                rrule.append(f'COUNT={rule.count}')
+            elif rule.until:
+                rrule.append(f'UNTIL={ics_datetime(rule.until)}')
+            lines.append('RRULE:' + ';'.join(rrule))
+            start_time = datetime.fromisoformat(row['start_time']).time()
+            for day in sorted(rule.exdates):
+                lines.append(f'EXDATE:{ics_datetime(datetime.combine(day, start_time))}')
+    lines.append('END:VEVENT')
+    return b''.join(ics_line(line) for line in lines)
+
+def ics_etag(c, kind, owner_id, project_ids, name, since):
+    # Кількість і найбільший id описують додані події; назва календаря та проєктів (CATEGORIES)
+    # і будь-які зміни подій, записані в change_log, теж змінюють ETag
+    placeholders = ', '.join('?' * len(project_ids)) or 'NULL'
+    c.execute(f"""
+        SELECT COUNT(*), MAX(id),
+               (SELECT MAX(id) FROM change_log
+                WHERE project_id IN ({placeholders}) AND entity_type IN ('calendar_event', 'project')),
+               (SELECT group_concat(name, '|') FROM (SELECT name FROM projects WHERE id IN ({placeholders}) ORDER BY id))
+        FROM calendar_events
+        WHERE project_id IN ({placeholders})
+    """, (*project_ids, *project_ids, *project_ids))
+    parts = [kind, owner_id, *c.fetchone(), name, since[:10]]
+    return f"{kind}-{owner_id}-" + hashlib.sha1('\x1f'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+def ics_response(etag, name, query, params):
+    # 304 за збігом ETag; інакше готовий фід з кешу або потокова генерація з курсора
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    cached = ics_cache.get(etag)
+    if cached is None:
+        def generate():
+            chunks = []
+            conn = get_db()
+            try:
+                stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+                header = b''.join(ics_line(line) for line in [
+                    'BEGIN:VCALENDAR',
+                    'VERSION:2.0',
+                    'PRODID:-//Project Management//Calendar//UK',
+                    'CALSCALE:GREGORIAN',
+                    f'X-WR-CALNAME:{ics_escape(name)}'
+                ])
+                chunks.append(header)
+                yield header
+                for row in conn.execute(query, params):
+                    chunk = ics_event(row, stamp)
+                    chunks.append(chunk)
+                    yield chunk
+                footer = ics_line('END:VCALENDAR')
+                chunks.append(footer)
+                yield footer
+                ics_cache.set(etag, b''.join(chunks), [], ICS_CACHE_TTL)
+            finally:
+                conn.close()
+        body = generate()
+    else:
+        body = cached
+    
+    response = app.response_class(body, mimetype='text/calendar')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={ICS_CACHE_TTL}'
+    response.headers['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    return response
+
+def feed_token_user(c, token, scope, target_id):
+    # Власник активного токена підписки саме на цей календар; права власника перевіряє маршрут
+    c.execute("""
+        SELECT id, user_id FROM calendar_feed_tokens
+        WHERE token_hash = ? AND scope = ? AND target_id = ? AND revoked_at IS NULL
+    """, (hashlib.sha256(token.encode('utf-8')).hexdigest(), scope, target_id))
+    row = c.fetchone()
+    if not row:
+        return None
+    c.execute("""
+        UPDATE calendar_feed_tokens SET last_used_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND (last_used_at IS NULL OR last_used_at < datetime('now', '-1 hour'))
+    """, (row['id'],))
+    return get_user_by_id(row['user_id'])
+
+def calendar_feed_auth(scope):
+    # Зовнішні календарі не вміють передавати заголовки, тому фід приймає ?token= -
+    # але лише окремий токен підписки на цей календар, а не JWT сесії
+    def decorator(f):
+        with_session = token_required(f)
+
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            token = request.args.get('token')
+            if token is None:
+                return with_session(*args, **kwargs)
+            with trace_span('auth.feed_token'):
+                conn = get_db()
+                try:
+                    current_user = feed_token_user(conn.cursor(), token, scope, kwargs[f'{scope}_id'])
+                finally:
+                    conn.close()
+            if not current_user:
+                return jsonify({'message': 'Invalid token'}), 401
+            return f(current_user, *args, **kwargs)
+        return decorated
+    return decorator
+
+ICS_EVENTS_QUERY = """
+    SELECT e.*, p.name as project_name
+    FROM calendar_events e
+    JOIN projects p ON p.id = e.project_id AND p.deleted_at IS NULL
+    WHERE e.project_id IN ({projects})
+      AND (e.end_time >= ? OR e.recurrence IS NOT NULL AND (e.recurrence_end IS NULL OR e.recurrence_end >= ?))
+    ORDER BY e.start_time
+"""
+
+@app.route('/projects/<int:project_id>/calendar.ics', methods=['GET'])
+@calendar_feed_auth('project')
+def get_project_calendar_ics(current_user, project_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        c.execute("""
+            SELECT 1 FROM project_members
+            WHERE project_id = ? AND user_id = ?
+        """, (project_id, current_user['id']))
+        if not c.fetchone() and current_user['role'] != 'admin':
+            return jsonify({'message': 'У вас немає доступу до цього проєкту'}), 403
+        
+        project = fetch_project(c, project_id)
+        if not project:
+            return jsonify({'message': 'Проєкт не знайдено'}), 404
+        
+        since = (datetime.now() - timedelta(days=ICS_HISTORY_DAYS)).strftime('%Y-%m-%d 00:00:00')
+        etag = ics_etag(c, 'project', project_id, [project_id], project['name'], since)
+        
+        return ics_response(etag, project['name'], ICS_EVENTS_QUERY.format(projects='?'), (project_id, since, since))
+    except Exception as e:
+        logger.error(f"Помилка експорту календаря: {str(e)}")
+        return jsonify({'message': 'Помилка експорту календаря'}), 500
+    finally:
+        conn.close()
+
+@app.route('/users/<int:user_id>/calendar.ics', methods=['GET'])
+@calendar_feed_auth('user')
+def get_user_calendar_ics(current_user, user_id):
+    if current_user['id'] != user_id and current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        user = get_user_by_id(user_id)
+        if not user:
+            return jsonify({'message': 'Користувача не знайдено'}), 404
+        
+        c.execute("""
+            SELECT pm.project_id FROM project_members pm
+            JOIN projects p ON p.id = pm.project_id AND p.deleted_at IS NULL
+            WHERE pm.user_id = ?
+            ORDER BY pm.project_id
+        """, (user_id,))
+        project_ids = [row['project_id'] for row in c.fetchall()]
+        
+        since = (datetime.now() - timedelta(days=ICS_HISTORY_DAYS)).strftime('%Y-%m-%d 00:00:00')
+        etag = ics_etag(c, 'user', user_id, project_ids, user['name'], since)
+        
+        query = ICS_EVENTS_QUERY.format(projects=', '.join('?' * len(project_ids)) or 'NULL')
+        return ics_response(etag, user['name'], query, (*project_ids, since, since))
+    except Exception as e:
+        logger.error(f"Помилка експорту календаря: {str(e)}")
+        return jsonify({'message': 'Помилка експорту календаря'}), 500
+    finally:
+        conn.close()
+
+def create_feed_token(c, current_user, scope, target_id):
+    token = secrets.token_urlsafe(32)
+    c.execute("""
+        INSERT INTO calendar_feed_tokens (user_id, scope, target_id, token_hash)
+        VALUES (?, ?, ?, ?)
+    """, (current_user['id'], scope, target_id, hashlib.sha256(token.encode('utf-8')).hexdigest()))
+    # Сам токен повертається лише один раз, у базі зберігається тільки його хеш
+    return {'id': c.lastrowid, 'scope': scope, 'target_id': target_id, 'token': token,
+            'path': f'/{scope}s/{target_id}/calendar.ics?token={token}'}
+
+@app.route('/projects/<int:project_id>/calendar/feed-tokens', methods=['POST'])
+@token_required
+def create_project_feed_token(current_user, project_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        c.execute("""
+            SELECT 1 FROM project_members
+            WHERE project_id = ? AND user_id = ?
+        """, (project_id, current_user['id']))
+        if not c.fetchone() and current_user['role'] != 'admin':
+            return jsonify({'message': 'У вас немає доступу до цього проєкту'}), 403
+        
+        result = create_feed_token(c, current_user, 'project', project_id)
+        conn.commit()
+        return jsonify(result), 201
+    except Exception as e:
+        logger.error(f"Помилка створення токена підписки: {str(e)}")
+        return jsonify({'message': 'Помилка створення токена підписки'}), 500
+    finally:
+        conn.close()
+
+@app.route('/users/<int:user_id>/calendar/feed-tokens', methods=['POST'])
+@token_required
+def create_user_feed_token(current_user, user_id):
+    if current_user['id'] != user_id:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        result = create_feed_token(c, current_user, 'user', user_id)
+        conn.commit()
+        return jsonify(result), 201
+    except Exception as e:
+        logger.error(f"Помилка створення токена підписки: {str(e)}")
+        return jsonify({'message': 'Помилка створення токена підписки'}), 500
+    finally:
+        conn.close()
+
+@app.route('/calendar/feed-tokens', methods=['GET'])
+@token_required
+def get_feed_tokens(current_user):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, scope, target_id, created_at, last_used_at
+            FROM calendar_feed_tokens
+            WHERE user_id = ? AND revoked_at IS NULL
+            ORDER BY id
+        """, (current_user['id'],))
+        return jsonify([dict(row) for row in c.fetchall()])
+    except Exception as e:
+        logger.error(f"Помилка отримання токенів підписки: {str(e)}")
+        return jsonify({'message': 'Помилка отримання токенів підписки'}), 500
+    finally:
+        conn.close()
+
+@app.route('/calendar/feed-tokens/<int:token_id>', methods=['DELETE'])
+@token_required
+def revoke_feed_token(current_user, token_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE calendar_feed_tokens SET revoked_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND revoked_at IS NULL AND (user_id = ? OR ? = 'admin')
+        """, (token_id, current_user['id'], current_user['role']))
+        if c.rowcount == 0:
+            return jsonify({'message': 'Токен не знайдено'}), 404
+        conn.commit()
+        return jsonify({'message': 'Токен відкликано'})
+    except Exception as e:
+        logger.error(f"Помилка відкликання токена підписки: {str(e)}")
+        return jsonify({'message': 'Помилка відкликання токена підписки'}), 500
+    finally:
+        conn.close()
+
 @app.route('/projects/<int:project_id>/grades', methods=['GET'])
 @token_required
 def get_grades(current_user, project_id):
@@ -873,6 +4397,7 @@ def get_grades(current_user, project_id):
 
 @app.route('/projects/<int:project_id>/members', methods=['GET'])
 @token_required
+@result_cache.cached('project:{project_id}')
 def get_project_members(current_user, project_id):
     try:
         conn = get_db()
@@ -886,12 +4411,7 @@ def get_project_members(current_user, project_id):
             WHERE pm.project_id = ?
         """, (project_id,))
         
-        members = [{
-            'id': row['id'],
-            'name': row['name'],
-            'email': row['email'],
-            'role': row['role']
-        } for row in c.fetchall()]
+        members = [member_to_dict(row) for row in c.fetchall()]
         
         return jsonify(members)
     
@@ -916,14 +4436,7 @@ def get_project_files(current_user, project_id):
             ORDER BY f.upload_date DESC
         """, (project_id,))
         
-        files = [{
-            'id': row['id'],
-            'filename': row['filename'],
-            'file_size': row['file_size'],
-            'file_type': row['file_type'],
-            'upload_date': row['upload_date'],
-            'user_name': row['user_name']
-        } for row in c.fetchall()]
+        files = [file_to_dict(row) for row in c.fetchall()]
         
         return jsonify(files)
     
@@ -937,23 +4450,27 @@ def get_project_files(current_user, project_id):
 
 @app.route('/users', methods=['GET'])
 @token_required
+@result_cache.cached('users')
 def get_users(current_user):
     if current_user['role'] != 'admin':
         return jsonify({'message': 'Unauthorized'}), 403
     
+    role = request.args.get('role')
+    
     try:
         conn = get_db()
         c = conn.cursor()
         
         c.execute("""
             SELECT u.id, u.name, u.email, u.role, u.created_at,
-                   COUNT(DISTINCT pm.project_id) as projects_count,
-                   AVG(g.grade) as average_grade
+                   COALESCE(s.projects_count, 0) as projects_count,
+                   COALESCE(s.total_tasks, 0) as total_tasks,
+                   COALESCE(s.completed_tasks, 0) as completed_tasks,
+                   s.ratings_sum / NULLIF(s.ratings_count, 0) as average_rating
             FROM users u
-            LEFT JOIN project_members pm ON u.id = pm.user_id
-            LEFT JOIN grades g ON u.id = g.student_id
-            GROUP BY u.id
-        """)
+            LEFT JOIN user_stats s ON s.user_id = u.id
+            WHERE (? IS NULL OR u.role = ?) AND u.deleted_at IS NULL
+        """, (role, role))
         
         users = [{
             'id': row['id'],
@@ -962,7 +4479,9 @@ def get_users(current_user):
             'role': row['role'],
             'created_at': row['created_at'],
             'projects_count': row['projects_count'],
-            'average_grade': float(row['average_grade']) if row['average_grade'] else None
+            'total_tasks': row['total_tasks'],
+            'completed_tasks': row['completed_tasks'],
+            'average_rating': row['average_rating']
         } for row in c.fetchall()]
         
         return jsonify(users)
@@ -987,6 +4506,7 @@ def get_notifications(current_user):
             LEFT JOIN projects p ON n.project_id = p.id
             WHERE n.user_id = ? 
             AND (n.expiry_date IS NULL OR n.expiry_date > datetime('now'))
+            AND p.deleted_at IS NULL
             ORDER BY n.created_at DESC
             LIMIT 50
         """, (current_user['id'],))
@@ -999,7 +4519,8 @@ def get_notifications(current_user):
             'project_name': row['project_name'],
             'created_at': row['created_at'],
             'is_read': bool(row['is_read']),
-            'priority': row['priority']
+            'priority': row['priority'],
+            'count': row['count']
         } for row in c.fetchall()]
         
         return jsonify(notifications)
@@ -1050,6 +4571,7 @@ def get_unread_notifications_count(current_user):
             FROM notifications
             WHERE user_id = ? AND is_read = 0
             AND (expiry_date IS NULL OR expiry_date > datetime('now'))
+            AND (project_id IS NULL OR project_id NOT IN (SELECT id FROM projects WHERE deleted_at IS NOT NULL))
         """, (current_user['id'],))
         
         result = c.fetchone()
@@ -1068,25 +4590,9 @@ def get_tasks(current_user, project_id):
         conn = get_db()
         c = conn.cursor()
         
-        c.execute("""
-            SELECT t.*, u.name as assigned_user_name
-            FROM tasks t
-            LEFT JOIN users u ON t.assigned_to = u.id
-            WHERE t.project_id = ?
-            ORDER BY t.created_at DESC
-        """, (project_id,))
+        run_query(c, 'project_tasks', (project_id,))
         
-        tasks = [{
-            'id': row['id'],
-            'title': row['title'],
-            'description': row['description'],
-            'status': row['status'],
-            'priority': row['priority'],
-            'created_at': row['created_at'],
-            'deadline': row['deadline'],
-            'assigned_to': row['assigned_to'],
-            'assigned_user_name': row['assigned_user_name']
-        } for row in c.fetchall()]
+        tasks = [task_to_dict(row) for row in c.fetchall()]
         
         return jsonify(tasks)
     
@@ -1150,13 +4656,12 @@ def create_task(current_user, project_id):
                 WHERE project_id = ? AND role = 'specialist'
             """, (project_id,))
             
-            for member in c.fetchall():
-                create_notification(
-                    member['user_id'],
-                    project_id,
-                    'new_task',
-                    f"Додано нове завдання до проєкту: {data['title']}"
-                )
+            notify_users(
+                [member['user_id'] for member in c.fetchall()],
+                project_id,
+                'new_task',
+                f"Додано нове завдання до проєкту: {data['title']}"
+            )
         
         # Логуємо створення завдання
         log_activity(
@@ -1166,6 +4671,9 @@ def create_task(current_user, project_id):
             f"Створено завдання: {data['title']}"
         )
         
+        record_change(c, 'task', task_id, project_id, 'insert', fetch_task(c, task_id),
+                      tags=[f'project:{project_id}', 'users', f"user:{data.get('assigned_to')}"])
+        
         conn.commit()
         return jsonify({
             'message': 'Завдання успішно створено',
@@ -1181,6 +4689,7 @@ def create_task(current_user, project_id):
 
 @app.route('/projects/<int:project_id>/ratings', methods=['GET'])
 @token_required
+@result_cache.cached('project:{project_id}', scope='user')
 def get_ratings(current_user, project_id):
     try:
         conn = get_db()
@@ -1263,6 +4772,8 @@ def add_rating(current_user, project_id):
             current_user['id'],
             datetime.now(timezone.utc)
         ))
+        record_change(c, 'rating', c.lastrowid, project_id, 'insert',
+                      tags=[f'project:{project_id}', 'users', f"user:{data['specialist_id']}"])
         
         conn.commit()
         return jsonify({'message': 'Оцінку успішно додано'})
@@ -1285,12 +4796,7 @@ def update_task(current_user, project_id, task_id):
         c = conn.cursor()
         
         # Перевіряємо існування завдання
-        c.execute("""
-            SELECT t.*, p.manager_id
-            FROM tasks t
-            JOIN projects p ON t.project_id = p.id
-            WHERE t.id = ? AND t.project_id = ?
-        """, (task_id, project_id))
+        run_query(c, 'task_for_update', (task_id, project_id))
         
         task = c.fetchone()
         if not task:
@@ -1301,37 +4807,14 @@ def update_task(current_user, project_id, task_id):
             return jsonify({'message': 'Недостатньо прав для оновлення цього завдання'}), 403
         
         # Оновлюємо завдання
-        update_fields = []
-        params = []
-        
-        if 'title' in data and current_user['role'] == 'manager':
-            update_fields.append('title = ?')
-            params.append(data['title'])
-        
-        if 'description' in data and current_user['role'] == 'manager':
-            update_fields.append('description = ?')
-            params.append(data['description'])
-        
-        if 'status' in data:
-            update_fields.append('status = ?')
-            params.append(data['status'])
-        
-        if 'assigned_to' in data and current_user['role'] == 'manager':
-            update_fields.append('assigned_to = ?')
-            params.append(data['assigned_to'])
-        
-        if 'priority' in data and current_user['role'] == 'manager':
-            update_fields.append('priority = ?')
-            params.append(data['priority'])
+        fields = ['status']
+        if current_user['role'] == 'manager':
+            fields += ['title', 'description', 'assigned_to', 'priority', 'deadline']
+        update_fields = [field for field in fields if field in data]
         
         if update_fields:
-            params.extend([task_id, project_id])
-            query = f"""
-                UPDATE tasks
-                SET {', '.join(update_fields)}
-                WHERE id = ? AND project_id = ?
-            """
-            c.execute(query, params)
+            run_query(c, 'task_update', update_params('task_update', data, update_fields,
+                                                      id=task_id, project_id=project_id))
             
             # Створюємо сповіщення про оновлення
             create_notification(
@@ -1348,6 +4831,11 @@ def update_task(current_user, project_id, task_id):
                 'task_updated',
                 f"Оновлено завдання: {task['title']}"
             )
+            
+            record_change(c, 'task', task_id, project_id, 'update', fetch_task(c, task_id), tags=[
+                f'project:{project_id}', 'users',
+                f"user:{task['assigned_to']}", f"user:{data.get('assigned_to')}"
+            ])
         
         conn.commit()
         return jsonify({'message': 'Завдання успішно оновлено'})
@@ -1391,10 +4879,13 @@ def upload_file(current_user, project_id):
         # Зберігаємо файл
         filename = secure_filename(file.filename)
         file_path = os.path.join(project_dir, filename)
-        file.save(file_path)
+        with trace_span('file.write', {'file.path': file_path}) as span:
+            file.save(file_path)
+            file_size = os.path.getsize(file_path)
+            if span is not None:
+                span['attributes']['file.size'] = file_size
         
         # Зберігаємо інформацію про файл в базі даних
-        file_size = os.path.getsize(file_path)
         file_type = os.path.splitext(filename)[1]
         
         c.execute("""
@@ -1407,6 +4898,7 @@ def upload_file(current_user, project_id):
             project_id, current_user['id'], filename,
             file_size, file_type, file_path
         ))
+        file_id = c.lastrowid
         
         # Створюємо сповіщення про новий файл
         c.execute("""
@@ -1414,13 +4906,12 @@ def upload_file(current_user, project_id):
             WHERE project_id = ? AND user_id != ?
         """, (project_id, current_user['id']))
         
-        for member in c.fetchall():
-            create_notification(
-                member['user_id'],
-                project_id,
-                'new_file',
-                f"New file uploaded: {filename}"
-            )
+        notify_users(
+            [member['user_id'] for member in c.fetchall()],
+            project_id,
+            'new_file',
+            f"New file uploaded: {filename}"
+        )
         
         # Логуємо завантаження файлу
         log_activity(
@@ -1430,6 +4921,8 @@ def upload_file(current_user, project_id):
             f"Uploaded file: {filename}"
         )
         
+        record_change(c, 'file', file_id, project_id, 'insert', fetch_file(c, file_id))
+        
         conn.commit()
         return jsonify({'message': 'File uploaded successfully'})
     
@@ -1447,16 +4940,22 @@ def download_file(current_user, file_id):
         c = conn.cursor()
         
         # Отримуємо інформацію про файл
-        c.execute("""
+        query = """
             SELECT f.*, p.id as project_id
             FROM files f
-            JOIN projects p ON f.project_id = p.id
+            JOIN projects p ON f.project_id = p.id AND p.deleted_at IS NULL
             WHERE f.id = ?
-        """, (file_id,))
+        """
+        c.execute(query, (file_id,))
         
         file_info = c.fetchone()
         if not file_info:
-            return jsonify({'message': 'File not found'}), 404
+            # Метадані файлів архівних проєктів лежать в архівній БД
+            use_project_archive(conn)
+            c.execute(query, (file_id,))
+            file_info = c.fetchone()
+            if not file_info:
+                return jsonify({'message': 'File not found'}), 404
         
         # Перевіряємо права доступу
         if current_user['role'] != 'admin':
@@ -1476,11 +4975,13 @@ def download_file(current_user, file_id):
             f"Downloaded file: {file_info['filename']}"
         )
         
-        return send_file(
-            file_info['file_path'],
-            as_attachment=True,
-            download_name=file_info['filename']
-        )
+        # Сам вміст передається потоком уже після завершення маршруту
+        with trace_span('file.open', {'file.path': file_info['file_path']}):
+            return send_file(
+                file_info['file_path'],
+                as_attachment=True,
+                download_name=file_info['filename']
+            )
     
     except Exception as e:
         logger.error(f"Error downloading file: {str(e)}")
@@ -1490,6 +4991,7 @@ def download_file(current_user, file_id):
 
 @app.route('/projects/<int:project_id>/statistics', methods=['GET'])
 @token_required
+@result_cache.cached('project:{project_id}')
 def get_project_statistics(current_user, project_id):
     try:
         conn = get_db()
@@ -1514,22 +5016,50 @@ def get_project_statistics(current_user, project_id):
         if not project_stats:
             return jsonify({'message': 'Проєкт не знайдено'}), 404
         
-        # Прогрес за останній місяць
+        # Прогрес за період зі щоденних знімків (за замовчуванням останній місяць)
+        try:
+            date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+                if 'to' in request.args else datetime.now(timezone.utc).date()
+            date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+                if 'from' in request.args else date_to - timedelta(days=PROGRESS_HISTORY_DAYS)
+        except ValueError:
+            return jsonify({'message': 'Невірний формат дати, очікується YYYY-MM-DD'}), 400
+
         c.execute("""
-            SELECT DATE(created_at) as date,
-                   COUNT(CASE WHEN status = 'completed' THEN 1 END) * 100.0 / COUNT(*) as completion_rate
-            FROM tasks
-            WHERE project_id = ?
-            AND created_at >= date('now', '-30 days')
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """, (project_id,))
-        
-        progress_history = [{
-            'date': row['date'],
-            'completion_rate': row['completion_rate']
-        } for row in c.fetchall()]
-        
+            SELECT snapshot_date, not_started, in_progress, completed
+            FROM project_progress_snapshots
+            WHERE project_id = ? AND snapshot_date BETWEEN ? AND ?
+            ORDER BY snapshot_date
+        """, (project_id, date_from.isoformat(), date_to.isoformat()))
+
+        points = {row['snapshot_date']: dict(row) for row in c.fetchall()}
+
+        # Поточний день рахуємо наживо, бо нічний знімок ще не зроблено
+        today = datetime.now(timezone.utc).date()
+        if date_from <= today <= date_to:
+            c.execute("""
+                SELECT status, COUNT(*) as count
+                FROM tasks
+                WHERE project_id = ?
+                GROUP BY status
+            """, (project_id,))
+            live = {'snapshot_date': today.isoformat(), 'not_started': 0, 'in_progress': 0, 'completed': 0}
+            live.update({row['status']: row['count'] for row in c.fetchall()})
+            points[today.isoformat()] = live
+
+        progress_history = []
+        for date in sorted(points):
+            point = points[date]
+            total = point['not_started'] + point['in_progress'] + point['completed']
+            progress_history.append({
+                'date': date,
+                'not_started': point['not_started'],
+                'in_progress': point['in_progress'],
+                'completed': point['completed'],
+                'total': total,
+                'completion_rate': point['completed'] * 100.0 / total if total else None
+            })
+
         # Статистика по учасниках
         c.execute("""
             SELECT u.name,
@@ -1570,22 +5100,51 @@ def get_project_statistics(current_user, project_id):
     finally:
         conn.close()
 
-@app.route('/projects/<int:project_id>/activity', methods=['GET'])
+@app.route('/projects/<int:project_id>/statistics/snapshot', methods=['POST'])
 @token_required
-def get_project_activity(current_user, project_id):
+def create_progress_snapshot(current_user, project_id):
+    if current_user['role'] not in ['manager', 'admin']:
+        return jsonify({'message': 'Недостатньо прав'}), 403
+
     try:
         conn = get_db()
         c = conn.cursor()
-        
-        # Отримуємо останні дії в проекті
-        c.execute("""
-            SELECT ua.*, u.name as user_name
-            FROM user_activity ua
+
+        run_query(c, 'project_manager', (project_id,))
+        project = c.fetchone()
+        if not project:
+            return jsonify({'message': 'Проєкт не знайдено'}), 404
+
+        if current_user['role'] == 'manager' and project['manager_id'] != current_user['id']:
+            return jsonify({'message': 'Недостатньо прав'}), 403
+
+        take_progress_snapshots(c, project_id=project_id)
+        record_change(c, 'snapshot', project_id, project_id, tags=[f'project:{project_id}'])
+        conn.commit()
+        return jsonify({'message': 'Знімок прогресу збережено'}), 201
+
+    except Exception as e:
+        logger.error(f"Помилка створення знімка прогресу: {str(e)}")
+        return jsonify({'message': 'Помилка створення знімка прогресу'}), 500
+    finally:
+        conn.close()
+
+@app.route('/projects/<int:project_id>/activity', methods=['GET'])
+@token_required
+def get_project_activity(current_user, project_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Отримуємо останні дії в проекті
+        rows = query_activity(c, """
+            SELECT ua.*, u.name as user_name
+            FROM {table} ua
             JOIN users u ON ua.user_id = u.id
             WHERE ua.project_id = ?
             ORDER BY ua.timestamp DESC
-            LIMIT 50
-        """, (project_id,))
+            LIMIT ?
+        """, (project_id,), 50)
         
         activities = [{
             'id': row['id'],
@@ -1593,7 +5152,7 @@ def get_project_activity(current_user, project_id):
             'action_type': row['action_type'],
             'action_details': row['action_details'],
             'timestamp': row['timestamp']
-        } for row in c.fetchall()]
+        } for row in rows]
         
         return jsonify(activities)
     
@@ -1603,6 +5162,187 @@ def get_project_activity(current_user, project_id):
     finally:
         conn.close()
 
+def heatmap_args():
+    days = min(int(request.args.get('days', HEATMAP_DAYS)), 366)
+    tz_offset = int(request.args.get('tz', 0))
+    if days < 1 or not -12 <= tz_offset <= 14:
+        raise ValueError('days or tz out of range')
+    return days, tz_offset
+
+def activity_heatmap(c, where, params, days, tz_offset):
+    # Тиждень x година та денні підсумки за типом дії з погодинних підсумків activity_hourly
+    shift = f'{tz_offset:+d} hours'
+    c.execute(f"""
+        SELECT CAST(strftime('%w', datetime(hour, ?)) AS INTEGER),
+               CAST(strftime('%H', datetime(hour, ?)) AS INTEGER),
+               date(datetime(hour, ?)),
+               action_type,
+               count
+        FROM activity_hourly
+        WHERE {where} AND hour >= strftime('%Y-%m-%d %H:00', 'now', ?)
+    """, (shift, shift, shift, *params, f'-{days} days'))
+    rows = c.fetchall()
+    
+    if np is not None and rows:
+        weekday, hour, day, action_type, count = (np.array(column) for column in zip(*rows))
+        # Неділя в SQLite - 0, а тиждень у відповіді починається з понеділка
+        cells = (weekday + 6) % 7 * 24 + hour
+        grid = np.bincount(cells, weights=count, minlength=7 * 24).astype(np.int64).reshape(7, 24)
+        
+        day_keys, day_index = np.unique(day, return_inverse=True)
+        type_keys, type_index = np.unique(action_type, return_inverse=True)
+        per_day = np.bincount(day_index * len(type_keys) + type_index, weights=count,
+                              minlength=len(day_keys) * len(type_keys)).astype(np.int64)
+        per_day = per_day.reshape(len(day_keys), len(type_keys))
+        daily = [
+            {'day': str(key), 'actions': {str(t): int(v) for t, v in zip(type_keys, values) if v}}
+            for key, values in zip(day_keys, per_day)
+        ]
+        return {'weekday_hour': grid.tolist(), 'daily': daily, 'total': int(grid.sum())}
+    
+    grid = [[0] * 24 for _ in range(7)]
+    per_day = defaultdict(lambda: defaultdict(int))
+    for weekday, hour, day, action_type, count in rows:
+        grid[(weekday + 6) % 7][hour] += count
+        per_day[day][action_type] += count
+    daily = [{'day': key, 'actions': dict(per_day[key])} for key in sorted(per_day)]
+    return {'weekday_hour': grid, 'daily': daily, 'total': sum(map(sum, grid))}
+
+@app.route('/projects/<int:project_id>/activity/heatmap', methods=['GET'])
+@token_required
+@result_cache.cached('project:{project_id}')
+def get_project_activity_heatmap(current_user, project_id):
+    try:
+        days, tz_offset = heatmap_args()
+    except ValueError:
+        return jsonify({'message': 'Невірні параметри'}), 400
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        result = activity_heatmap(c, 'project_id = ?', (project_id,), days, tz_offset)
+        result.update({'days': days, 'tz': tz_offset, 'weekdays': HEATMAP_WEEKDAYS})
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Помилка побудови теплової карти: {str(e)}")
+        return jsonify({'message': 'Помилка побудови теплової карти'}), 500
+    finally:
+        conn.close()
+
+@app.route('/users/<int:user_id>/activity/heatmap', methods=['GET'])
+@token_required
+@result_cache.cached('user:{user_id}', scope='user')
+def get_user_activity_heatmap(current_user, user_id):
+    if current_user['id'] != user_id and current_user['role'] not in ['manager', 'admin']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    try:
+        days, tz_offset = heatmap_args()
+    except ValueError:
+        return jsonify({'message': 'Невірні параметри'}), 400
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Погодинні підсумки видаленого проєкту лишаються до завершення фонової черги
+        result = activity_heatmap(
+            c, 'user_id = ? AND project_id NOT IN (SELECT id FROM projects WHERE deleted_at IS NOT NULL)',
+            (user_id,), days, tz_offset)
+        result.update({'days': days, 'tz': tz_offset, 'weekdays': HEATMAP_WEEKDAYS})
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Помилка побудови теплової карти: {str(e)}")
+        return jsonify({'message': 'Помилка побудови теплової карти'}), 500
+    finally:
+        conn.close()
+
+@app.route('/projects/<int:project_id>/activity/daily', methods=['GET'])
+@token_required
+def get_project_activity_daily(current_user, project_id):
+    # Денні підсумки з activity_daily, без читання самих партицій
+    try:
+        days = min(int(request.args.get('days', PROGRESS_HISTORY_DAYS)), 366)
+    except ValueError:
+        return jsonify({'message': 'Невірний параметр days'}), 400
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        c.execute("""
+            SELECT day, action_type, count
+            FROM activity_daily
+            WHERE project_id = ? AND day >= date('now', ?)
+            ORDER BY day
+        """, (project_id, f'-{days} days'))
+        
+        daily = {}
+        for row in c.fetchall():
+            daily.setdefault(row['day'], {})[row['action_type']] = row['count']
+        
+        return jsonify([{'day': day, 'actions': actions} for day, actions in daily.items()])
+    except Exception as e:
+        logger.error(f"Помилка отримання підсумків активності: {str(e)}")
+        return jsonify({'message': 'Помилка отримання підсумків активності'}), 500
+    finally:
+        conn.close()
+
+@app.route('/users/search', methods=['GET'])
+@token_required
+def search_users(current_user):
+    if current_user['role'] not in ['manager', 'admin']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'message': 'Missing search query'}), 400
+    
+    role = request.args.get('role')
+    project_id = request.args.get('project_id', type=int)
+    limit = min(request.args.get('limit', USER_SEARCH_LIMIT, type=int), 50)
+    
+    filters = "(? IS NULL OR u.role = ?) AND (? IS NULL OR u.id IN (SELECT user_id FROM project_members WHERE project_id = ?))" \
+              " AND u.deleted_at IS NULL"
+    filter_params = (role, role, project_id, project_id)
+    prefix = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        if len(q) < 3:
+            # Триграмний індекс не працює для запитів коротших за 3 символи - шукаємо за префіксом
+            c.execute(f"""
+                SELECT u.id, u.name, u.email, u.role, COALESCE(s.projects_count, 0) as projects_count
+                FROM users u
+                LEFT JOIN user_stats s ON s.user_id = u.id
+                WHERE (u.name LIKE ? ESCAPE '\\' OR u.email LIKE ? ESCAPE '\\') AND {filters}
+                ORDER BY u.name COLLATE NOCASE
+                LIMIT ?
+            """, (prefix, prefix, *filter_params, limit))
+        else:
+            # Збіги на початку імені чи email піднімаються вище за решту
+            c.execute(f"""
+                SELECT u.id, u.name, u.email, u.role, COALESCE(s.projects_count, 0) as projects_count
+                FROM users_fts
+                JOIN users u ON u.id = users_fts.rowid
+                LEFT JOIN user_stats s ON s.user_id = u.id
+                WHERE users_fts MATCH ? AND {filters}
+                ORDER BY (u.name LIKE ? ESCAPE '\\' OR u.email LIKE ? ESCAPE '\\') DESC, bm25(users_fts)
+                LIMIT ?
+            """, ('"' + q.replace('"', '""') + '"', *filter_params, prefix, prefix, limit))
+        
+        users = [{**member_to_dict(row), 'projects_count': row['projects_count']} for row in c.fetchall()]
+        return jsonify(users)
+    
+    except Exception as e:
+        logger.error(f"Error searching users: {str(e)}")
+        return jsonify({'message': 'Error searching users'}), 500
+    finally:
+        conn.close()
+
 @app.route('/users/<int:user_id>', methods=['DELETE'])
 @token_required
 def delete_user(current_user, user_id):
@@ -1614,24 +5354,24 @@ def delete_user(current_user, user_id):
         c = conn.cursor()
         
         # Проверяем существование пользователя
-        c.execute("SELECT role FROM users WHERE id = ?", (user_id,))
+        c.execute("SELECT role FROM users WHERE id = ? AND deleted_at IS NULL", (user_id,))
         user = c.fetchone()
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Удаляем связанные данные
-        c.execute("DELETE FROM project_members WHERE user_id = ?", (user_id,))
-        c.execute("DELETE FROM tasks WHERE assigned_to = ?", (user_id,))
-        c.execute("DELETE FROM comments WHERE user_id = ?", (user_id,))
-        c.execute("DELETE FROM grades WHERE student_id = ? OR teacher_id = ?", (user_id, user_id))
-        c.execute("DELETE FROM notifications WHERE user_id = ?", (user_id,))
-        c.execute("DELETE FROM user_activity WHERE user_id = ?", (user_id,))
+        c.execute("SELECT project_id FROM project_members WHERE user_id = ?", (user_id,))
+        project_ids = [row['project_id'] for row in c.fetchall()]
+        
+        # Пользователь не может войти сразу, email освобождается для повторной регистрации;
+        # участие, задачи, комментарии и уведомления удаляет фоновая очередь
+        job_id = tombstone(c, 'user', user_id)
+        c.execute("UPDATE users SET email = 'deleted-' || id || '-' || email WHERE id = ?", (user_id,))
         
-        # Удаляем самого пользователя
-        c.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        record_change(c, 'user', user_id, operation='delete',
+                      tags=['users', f'user:{user_id}', *[f'project:{project_id}' for project_id in project_ids]])
         
         conn.commit()
-        return jsonify({'message': 'User deleted successfully'})
+        return jsonify({'message': 'User deleted successfully', 'purge_job_id': job_id}), 202
         
     except Exception as e:
         logger.error(f"Error deleting user: {str(e)}")
@@ -1641,75 +5381,86 @@ def delete_user(current_user, user_id):
 
 @app.route('/users/<int:user_id>/statistics', methods=['GET'])
 @token_required
+@result_cache.cached('user:{user_id}', scope='user')
 def get_user_statistics(current_user, user_id):
     # Перевіряємо права доступу
-    if current_user['id'] != user_id and current_user['role'] not in ['teacher', 'admin']:
+    if current_user['id'] != user_id and current_user['role'] not in ['manager', 'admin']:
         return jsonify({'message': 'Unauthorized'}), 403
         
     try:
         conn = get_db()
         c = conn.cursor()
         
-        # Загальна статистика
+        # Загальна статистика з попередньо агрегованих показників
         c.execute("""
-            SELECT 
-                COUNT(DISTINCT pm.project_id) as total_projects,
-                COUNT(DISTINCT t.id) as total_tasks,
-                COUNT(DISTINCT CASE WHEN t.status = 'completed' THEN t.id END) as completed_tasks,
-                AVG(g.grade) as average_grade
+            SELECT COALESCE(s.projects_count, 0) as total_projects,
+                   COALESCE(s.total_tasks, 0) as total_tasks,
+                   COALESCE(s.completed_tasks, 0) as completed_tasks,
+                   s.ratings_sum / NULLIF(s.ratings_count, 0) as average_rating
             FROM users u
-            LEFT JOIN project_members pm ON u.id = pm.user_id
-            LEFT JOIN tasks t ON u.id = t.assigned_to
-            LEFT JOIN grades g ON u.id = g.student_id
+            LEFT JOIN user_stats s ON s.user_id = u.id
             WHERE u.id = ?
         """, (user_id,))
         
         stats = c.fetchone()
+        if not stats:
+            return jsonify({'message': 'User not found'}), 404
         
-        # Активні проекти
+        # Активні проекти: завдання та оцінки агрегуються окремо до з'єднання
         c.execute("""
-            SELECT p.name, 
+            SELECT p.name,
                    p.deadline,
-                   COUNT(t.id) as tasks_count,
-                   COUNT(CASE WHEN t.status = 'completed' THEN 1 END) as completed_tasks,
-                   g.grade
+                   COALESCE(t.tasks_count, 0) as tasks_count,
+                   COALESCE(t.completed_tasks, 0) as completed_tasks,
+                   r.rating
             FROM project_members pm
             JOIN projects p ON pm.project_id = p.id
-            LEFT JOIN tasks t ON t.project_id = p.id AND t.assigned_to = pm.user_id
-            LEFT JOIN grades g ON g.project_id = p.id AND g.student_id = pm.user_id
-            WHERE pm.user_id = ? AND p.status = 'active'
-            GROUP BY p.id
-        """, (user_id,))
+            LEFT JOIN (
+                SELECT project_id, COUNT(*) as tasks_count,
+                       COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_tasks
+                FROM tasks
+                WHERE assigned_to = ?
+                GROUP BY project_id
+            ) t ON t.project_id = p.id
+            LEFT JOIN (
+                SELECT project_id, AVG(rating) as rating
+                FROM ratings
+                WHERE specialist_id = ?
+                GROUP BY project_id
+            ) r ON r.project_id = p.id
+            WHERE pm.user_id = ? AND p.status = 'active' AND p.deleted_at IS NULL
+        """, (user_id, user_id, user_id))
         
         active_projects = [{
             'name': row['name'],
             'deadline': row['deadline'],
             'tasks_count': row['tasks_count'],
             'completed_tasks': row['completed_tasks'],
-            'grade': row['grade']
+            'rating': row['rating']
         } for row in c.fetchall()]
         
         # Останні дії
-        c.execute("""
+        rows = query_activity(c, """
             SELECT action_type, action_details, timestamp
-            FROM user_activity
+            FROM {table}
             WHERE user_id = ?
+            AND (project_id IS NULL OR project_id NOT IN (SELECT id FROM projects WHERE deleted_at IS NOT NULL))
             ORDER BY timestamp DESC
-            LIMIT 10
-        """, (user_id,))
+            LIMIT ?
+        """, (user_id,), 10)
         
         recent_activity = [{
             'action_type': row['action_type'],
             'action_details': row['action_details'],
             'timestamp': row['timestamp']
-        } for row in c.fetchall()]
+        } for row in rows]
         
         statistics = {
             'overview': {
                 'total_projects': stats['total_projects'],
                 'total_tasks': stats['total_tasks'],
                 'completed_tasks': stats['completed_tasks'],
-                'average_grade': float(stats['average_grade']) if stats['average_grade'] else None
+                'average_rating': stats['average_rating']
             },
             'active_projects': active_projects,
             'recent_activity': recent_activity
@@ -1723,6 +5474,524 @@ def get_user_statistics(current_user, user_id):
     finally:
         conn.close()
 
+def fts_query(text):
+    # Кожне слово береться в лапки, щоб синтаксис FTS5 у запиті користувача не виконувався;
+    # останнє слово шукається за префіксом
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words[:-1]) + (' ' if len(words) > 1 else '') + f'"{words[-1]}"*'
+
+def highlight_snippet(snippet):
+    # Текст з індексу - довільний ввід користувача: спершу екрануємо його, а потім
+    # замінюємо керівні символи, якими snippet() позначив збіги, на теги <mark>
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+@app.route('/search', methods=['GET'])
+@token_required
+def search(current_user):
+    query = fts_query(request.args.get('q', ''))
+    if not query:
+        return jsonify({'message': 'Missing search query'}), 400
+    
+    types = request.args.get('type', 'task,comment,project,file').split(',')
+    project_id = request.args.get('project_id', type=int)
+    limit = min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    # Фільтр видимості: адміністратор бачить усе, інші - лише проєкти, де вони учасники
+    if current_user['role'] == 'admin':
+        visible = "{column} NOT IN (SELECT id FROM projects WHERE deleted_at IS NOT NULL)"
+        visible_params = []
+    else:
+        visible = ("{column} IN (SELECT project_id FROM project_members WHERE user_id = ?)"
+                   " AND {column} NOT IN (SELECT id FROM projects WHERE deleted_at IS NOT NULL)")
+        visible_params = [current_user['id']]
+    
+    sources = {
+        'task': ("""
+            SELECT 'task' as type, t.id, t.project_id, t.title,
+                   snippet(tasks_fts, -1, char(2), char(3), '…', 12) as snippet,
+                   bm25(tasks_fts) as rank
+            FROM tasks_fts
+            JOIN tasks t ON t.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH ? AND {visible}
+        """, 't.project_id'),
+        'comment': ("""
+            SELECT 'comment' as type, cm.id, cm.project_id, NULL as title,
+                   snippet(comments_fts, 0, char(2), char(3), '…', 12) as snippet,
+                   bm25(comments_fts) as rank
+            FROM comments_fts
+            JOIN comments cm ON cm.id = comments_fts.rowid
+            WHERE comments_fts MATCH ? AND {visible}
+        """, 'cm.project_id'),
+        'project': ("""
+            SELECT 'project' as type, p.id, p.id as project_id, p.name as title,
+                   snippet(projects_fts, -1, char(2), char(3), '…', 12) as snippet,
+                   bm25(projects_fts) as rank
+            FROM projects_fts
+            JOIN projects p ON p.id = projects_fts.rowid
+            WHERE projects_fts MATCH ? AND {visible}
+        """, 'p.id'),
+        'file': ("""
+            SELECT 'file' as type, f.id, f.project_id, f.filename as title,
+                   snippet(files_fts, 0, char(2), char(3), '…', 12) as snippet,
+                   bm25(files_fts) as rank
+            FROM files_fts
+            JOIN files f ON f.id = files_fts.rowid
+            WHERE files_fts MATCH ? AND {visible}
+        """, 'f.project_id')
+    }
+    
+    parts = []
+    params = []
+    for search_type in types:
+        if search_type not in sources:
+            return jsonify({'message': f'Unknown search type: {search_type}'}), 400
+        sql, column = sources[search_type]
+        sql = sql.format(visible=visible.format(column=column))
+        params += [query, *visible_params]
+        if project_id is not None:
+            sql += f" AND {column} = ?"
+            params.append(project_id)
+        parts.append(sql)
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        c.execute(f"""
+            SELECT * FROM ({' UNION ALL '.join(parts)})
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        """, (*params, limit + 1, offset))
+        rows = c.fetchall()
+        
+        results = [{
+            'type': row['type'],
+            'id': row['id'],
+            'project_id': row['project_id'],
+            'title': row['title'],
+            'snippet': highlight_snippet(row['snippet']),
+            'rank': row['rank']
+        } for row in rows[:limit]]
+        
+        return jsonify({'results': results, 'has_more': len(rows) > limit})
+    
+    except Exception as e:
+        logger.error(f"Error searching: {str(e)}")
+        return jsonify({'message': 'Error searching'}), 500
+    finally:
+        conn.close()
+
+@app.route('/changes', methods=['GET'])
+@token_required
+def get_changes(current_user):
+    project_id = request.args.get('project_id', type=int)
+    since = request.args.get('since', type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 1000))
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        if project_id is not None and current_user['role'] != 'admin':
+            c.execute("""
+                SELECT 1 FROM project_members
+                WHERE project_id = ? AND user_id = ?
+            """, (project_id, current_user['id']))
+            if not c.fetchone():
+                return jsonify({'message': 'Not a member of this project'}), 403
+        
+        c.execute("SELECT MIN(id) as min_id, MAX(id) as max_id FROM change_log")
+        bounds = c.fetchone()
+        
+        # Без курсора повертаємо лише поточну позицію: клієнт завантажує повні списки і далі читає зміни
+        if since is None:
+            return jsonify({'changes': [], 'cursor': bounds['max_id'] or 0, 'has_more': False})
+        
+        # Частину журналу вже видалено - клієнт має перезавантажити дані повністю
+        if bounds['min_id'] is not None and since < bounds['min_id'] - 1:
+            return jsonify({'message': 'Cursor expired, full reload required'}), 410
+        
+        params = [since, *FEED_ENTITY_TYPES]
+        query = f"""
+            SELECT id, entity_type, entity_id, project_id, operation, data, created_at
+            FROM change_log
+            WHERE id > ? AND entity_type IN ({', '.join('?' * len(FEED_ENTITY_TYPES))})
+        """
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        elif current_user['role'] != 'admin':
+            query += " AND project_id IN (SELECT project_id FROM project_members WHERE user_id = ?)"
+            params.append(current_user['id'])
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit + 1)
+        
+        c.execute(query, params)
+        rows = c.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        changes = [{
+            'cursor': row['id'],
+            'entity_type': row['entity_type'],
+            'entity_id': row['entity_id'],
+            'project_id': row['project_id'],
+            'operation': row['operation'],
+            'data': json.loads(row['data']) if row['data'] else None,
+            'timestamp': row['created_at']
+        } for row in rows]
+        
+        # Курсор рухається до кінця переглянутого діапазону, навіть якщо змін для користувача немає
+        if has_more:
+            cursor = rows[-1]['id']
+        else:
+            cursor = max(since, bounds['max_id'] or 0, rows[-1]['id'] if rows else 0)
+        return jsonify({'changes': changes, 'cursor': cursor, 'has_more': has_more})
+    
+    except Exception as e:
+        logger.error(f"Error getting changes: {str(e)}")
+        return jsonify({'message': 'Error getting changes'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/cache', methods=['GET'])
+@token_required
+def get_cache_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    return jsonify(result_cache.stats())
+
+@app.route('/admin/cache', methods=['DELETE'])
+@token_required
+def clear_cache(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    result_cache.backend.clear()
+    return jsonify({'message': 'Cache cleared'})
+
+@app.route('/admin/activity/partitions', methods=['GET'])
+@token_required
+def get_activity_partitions(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT * FROM activity_partitions ORDER BY month DESC")
+        partitions = []
+        for row in c.fetchall():
+            rows = None
+            if not row['archived_at']:
+                c.execute(f"SELECT COUNT(*) FROM {row['table_name']}")
+                rows = c.fetchone()[0]
+            partitions.append({
+                'month': row['month'],
+                'table': row['table_name'],
+                'rows': rows,
+                'created_at': row['created_at'],
+                'archived_at': row['archived_at']
+            })
+        return jsonify(partitions)
+    except Exception as e:
+        logger.error(f"Помилка отримання партицій активності: {str(e)}")
+        return jsonify({'message': 'Помилка отримання партицій активності'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/activity/partitions/archive', methods=['POST'])
+@token_required
+def archive_activity(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    try:
+        return jsonify({'archived': archive_activity_partitions()})
+    except Exception as e:
+        logger.error(f"Помилка архівування активності: {str(e)}")
+        return jsonify({'message': 'Помилка архівування активності'}), 500
+
+@app.route('/admin/projects/archive', methods=['GET'])
+@token_required
+def get_archived_projects(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("""
+            SELECT a.*, p.name, p.status
+            FROM archived_projects a
+            JOIN projects p ON p.id = a.project_id
+            ORDER BY a.archived_at DESC
+        """)
+        return jsonify([dict(row) for row in c.fetchall()])
+    except Exception as e:
+        logger.error(f"Помилка отримання архівних проєктів: {str(e)}")
+        return jsonify({'message': 'Помилка отримання архівних проєктів'}), 500
+    finally:
+        conn.close()
+
+@app.route('/projects/<int:project_id>/archive', methods=['POST'])
+@token_required
+def archive_project(current_user, project_id):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT status FROM projects WHERE id = ?", (project_id,))
+        project = c.fetchone()
+        if not project:
+            return jsonify({'message': 'Проєкт не знайдено'}), 404
+        if project['status'] not in PROJECT_ARCHIVE_STATUSES:
+            return jsonify({'message': 'В архів переносяться лише архівні та завершені проєкти'}), 409
+        
+        moved = archive_project_data(project_id)
+        if moved is None:
+            return jsonify({'message': 'Проєкт уже в архіві'}), 409
+        return jsonify({'message': 'Проєкт перенесено в архів', 'rows_moved': moved})
+    except Exception as e:
+        logger.error(f"Помилка архівування проєкту: {str(e)}")
+        return jsonify({'message': 'Помилка архівування проєкту'}), 500
+    finally:
+        conn.close()
+
+@app.route('/projects/<int:project_id>/restore', methods=['POST'])
+@token_required
+def restore_project(current_user, project_id):
+    if current_user['role'] not in ['manager', 'admin']:
+        return jsonify({'message': 'Недостатньо прав'}), 403
+
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        run_query(c, 'project_manager', (project_id,))
+        project = c.fetchone()
+        if not project:
+            return jsonify({'message': 'Проєкт не знайдено'}), 404
+        if current_user['role'] == 'manager' and project['manager_id'] != current_user['id']:
+            return jsonify({'message': 'Недостатньо прав'}), 403
+        
+        moved = restore_project_data(project_id)
+        if moved is None:
+            return jsonify({'message': 'Проєкт не в архіві'}), 409
+        log_activity(current_user['id'], project_id, 'project_restored', f"Відновлено з архіву рядків: {moved}")
+        return jsonify({'message': 'Проєкт відновлено з архіву', 'rows_moved': moved})
+    except Exception as e:
+        logger.error(f"Помилка відновлення проєкту: {str(e)}")
+        return jsonify({'message': 'Помилка відновлення проєкту'}), 500
+    finally:
+        conn.close()
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Без token_required: Prometheus не має користувача; доступ обмежується METRICS_TOKEN,
+    # а якщо його не задано - лише локальними запитами, щоб маршрути й обсяги не були публічними
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'message': 'Unauthorized'}), 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'message': 'Metrics are only available from localhost without METRICS_TOKEN'}), 403
+
+    return request_metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/admin/db/transactions', methods=['GET'])
+@token_required
+def get_transaction_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    return jsonify(transaction_stats.stats())
+
+@app.route('/admin/db/queries', methods=['GET'])
+@token_required
+def get_query_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    sort = request.args.get('sort', 'total_ms')
+    if sort not in ('total_ms', 'mean_ms', 'p95_ms', 'p99_ms', 'max_ms', 'calls', 'rows'):
+        return jsonify({'message': 'Invalid sort'}), 400
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify(query_stats.stats(sort, limit))
+
+@app.route('/admin/db/queries', methods=['DELETE'])
+@token_required
+def reset_query_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    query_stats.reset()
+    return jsonify({'message': 'Query statistics reset'})
+
+@app.route('/admin/db/slow-queries', methods=['GET'])
+@token_required
+def get_slow_queries(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    limit = min(request.args.get('limit', 50, type=int), 1000)
+    return jsonify({
+        'threshold_ms': app.config['SLOW_QUERY_MS'],
+        'queries': slow_query_log.recent(limit, request.args.get('route'))
+    })
+
+@app.route('/admin/traces', methods=['GET'])
+@token_required
+def get_traces(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    request_id = request.args.get('request_id')
+    limit = min(request.args.get('limit', 20, type=int), 200)
+
+    def match(entry):
+        root = entry['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        return any(a['key'] == 'http.request_id' and a['value']['stringValue'] == request_id
+                   for a in root['attributes'])
+
+    return jsonify({
+        'export_min_ms': app.config['TRACE_EXPORT_MIN_MS'],
+        'traces': trace_log.tail(limit, match if request_id else None)
+    })
+
+@app.route('/admin/profiler', methods=['GET'])
+@token_required
+def get_profiler_status(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    return jsonify(request_profiler.status())
+
+@app.route('/admin/profiler', methods=['POST'])
+@token_required
+def start_profiler(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', 'sample')
+    endpoint = data.get('endpoint')
+    try:
+        duration = float(data.get('duration', 30))
+        max_requests = int(data.get('requests', 100))
+        interval = float(data.get('interval_ms', app.config['PROFILER_INTERVAL'] * 1000)) / 1000
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Invalid profiler parameters'}), 400
+    if mode not in ('sample', 'cprofile'):
+        return jsonify({'message': 'Invalid mode'}), 400
+    if endpoint is not None and endpoint not in app.view_functions:
+        return jsonify({'message': 'Unknown endpoint'}), 400
+    if not (0 < duration <= app.config['PROFILER_MAX_SECONDS']
+            and 0 < max_requests <= app.config['PROFILER_MAX_REQUESTS'] and interval >= 0.001):
+        return jsonify({'message': 'Invalid profiler parameters'}), 400
+
+    status = request_profiler.start(mode, endpoint, duration, max_requests, interval)
+    if status is None:
+        return jsonify({'message': 'Profiler is already running'}), 409
+    return jsonify(status), 202
+
+@app.route('/admin/profiler', methods=['DELETE'])
+@token_required
+def stop_profiler(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    request_profiler.stop()
+    return jsonify({'message': 'Profiler stopping'}), 202
+
+@app.route('/admin/profiler/output', methods=['GET'])
+@token_required
+def download_profile(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    last = request_profiler.last
+    if not last or not last['output']:
+        return jsonify({'message': 'No profile available'}), 404
+    return send_file(last['output'], as_attachment=True, download_name=os.path.basename(last['output']))
+
+@app.route('/admin/purge-jobs', methods=['GET'])
+@token_required
+def get_purge_jobs(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    status = request.args.get('status')
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("""
+            SELECT * FROM purge_jobs
+            WHERE ? IS NULL OR status = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (status, status, limit))
+        return jsonify([dict(row) for row in c.fetchall()])
+    except Exception as e:
+        logger.error(f"Помилка отримання черги видалення: {str(e)}")
+        return jsonify({'message': 'Помилка отримання черги видалення'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/purge-jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_purge_job(current_user, job_id):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT * FROM purge_jobs WHERE id = ?", (job_id,))
+        job = c.fetchone()
+        if not job:
+            return jsonify({'message': 'Завдання не знайдено'}), 404
+        
+        result = dict(job)
+        if job['status'] != 'done':
+            # Прогрес за кроками: поточна таблиця серед усіх таблиць, що очищаються
+            names = [step[0] for step in purge_steps(c, job['entity_type'])]
+            result['steps_total'] = len(names)
+            result['steps_done'] = names.index(job['step']) if job['step'] in names else 0
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Помилка отримання завдання видалення: {str(e)}")
+        return jsonify({'message': 'Помилка отримання завдання видалення'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/notifications/sweeper', methods=['GET'])
+@token_required
+def get_notification_sweeper_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    return jsonify(notification_sweeper.stats())
+
+@app.route('/admin/notifications/sweeper', methods=['POST'])
+@token_required
+def run_notification_sweeper(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    report = notification_sweeper.run()
+    if report is None:
+        return jsonify({'message': 'Прибирання вже виконується'}), 409
+    return jsonify(report)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return jsonify({'message': 'Resource not found'}), 404